@@ -2,18 +2,30 @@
 app.py: API Flask + Scheduler para ingestión, merge, entrenamiento y pronóstico dinámico
 - Autenticación básica HTTP desde config.yaml
 - Logging de solicitudes y métricas en app.log
-- Endpoints protegidos: /, /ingest, /merge, /train, /forecast, /forecast/data, /metrics
-- Configuración dinámica de línea y horas para forecast
+- Endpoints protegidos: /, /ingest, /merge, /train, /forecast, /forecast/data, /telemetry, /metrics
+- Configuración dinámica de línea y horas para forecast; `method=direct` usa el modelo directo
+  multi-horizonte (todo el horizonte en una pasada) en lugar del recursivo de 30 s
+- Pronóstico servido en proceso por ForecastService (modelo cargado una vez, recarga en caliente);
+  se crea en el primer pronóstico, así arrancar la API no importa pandas/NumPy
+- Etapas del pipeline lanzadas como subcomandos de src/pipeline.py
+- Scheduler: una corrida del DAG (src/pipeline_dag.py) por turno; cada etapa espera a la anterior
+  y se omite si sus entradas no cambiaron. También a demanda en /pipeline
+- Trabajos asíncronos: ingest/merge/train/forecast devuelven un job id (202) consultable en /jobs/<id>
+- Telemetría en vivo: POST /telemetry recibe muestras del PLC y GET /telemetry/forecast devuelve
+  el pronóstico recalculado en cada bucket de 30 s (src/telemetry.py)
+- Watcher opcional (watch_enabled): micro-batches de los CSV que van llegando y pronóstico
+  refrescado en el mismo proceso; su frescura de punta a punta se publica en /metrics
 """
 import sys
 import os
 import datetime
+import json
 import subprocess
 import logging
+import threading
 from functools import wraps
 from flask import Flask, jsonify, render_template, send_file, request, Response, g
 from apscheduler.schedulers.background import BackgroundScheduler
-import pandas as pd
 from src.config import get_pipeline_config, get_auth_config
 
 # ----------------------------------
@@ -63,24 +75,107 @@ SRC_DIR    = os.path.join(BASE_DIR, 'src')
 DATA_DIR   = os.path.join(BASE_DIR, 'data', 'predictions')
 PYTHON_EXE = sys.executable
 
-CMD_INGEST = [PYTHON_EXE, os.path.join(SRC_DIR, 'ingest.py')]
-CMD_MERGE  = [PYTHON_EXE, os.path.join(SRC_DIR, 'merge_quality_availability.py')]
-CMD_TRAIN  = [PYTHON_EXE, os.path.join(SRC_DIR, 'train.py')]
-# builder for predict
+PIPELINE   = [PYTHON_EXE, os.path.join(SRC_DIR, 'pipeline.py')]
+CMD_INGEST = PIPELINE + ['ingest']
+CMD_MERGE  = PIPELINE + ['merge']
+CMD_TRAIN  = PIPELINE + ['train-lines']
 
-def build_predict_cmd(line, hours):
-    return [PYTHON_EXE, os.path.join(SRC_DIR, 'predict.py'), '--line', line, '--hours', str(hours)]
+# ----------------------------------
+# Servicio de pronóstico en proceso
+# ----------------------------------
+# Los módulos de src/ se importan entre sí como scripts (from config import ...)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'src'))
+from forecast_cache import ForecastCache
+from jobs import JobManager, JobQueueFull
+
+forecast_cache = ForecastCache(
+    max_entries=cfg.get('forecast_cache_entries', 32),
+    max_bytes=cfg.get('forecast_cache_mb', 64) * 1024 * 1024,
+)
+_forecast_service = None
+_forecast_service_lock = threading.Lock()
+
+def get_forecast_service():
+    # model_server importa pandas/NumPy (y el modelo): se crea con el primer pronóstico
+    global _forecast_service
+    with _forecast_service_lock:
+        if _forecast_service is None:
+            from model_server import ForecastService
+            _forecast_service = ForecastService(BASE_DIR, cfg['lags'], cfg['roll_windows'], cache=forecast_cache)
+    return _forecast_service
 
 # ----------------------------------
 # Helper to run scripts
 # ----------------------------------
-def run_script(cmd, name):
+def run_script(cmd, name, env=None):
     try:
         logger.info(f"Running {name}: {' '.join(cmd)}")
-        subprocess.run(cmd, check=True)
+        subprocess.run(cmd, check=True, env=None if env is None else dict(os.environ, **env))
         logger.info(f"{name} completed successfully")
+        return True
     except subprocess.CalledProcessError as e:
         logger.error(f"Error running {name}: {e}")
+        return False
+
+# ----------------------------------
+# Trabajos asíncronos
+# ----------------------------------
+jobs = JobManager(max_workers=cfg.get('job_workers', 2), max_pending=cfg.get('job_max_pending', 16))
+
+def script_job(cmd, name):
+    def run(job):
+        if not run_script(cmd, name):
+            raise RuntimeError(f"{name} terminó con error (ver app.log)")
+        return {'timestamp': str(datetime.datetime.now())}
+    return run
+
+def forecast_job(line, hours, method):
+    def run(job):
+        df, fpath = get_forecast_service().forecast(line, hours, progress=job.set_progress, method=method)
+        return {'line': line, 'hours': hours, 'method': method, 'points': len(df), 'csv': os.path.basename(fpath),
+                'data_url': f'/forecast/data?line={line}&hours={hours}&method={method}'}
+    return run
+
+def forecast_method():
+    # Familia de modelo pedida (recursive/direct); por defecto `forecast_method` de config.yaml
+    from model_registry import KINDS
+    method = request.args.get('method', cfg.get('forecast_method', 'recursive'))
+    if method not in KINDS:
+        return None, (jsonify(error=f"Método no soportado: {method} (usa {', '.join(KINDS)})"), 400)
+    return method, None
+
+# ----------------------------------
+# Pipeline como DAG
+# ----------------------------------
+def dag_stage(argv, env):
+    if not run_script(PIPELINE + list(argv), argv[0], env=env):
+        raise RuntimeError(f"{argv[0]} terminó con error (ver app.log)")
+
+def dag_forecast(line, hours):
+    # En proceso: reutiliza el modelo cargado y deja el resultado en la caché
+    get_forecast_service().forecast_batch([line], hours)
+
+LAST_PIPELINE_RUN = None
+
+def pipeline_job(force=False):
+    def run(job):
+        global LAST_PIPELINE_RUN
+        from pipeline_dag import run_pipeline
+        result = LAST_PIPELINE_RUN = run_pipeline(force=force, runner=dag_stage, forecast=dag_forecast)
+        logger.info("pipeline: " + ', '.join(f"{name}={rec['status']} {rec['seconds']:.1f}s"
+                                             for name, rec in result['tasks'].items()))
+        failed = [name for name, rec in result['tasks'].items() if rec['status'] == 'failed']
+        if failed:
+            raise RuntimeError(f"Tareas con error: {', '.join(failed)} (ver app.log)")
+        return result
+    return run
+
+def submit_job(kind, params, fn):
+    try:
+        job = jobs.submit(kind, params, fn)
+    except JobQueueFull as e:
+        return jsonify(error=str(e)), 429
+    return jsonify(job_id=job.id, status=job.status, status_url=f'/jobs/{job.id}'), 202
 
 # ----------------------------------
 # Request logging
@@ -109,71 +204,200 @@ def index():
 @app.route('/ingest', methods=['GET'])
 @requires_auth
 def ingest():
-    run_script(CMD_INGEST, 'ingest')
-    return jsonify(status='ingest completed', timestamp=str(datetime.datetime.now()))
+    return submit_job('ingest', (), script_job(CMD_INGEST, 'ingest'))
 
 @app.route('/merge', methods=['GET'])
 @requires_auth
 def merge():
-    run_script(CMD_MERGE, 'merge')
-    return jsonify(status='merge completed', timestamp=str(datetime.datetime.now()))
+    return submit_job('merge', (), script_job(CMD_MERGE, 'merge'))
 
 @app.route('/train', methods=['GET'])
 @requires_auth
 def train():
-    run_script(CMD_TRAIN, 'train')
-    return jsonify(status='train completed', timestamp=str(datetime.datetime.now()))
+    return submit_job('train', (), script_job(CMD_TRAIN, 'train'))
+
+@app.route('/pipeline', methods=['GET'])
+@requires_auth
+def pipeline():
+    force = request.args.get('force', '0') in ('1', 'true')
+    return submit_job('pipeline', (), pipeline_job(force))
 
 @app.route('/forecast', methods=['GET'])
 @requires_auth
 def forecast_csv():
     line = request.args.get('line', cfg['line'])
     hours = int(request.args.get('hours', cfg['horizon_hours']))
-    cmd = build_predict_cmd(line, hours)
-    run_script(cmd, 'predict')
-    today = datetime.date.today().isoformat()
-    fname = f'forecast_{line}_{hours}h_{today}.csv'
-    fpath = os.path.join(DATA_DIR, fname)
-    if os.path.exists(fpath):
-        return send_file(fpath, mimetype='text/csv', as_attachment=True)
-    return jsonify(error='file not found', path=fpath), 404
+    method, error = forecast_method()
+    if error:
+        return error
+    try:
+        _, fpath = get_forecast_service().forecast(line, hours, compute=False, method=method)
+    except FileNotFoundError as e:
+        return jsonify(error=str(e)), 404
+    if fpath is None:
+        return submit_job('forecast', (line, hours, method), forecast_job(line, hours, method))
+    return send_file(fpath, mimetype='text/csv', as_attachment=True)
 
 @app.route('/forecast/data', methods=['GET'])
 @requires_auth
 def forecast_data():
+    # Formato (records/columnar/arrow), LTTB a `points` puntos, gzip y revalidación con ETag
+    from forecast_payload import FORMATS, encode, etag, gzip_chunks
     line = request.args.get('line', cfg['line'])
     hours = int(request.args.get('hours', cfg['horizon_hours']))
-    cmd = build_predict_cmd(line, hours)
-    run_script(cmd, 'predict')
-    today = datetime.date.today().isoformat()
-    fname = f'forecast_{line}_{hours}h_{today}.csv'
-    fpath = os.path.join(DATA_DIR, fname)
-    if not os.path.exists(fpath):
-        return jsonify(error='file not found', path=fpath), 404
-    df = pd.read_csv(fpath, parse_dates=['_time'])
-    data = df.to_dict(orient='records')
-    return jsonify(data)
+    fmt = request.args.get('format', 'records')
+    points = request.args.get('points', type=int)
+    if fmt not in FORMATS:
+        return jsonify(error=f"Formato no soportado: {fmt} (usa {', '.join(FORMATS)})"), 400
+    method, error = forecast_method()
+    if error:
+        return error
+    service = get_forecast_service()
+    try:
+        versions = service.versions(line, method)
+    except FileNotFoundError as e:
+        return jsonify(error=str(e)), 404
+
+    # Mismas versiones de modelo y dataset => mismo pronóstico: 304 sin tocar los datos
+    tag = etag(*versions, line, hours, method, fmt, points)
+    if request.if_none_match.contains_weak(tag):
+        return Response(status=304, headers={'ETag': f'W/"{tag}"', 'Cache-Control': 'no-cache'})
+    df = service.cached(line, hours, method, versions)
+    if df is None:
+        return submit_job('forecast', (line, hours, method), forecast_job(line, hours, method))
+
+    chunks = encode(df, fmt, points, meta={'line': line, 'hours': hours, 'method': method, 'total': len(df)})
+    headers = {'Cache-Control': 'no-cache', 'Vary': 'Accept-Encoding'}
+    if 'gzip' in request.accept_encodings:
+        chunks = gzip_chunks(chunks)
+        headers['Content-Encoding'] = 'gzip'
+    response = Response(chunks, mimetype=FORMATS[fmt], headers=headers)
+    response.set_etag(tag, weak=True)
+    return response
+
+@app.route('/telemetry', methods=['POST'])
+@requires_auth
+def telemetry():
+    from telemetry import parse_samples
+    try:
+        samples = parse_samples(request.get_data())
+    except (ValueError, UnicodeDecodeError) as e:
+        return jsonify(error=f"JSON inválido: {e}"), 400
+    return jsonify(get_telemetry().ingest(samples))
+
+@app.route('/telemetry/forecast', methods=['GET'])
+@requires_auth
+def telemetry_forecast():
+    from telemetry import forecast_payload
+    line = request.args.get('line', cfg['line'])
+    hours = request.args.get('hours', type=int)
+    entry = get_telemetry().forecast(line, hours)
+    if entry is None:
+        return jsonify(error=f"Sin pronóstico en vivo para {line}"), 404
+    return jsonify(forecast_payload(entry))
+
+@app.route('/jobs', methods=['GET'])
+@requires_auth
+def jobs_list():
+    return jsonify(jobs.list())
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+@requires_auth
+def job_status(job_id):
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify(error='job not found', job_id=job_id), 404
+    return jsonify(job.to_dict())
+
+@app.route('/jobs/<job_id>/stream', methods=['GET'])
+@requires_auth
+def job_stream(job_id):
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify(error='job not found', job_id=job_id), 404
+
+    # Server-Sent Events: un evento por segundo hasta que el trabajo termina
+    def events():
+        while True:
+            finished = job.done.wait(timeout=1.0)
+            yield f"data: {json.dumps(job.to_dict())}\n\n"
+            if finished:
+                break
+    return Response(events(), mimetype='text/event-stream', headers={'Cache-Control': 'no-cache'})
 
 @app.route('/metrics', methods=['GET'])
 @requires_auth
 def metrics():
     uptime = datetime.datetime.now() - START_TIME
-    return jsonify(uptime_seconds=uptime.total_seconds(), request_count=REQUEST_COUNT, start=START_TIME.isoformat())
+    return jsonify(uptime_seconds=uptime.total_seconds(), request_count=REQUEST_COUNT, start=START_TIME.isoformat(),
+                   forecast_cache=forecast_cache.stats(), jobs_inflight=sum(j['status'] in ('queued', 'running') for j in jobs.list()),
+                   pipeline_last_run=LAST_PIPELINE_RUN and {
+                       'started': LAST_PIPELINE_RUN['started'], 'seconds': LAST_PIPELINE_RUN['seconds'],
+                       'tasks': {name: {'status': rec['status'], 'seconds': rec['seconds']}
+                                 for name, rec in LAST_PIPELINE_RUN['tasks'].items()}},
+                   freshness=freshness_metrics(), telemetry=TELEMETRY and TELEMETRY.metrics())
+
+# ----------------------------------
+# Telemetría en vivo
+# ----------------------------------
+TELEMETRY = None
+_telemetry_lock = threading.Lock()
+
+def get_telemetry():
+    # Se siembra con el dataset final en la primera muestra; comparte modelos con el servicio
+    global TELEMETRY
+    with _telemetry_lock:
+        if TELEMETRY is None:
+            from telemetry import TelemetryService
+            TELEMETRY = TelemetryService(get_forecast_service(), cfg.get('lines', [cfg['line']]),
+                                         cfg.get('telemetry_hours', 2), cfg['lags'], cfg['roll_windows'])
+    return TELEMETRY
+
+# ----------------------------------
+# Watcher de la carpeta del PLC
+# ----------------------------------
+WATCHER = None
+
+def batch_jobs_active():
+    # El watcher espera mientras un merge o una corrida del DAG reescriben los datasets
+    return any(j['kind'] in ('merge', 'pipeline') and j['status'] in ('queued', 'running') for j in jobs.list())
+
+def start_watcher():
+    global WATCHER
+    from watcher import Watcher
+    WATCHER = Watcher(service=get_forecast_service(), paused=batch_jobs_active)
+    threading.Thread(target=WATCHER.run, name='watcher', daemon=True).start()
+
+def freshness_metrics():
+    if WATCHER is not None:
+        return WATCHER.metrics()
+    # Watcher corriendo aparte (pipeline.py watch): última métrica guardada
+    path = os.path.join(BASE_DIR, 'data', 'watch_metrics.json')
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
 
 # ----------------------------------
 # Scheduler
 # ----------------------------------
-scheduler.add_job(lambda: run_script(CMD_INGEST, 'ingest'),  'cron', hour=cfg['ingest_hour_morning'], minute=cfg['ingest_minute_morning'])
-scheduler.add_job(lambda: run_script(CMD_MERGE, 'merge'),    'cron', hour=cfg['merge_hour_morning'],  minute=cfg['merge_minute_morning'])
-scheduler.add_job(lambda: run_script(CMD_TRAIN, 'train'),    'cron', hour=cfg['train_hour_morning'],  minute=cfg['train_minute_morning'])
-scheduler.add_job(lambda: run_script(build_predict_cmd(cfg['line'], cfg['horizon_hours']), 'predict'), 'cron', hour=cfg['forecast_hour_morning'], minute=cfg['forecast_minute_morning'])
+def scheduled_pipeline():
+    # Mismo trabajo que /pipeline: si aún corre una corrida anterior se une a ella
+    try:
+        job = jobs.submit('pipeline', (), pipeline_job())
+        logger.info(f"Scheduled pipeline job {job.id}")
+    except JobQueueFull as e:
+        logger.error(f"Scheduled pipeline not queued: {e}")
 
-scheduler.add_job(lambda: run_script(CMD_INGEST, 'ingest'),  'cron', hour=cfg['ingest_hour_evening'], minute=cfg['ingest_minute_evening'])
-scheduler.add_job(lambda: run_script(CMD_MERGE, 'merge'),    'cron', hour=cfg['merge_hour_evening'],  minute=cfg['merge_minute_evening'])
-scheduler.add_job(lambda: run_script(CMD_TRAIN, 'train'),    'cron', hour=cfg['train_hour_evening'],  minute=cfg['train_minute_evening'])
-scheduler.add_job(lambda: run_script(build_predict_cmd(cfg['line'], cfg['horizon_hours']), 'predict'), 'cron', hour=cfg['forecast_hour_evening'], minute=cfg['forecast_minute_evening'])
+# Una corrida del DAG antes y después de cada turno (con respaldo a la hora de ingest anterior)
+for turn in ('morning', 'evening'):
+    scheduler.add_job(scheduled_pipeline, 'cron',
+                      hour=cfg.get(f'pipeline_hour_{turn}', cfg.get(f'ingest_hour_{turn}')),
+                      minute=cfg.get(f'pipeline_minute_{turn}', cfg.get(f'ingest_minute_{turn}')))
 
 scheduler.start()
+if cfg.get('watch_enabled', False):
+    start_watcher()
 
 # ----------------------------------
 # Main
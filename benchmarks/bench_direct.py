@@ -0,0 +1,102 @@
+"""
+benchmarks/bench_direct.py
+Modelo directo multi-horizonte (train.py --direct) frente al recursivo de 30 s de la misma
+línea, ambos en su versión activa del registro:
+- Orígenes repartidos en la cola del dataset final (--tail, por defecto el último 20% de las filas
+  que tienen el horizonte mayor por delante, la zona de validación de train.py); el histórico de
+  cada uno llega hasta esa fila y el valor real es la velocidad siguiente de su dispositivo
+- Latencia por request (un origen, mediana) y de un batch con todos los orígenes
+- MAE por paso de 30 s y MAE de las medias de cada bloque del modelo directo (5 min por defecto)
+Se ejecuta desde la raíz del proyecto (usa models/ y el dataset final).
+
+Uso: python benchmarks/bench_direct.py --line linea03 --hours 2 9 --origins 20
+"""
+import argparse
+import statistics
+import sys
+import time
+from pathlib import Path
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'src'))
+from feature_engine import group_codes, group_layout  # noqa: E402
+from forecast_engine import make_forecaster  # noqa: E402
+from model_registry import DIRECT, RECURSIVE  # noqa: E402
+from predict import load_artifacts, load_histories, resolve_artifacts  # noqa: E402
+import datalake  # noqa: E402
+
+
+def device_futures(df) -> tuple:
+    """
+    Por fila: (velocidades de su dispositivo en orden temporal, posición de la fila en ellas).
+    """
+    codes, _ = group_codes(df, ['device_id'])
+    by_group = np.argsort(codes, kind='stable')
+    _, pos_sorted = group_layout(codes[by_group])
+    pos = np.empty_like(pos_sorted)
+    pos[by_group] = pos_sorted
+    velocity = df['velocity_bpm'].to_numpy(dtype=np.float64)
+    series = {c: velocity[codes == c] for c in np.unique(codes)}
+    return codes, pos, series
+
+def pick_origins(df, steps: int, n: int, tail: float) -> list:
+    codes, pos, series = device_futures(df)
+    remaining = np.array([len(series[c]) for c in codes]) - pos - 1
+    candidates = np.flatnonzero(remaining >= steps)
+    if not len(candidates):
+        raise SystemExit(f"No hay filas con {steps} registros posteriores de su dispositivo")
+    candidates = candidates[int(len(candidates) * (1 - tail)):]
+    return sorted(set(candidates[np.linspace(0, len(candidates) - 1, n).astype(int)].tolist()))
+
+def actuals(df, origins: list, steps: int) -> np.ndarray:
+    codes, pos, series = device_futures(df)
+    return np.stack([series[codes[o]][pos[o] + 1:pos[o] + 1 + steps] for o in origins])
+
+def block_mae(pred: np.ndarray, real: np.ndarray, block_steps: int) -> float:
+    n = pred.shape[1] // block_steps * block_steps
+    shape = (pred.shape[0], -1, block_steps)
+    return float(np.abs(pred[:, :n].reshape(shape).mean(axis=2) - real[:, :n].reshape(shape).mean(axis=2)).mean())
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--line', default='linea03')
+    parser.add_argument('--hours', type=int, nargs='+', default=[2, 9])
+    parser.add_argument('--origins', type=int, default=20)
+    parser.add_argument('--tail', type=float, default=0.2, help='Fracción final de orígenes posibles')
+    parser.add_argument('--backend', choices=['numpy', 'keras'], default='numpy')
+    parser.add_argument('--models-dir', type=Path, default=Path('models'))
+    args = parser.parse_args()
+
+    df = load_histories(datalake.FINAL_LAKE.parent, [args.line])[args.line]
+    forecasters = {}
+    for kind in (RECURSIVE, DIRECT):
+        paths, version = resolve_artifacts(args.models_dir, args.line, kind)
+        forecasters[kind] = make_forecaster(*load_artifacts(paths, [], [], backend=args.backend))
+        print(f"{kind:<9} {version}")
+    block_steps = forecasters[DIRECT].block_steps
+
+    origins = pick_origins(df, max(args.hours) * 120, args.origins, args.tail)
+    histories = {o: df.iloc[:o + 1] for o in origins}
+    print(f"{len(origins)} orígenes entre {df['_time'].iloc[origins[0]]} y {df['_time'].iloc[origins[-1]]}\n")
+
+    print(f"{'horizonte':<10} {'modelo':<10} {'request':>10} {'batch':>9} {'MAE 30 s':>9} {f'MAE {block_steps * 30 // 60} min':>10}")
+    for hours in args.hours:
+        steps = hours * 120
+        real = actuals(df, origins, steps)
+        for kind, forecaster in forecasters.items():
+            forecaster.forecast_batch({0: histories[origins[0]]}, steps)  # calentamiento
+            single = []
+            for o in origins:
+                start = time.perf_counter()
+                forecaster.forecast_batch({o: histories[o]}, steps)
+                single.append(time.perf_counter() - start)
+            start = time.perf_counter()
+            batch = forecaster.forecast_batch(histories, steps)
+            batch_seconds = time.perf_counter() - start
+            pred = np.stack([batch[o]['predicted_velocity_bpm'].to_numpy() for o in origins])
+            print(f"{hours:>3} h ({steps:>4}) {kind:<10} {statistics.median(single) * 1000:>8.1f}ms "
+                  f"{batch_seconds * 1000:>7.1f}ms {np.abs(pred - real).mean():>9.2f} {block_mae(pred, real, block_steps):>10.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+"""
+benchmarks/bench_forecast_payload.py
+Tamaño y tiempo de serialización de /forecast/data por formato (src/forecast_payload.py)
+frente al JSON de registros anterior (`jsonify(df.to_dict(orient='records'))`):
+- Pronóstico sintético de 30 s con paros (caídas a cero) para cada horizonte
+- Bytes sin comprimir y con gzip, tiempo hasta el primer chunk y tiempo total (mínimo de --repeat)
+- Con `--points` además la versión reducida con LTTB y el error de la curva reducida
+  (interpolada) frente a la completa
+
+Uso: python benchmarks/bench_forecast_payload.py --hours 2 9 24 --points 600
+"""
+import argparse
+import json
+import sys
+import time
+import zlib
+from pathlib import Path
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'src'))
+import forecast_payload  # noqa: E402
+
+
+def synthetic_forecast(hours: int, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    n = hours * 60 * 2
+    t = pd.date_range('2025-01-02T07:00:00Z', periods=n, freq='30s')
+    v = 300 + 20 * np.sin(np.arange(n) / 240) + rng.normal(0, 5, n)
+    for start in rng.integers(0, n, max(1, n // 400)):
+        v[start:start + rng.integers(5, 40)] = 0.0
+    return pd.DataFrame({'_time': t, 'predicted_velocity_bpm': v})
+
+def legacy(df: pd.DataFrame):
+    # Lo que devolvía jsonify(df.to_dict(orient='records')): un solo cuerpo al final
+    yield json.dumps(df.to_dict(orient='records'), default=str).encode()
+
+def measure(make_chunks, repeat: int) -> dict:
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        chunks = iter(make_chunks())
+        first = next(chunks)
+        ttfb = time.perf_counter() - start
+        body = first + b''.join(chunks)
+        total = time.perf_counter() - start
+        if best is None or total < best['total']:
+            best = {'ttfb': ttfb, 'total': total, 'bytes': len(body), 'gzip': len(zlib.compress(body, 6))}
+    return best
+
+def curve_error(df: pd.DataFrame, points: int) -> float:
+    times, values = forecast_payload.series(df, points)
+    full_t, full_v = forecast_payload.series(df)
+    return float(np.abs(np.interp(full_t, times, values) - full_v).mean())
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--hours', type=int, nargs='+', default=[2, 9, 24])
+    parser.add_argument('--points', type=int, default=600, help='Puntos tras LTTB (0 para omitir)')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'horizonte':<10} {'formato':<18} {'bytes':>9} {'gzip':>8} {'1er chunk':>10} {'total':>9}")
+    for hours in args.hours:
+        df = synthetic_forecast(hours)
+        cases = [('records (antes)', lambda: legacy(df))]
+        cases += [(fmt, lambda fmt=fmt: forecast_payload.encode(df, fmt)) for fmt in forecast_payload.FORMATS]
+        if args.points:
+            cases += [(f'{fmt} {args.points}p', lambda fmt=fmt: forecast_payload.encode(df, fmt, args.points))
+                      for fmt in ('columnar', 'arrow')]
+        for name, make_chunks in cases:
+            r = measure(make_chunks, args.repeat)
+            print(f"{hours:>3} h ({len(df):>4}) {name:<18} {r['bytes']:>9} {r['gzip']:>8} "
+                  f"{r['ttfb'] * 1000:>8.2f}ms {r['total'] * 1000:>7.2f}ms")
+        if args.points and args.points < len(df):
+            print(f"{'':<10} LTTB {args.points} puntos: error medio interpolado {curve_error(df, args.points):.2f} bpm")
+
+
+if __name__ == '__main__':
+    main()
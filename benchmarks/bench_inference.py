@@ -0,0 +1,83 @@
+"""
+benchmarks/bench_inference.py
+Compara el modelo Keras con la exportación NumPy (inference_export.py) de la versión activa
+de una línea: tiempo de importación + carga, latencia de predict_on_batch y pronóstico
+completo, y diferencia máxima entre ambos pronósticos.
+Se ejecuta desde la raíz del proyecto (usa models/ y el dataset final).
+
+Uso: python benchmarks/bench_inference.py --line linea03 --hours 9
+"""
+import argparse
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+SRC = Path(__file__).resolve().parent.parent / 'src'
+sys.path.insert(0, str(SRC))
+
+LOAD_SNIPPET = """
+import sys, time
+sys.path.insert(0, {src!r})
+t = time.perf_counter()
+{body}
+print(time.perf_counter() - t)
+"""
+
+# -----------------------------------
+# Carga en un proceso limpio (incluye importaciones)
+# -----------------------------------
+def cold_load_seconds(body: str) -> float:
+    out = subprocess.run([sys.executable, '-c', LOAD_SNIPPET.format(src=str(SRC), body=body)],
+                         capture_output=True, text=True, check=True).stdout
+    return float(out.strip().splitlines()[-1])
+
+def per_call_ms(model, x, repeats: int = 500) -> float:
+    model.predict_on_batch(x)
+    start = time.perf_counter()
+    for _ in range(repeats):
+        model.predict_on_batch(x)
+    return (time.perf_counter() - start) / repeats * 1000
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--line', default='linea03')
+    parser.add_argument('--hours', type=int, default=9)
+    parser.add_argument('--models-dir', type=Path, default=Path('models'))
+    args = parser.parse_args()
+
+    import numpy as np
+    from forecast_engine import RecursiveForecaster
+    from model_registry import ModelRegistry
+    from predict import load_artifacts, load_histories
+    import datalake
+
+    entry = ModelRegistry(args.models_dir).active(args.line)
+    if entry is None or 'inference' not in entry['paths']:
+        raise SystemExit(f"{args.line} no tiene una versión registrada con exportación NumPy")
+    paths = entry['paths']
+
+    numpy_load = cold_load_seconds(
+        f"from inference_export import NumpyMLP\nNumpyMLP.load({str(paths['inference'])!r})")
+    keras_load = cold_load_seconds(
+        f"from tensorflow.keras.models import load_model\nload_model({str(paths['model'])!r}, compile=False)")
+    print(f"Importar + cargar  keras {keras_load:8.3f} s   numpy {numpy_load:8.3f} s")
+
+    keras_model, pipeline = load_artifacts(paths, [], [], backend='keras')
+    numpy_model, _ = load_artifacts(paths, [], [], backend='numpy')
+    x = np.random.default_rng(0).standard_normal((1, len(pipeline.feature_names))).astype(np.float32)
+    print(f"predict_on_batch   keras {per_call_ms(keras_model, x):8.3f} ms  numpy {per_call_ms(numpy_model, x):8.3f} ms")
+
+    histories = load_histories(datalake.FINAL_LAKE.parent, [args.line])
+    steps = args.hours * 60 * 2
+    forecasts = {}
+    for name, model in (('keras', keras_model), ('numpy', numpy_model)):
+        start = time.perf_counter()
+        forecasts[name] = RecursiveForecaster(model, pipeline).forecast_batch(histories, steps)[args.line]
+        print(f"Pronóstico {args.hours} h   {name:<5} {time.perf_counter() - start:8.3f} s")
+    diff = np.max(np.abs(forecasts['keras']['predicted_velocity_bpm'] - forecasts['numpy']['predicted_velocity_bpm']))
+    print(f"Diferencia máxima entre pronósticos: {diff:.2e}")
+
+
+if __name__ == '__main__':
+    main()
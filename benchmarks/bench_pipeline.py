@@ -0,0 +1,175 @@
+"""
+benchmarks/bench_pipeline.py
+Benchmark de punta a punta ingest → merge → prepare → train → predict sobre datos sintéticos
+(synthetic_plc.py) a varios tamaños y horizontes de pronóstico.
+- Cada tamaño corre en un directorio de trabajo temporal propio (data/, models/ vacíos) con
+  PLC_SHARE_DIR apuntando a los CSV generados; config.yaml es el del proyecto
+- Cada etapa es un proceso de src/pipeline.py: se mide tiempo de reloj, CPU (usuario + sistema)
+  y memoria máxima residente del proceso (incluye los workers de train-lines). Este script no
+  importa pandas: el generador corre en su propio proceso para que la memoria heredada al
+  lanzar cada etapa no infle la medición
+- Resultados en JSON (commit, entorno, parámetros y una fila por etapa) para seguir regresiones
+  entre commits; `--baseline` compara contra un resultado anterior
+
+Uso: python benchmarks/bench_pipeline.py --days 1 7 --lines 2 --devices 3 --hours 2 9 \
+         --out benchmarks/results/pipeline.json --baseline benchmarks/results/anterior.json
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+try:
+    import resource
+except ImportError:  # Windows: sin memoria máxima por proceso
+    resource = None
+
+ROOT = Path(__file__).resolve().parent.parent
+PIPELINE = str(ROOT / 'src' / 'pipeline.py')
+GENERATOR = str(ROOT / 'benchmarks' / 'synthetic_plc.py')
+RESULTS_VERSION = 1
+
+# -----------------------------------
+# Medición de un proceso
+# -----------------------------------
+def run_stage(argv: list, cwd: Path, env: dict, log) -> dict:
+    """
+    Ejecuta `pipeline.py argv` y devuelve tiempo de reloj, CPU y memoria máxima del proceso.
+    """
+    start = time.perf_counter()
+    proc = subprocess.Popen([sys.executable, PIPELINE] + argv, cwd=cwd, env=env, stdout=log, stderr=subprocess.STDOUT)
+    if resource is not None:
+        _, status, usage = os.wait4(proc.pid, 0)
+        proc.returncode = os.waitstatus_to_exitcode(status)
+        cpu = usage.ru_utime + usage.ru_stime
+        rss_mb = usage.ru_maxrss / 1024  # Linux: KiB
+    else:
+        proc.wait()
+        cpu, rss_mb = None, None
+    return {
+        'wall_seconds': round(time.perf_counter() - start, 3),
+        'cpu_seconds': None if cpu is None else round(cpu, 3),
+        'max_rss_mb': None if rss_mb is None else round(rss_mb, 1),
+        'returncode': proc.returncode,
+    }
+
+def stage_plan(lines: list, hours: list, train_args: list) -> list:
+    # (etapa, horizonte, argv)
+    plan = [
+        ('ingest', None, ['ingest']),
+        ('merge', None, ['merge']),
+        ('prepare', None, ['prepare', '--full']),
+        ('train', None, ['train-lines', '--lines', *lines, '--full', *train_args]),
+    ]
+    plan += [('predict', h, ['predict', '--lines', *lines, '--hours', str(h)]) for h in hours]
+    return plan
+
+# -----------------------------------
+# Corrida por tamaño
+# -----------------------------------
+def generate(share: Path, days: float, args) -> dict:
+    argv = [sys.executable, GENERATOR, '--out', str(share), '--lines', str(args.lines), '--devices', str(args.devices),
+            '--days', str(days), '--seed', str(args.seed), '--json']
+    if args.stop_dist:
+        argv += ['--stop-dist', *args.stop_dist]
+    info = json.loads(subprocess.run(argv, capture_output=True, text=True, check=True).stdout)
+    info['paths'] = {k: Path(p) for k, p in info['paths'].items()}
+    return info
+
+def bench_size(days: float, args) -> list:
+    rows = []
+    with tempfile.TemporaryDirectory(prefix='bench_pipeline_') as tmp:
+        work, share = Path(tmp) / 'work', Path(tmp) / 'share'
+        work.mkdir()
+        start = time.perf_counter()
+        info = generate(share, days, args)
+        print(f"[BENCH] {days:g} día(s): {info['rows']} filas por CSV generadas en {time.perf_counter() - start:.1f} s")
+        env = dict(os.environ, PLC_SHARE_DIR=str(share))
+        size = {'days': days, 'lines': args.lines, 'devices_per_line': args.devices, 'rows': info['rows'],
+                'csv_bytes': sum(p.stat().st_size for p in info['paths'].values())}
+
+        with open(work / 'pipeline.log', 'w') as log:
+            for stage, hours, argv in stage_plan(info['lines'], args.hours, args.train_args):
+                result = run_stage(argv, work, env, log)
+                rows.append(dict(size, stage=stage, hours=hours, **result))
+                label = stage if hours is None else f"{stage} {hours} h"
+                print(f"[BENCH]   {label:<14} {result['wall_seconds']:8.2f} s  CPU {result['cpu_seconds'] or 0:8.2f} s  "
+                      f"RSS {result['max_rss_mb'] or 0:8.1f} MB")
+                if result['returncode'] != 0:
+                    log.flush()
+                    print((work / 'pipeline.log').read_text()[-2000:])
+                    print(f"[BENCH]   {label} falló (código {result['returncode']}); se omiten las etapas siguientes")
+                    break
+    return rows
+
+# -----------------------------------
+# Metadatos y comparación
+# -----------------------------------
+def git_info() -> dict:
+    def git(*cmd):
+        out = subprocess.run(['git', *cmd], cwd=ROOT, capture_output=True, text=True)
+        return out.stdout.strip() if out.returncode == 0 else None
+    return {'commit': git('rev-parse', 'HEAD'), 'dirty': bool(git('status', '--porcelain', '--untracked-files=no'))}
+
+def compare(results: dict, baseline: dict):
+    key = lambda r: (r['days'], r['rows'], r['stage'], r['hours'])
+    before = {key(r): r for r in baseline['results']}
+    print(f"[BENCH] Frente a {(baseline['git']['commit'] or '?')[:10]} (tiempo de reloj / memoria):")
+    for r in results['results']:
+        b = before.get(key(r))
+        if b is None:
+            continue
+        label = r['stage'] if r['hours'] is None else f"{r['stage']} {r['hours']} h"
+        rss = f"x{r['max_rss_mb'] / b['max_rss_mb']:.2f}" if r['max_rss_mb'] and b['max_rss_mb'] else '-'
+        print(f"[BENCH]   {r['days']:g} d {label:<14} x{r['wall_seconds'] / b['wall_seconds']:.2f}  {rss}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de punta a punta del pipeline.")
+    parser.add_argument('--days', type=float, nargs='+', default=[1, 7], help='Tamaños a medir en días de datos')
+    parser.add_argument('--lines', type=int, default=2)
+    parser.add_argument('--devices', type=int, default=3, help='Dispositivos por línea')
+    parser.add_argument('--hours', type=int, nargs='+', default=[2, 9], help='Horizontes de pronóstico')
+    parser.add_argument('--stop-dist', nargs='*', metavar='CODIGO=PESO', help='Pesos de motivos de paro (CAUSE_MAP)')
+    parser.add_argument('--train-args', nargs=argparse.REMAINDER, default=[],
+                        help='Argumentos extra para train-lines (p.ej. --batch-size 1024 --epochs 2); va al final')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--out', type=Path, default=None,
+                        help='JSON de resultados (por defecto benchmarks/results/pipeline_<commit>.json)')
+    parser.add_argument('--baseline', type=Path, help='JSON de una corrida anterior para comparar')
+    args = parser.parse_args()
+
+    git = git_info()
+    results = {
+        'version': RESULTS_VERSION,
+        'created': datetime.datetime.now().isoformat(),
+        'git': git,
+        'environment': {'python': platform.python_version(), 'platform': platform.platform(),
+                        'cpu_count': os.cpu_count()},
+        'params': {'days': args.days, 'lines': args.lines, 'devices_per_line': args.devices, 'hours': args.hours,
+                   'stop_dist': args.stop_dist or 'uniforme', 'train_args': args.train_args, 'seed': args.seed},
+        'results': [],
+    }
+    for days in args.days:
+        results['results'] += bench_size(days, args)
+
+    out = args.out or ROOT / 'benchmarks' / 'results' / f"pipeline_{(git['commit'] or 'local')[:10]}.json"
+    out.parent.mkdir(parents=True, exist_ok=True)
+    with open(out, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2)
+    print(f"[BENCH] Resultados en: {out}")
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            compare(results, json.load(f))
+    if any(r['returncode'] != 0 for r in results['results']):
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
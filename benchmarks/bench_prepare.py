@@ -0,0 +1,116 @@
+"""
+benchmarks/bench_prepare.py
+Compara el feature engineering de prepare.py previo (shift/rolling globales ordenados sólo
+por _time y .apply por fila para el turno) con feature_engine.build_features (por dispositivo,
+sumas acumuladas, vectorizado) sobre un merged sintético.
+Verifica además que build_features coincide con groupby().shift()/rolling() de pandas.
+
+Uso: python benchmarks/bench_prepare.py --rows 2000000 --devices 12
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'src'))
+from feature_engine import build_features  # noqa: E402
+
+LAGS = [1, 2, 4, 10]
+ROLL_WINDOWS = [10, 20]
+
+# -----------------------------------
+# Datos sintéticos
+# -----------------------------------
+def synthetic_merged(rows: int, devices: int, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    per_device = rows // devices
+    times = pd.date_range('2025-01-01', periods=per_device, freq='30s', tz='UTC')
+    frames = []
+    for d in range(devices):
+        line = f'linea{d % 3 + 1:02d}'
+        frames.append(pd.DataFrame({
+            '_time': times,
+            'linea': line,
+            'device_id': f'{d % 3 + 1:02d}-{chr(65 + d // 3)}',
+            'velocity_bpm': (300 + 50 * rng.standard_normal(per_device)).astype('float32'),
+            'state_flag': rng.integers(0, 2, per_device),
+        }))
+    return pd.concat(frames, ignore_index=True)
+
+# -----------------------------------
+# Implementaciones
+# -----------------------------------
+def legacy_features(df: pd.DataFrame) -> pd.DataFrame:
+    df = df.sort_values('_time').reset_index(drop=True)
+    df['device_idx'] = df['device_id'].astype('category').cat.codes
+    for lag in LAGS:
+        df[f'lag_{lag}'] = df['velocity_bpm'].shift(lag)
+    for w in ROLL_WINDOWS:
+        df[f'roll_mean_{w}'] = df['velocity_bpm'].rolling(window=w, min_periods=1).mean()
+    df['_time'] = pd.to_datetime(df['_time'])
+    df['hour']       = df['_time'].dt.hour
+    df['minute']     = df['_time'].dt.minute
+    df['dayofweek']  = df['_time'].dt.dayofweek
+    df['is_weekend'] = (df['dayofweek'] >= 5).astype(int)
+    df['shift'] = df['hour'].apply(lambda h: 'day' if 7 <= h < 19 else 'night')
+    # Cíclicos que antes calculaba train.add_advanced_time_features (ahora los guarda prepare.py)
+    df['hour_sin'] = np.sin(2 * np.pi * df['hour']/24)
+    df['hour_cos'] = np.cos(2 * np.pi * df['hour']/24)
+    df['minute_sin'] = np.sin(2 * np.pi * df['minute']/60)
+    df['minute_cos'] = np.cos(2 * np.pi * df['minute']/60)
+    df['dayofweek_sin'] = np.sin(2 * np.pi * df['dayofweek']/7)
+    df['dayofweek_cos'] = np.cos(2 * np.pi * df['dayofweek']/7)
+    return df.iloc[max(LAGS):].reset_index(drop=True)
+
+def pandas_groupby_reference(df: pd.DataFrame) -> pd.DataFrame:
+    df = df.sort_values(['linea', 'device_id', '_time'], kind='stable').reset_index(drop=True)
+    g = df.groupby(['linea', 'device_id'], sort=False)['velocity_bpm']
+    for lag in LAGS:
+        df[f'lag_{lag}'] = g.shift(lag)
+    for w in ROLL_WINDOWS:
+        df[f'roll_mean_{w}'] = g.rolling(window=w, min_periods=1).mean().to_numpy()
+    df = df[g.cumcount() >= max(LAGS)]
+    return df.sort_values(['_time', 'linea', 'device_id'], kind='stable').reset_index(drop=True)
+
+def timed(fn, df: pd.DataFrame, repeat: int) -> tuple:
+    best, out = float('inf'), None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        out = fn(df.copy())
+        best = min(best, time.perf_counter() - t0)
+    return best, out
+
+# -----------------------------------
+# Main
+# -----------------------------------
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark del feature engineering de prepare.py')
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--devices', type=int, default=12)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    # Correctitud frente a groupby de pandas (muestra pequeña)
+    small = synthetic_merged(20_000, args.devices, seed=1)
+    ref = pandas_groupby_reference(small)
+    new = build_features(small, LAGS, ROLL_WINDOWS)
+    cols = [f'lag_{lag}' for lag in LAGS] + [f'roll_mean_{w}' for w in ROLL_WINDOWS]
+    err = max(float(np.nanmax(np.abs(ref[c].to_numpy(np.float64) - new[c].to_numpy(np.float64)))) for c in cols)
+    print(f"[BENCH] Filas iguales a groupby de pandas: {len(ref) == len(new)}, error máx. {err:.2e}")
+
+    df = synthetic_merged(args.rows, args.devices)
+    t_old, old = timed(legacy_features, df, args.repeat)
+    t_ref, _ = timed(pandas_groupby_reference, df, args.repeat)
+    t_new, _ = timed(lambda d: build_features(d, LAGS, ROLL_WINDOWS), df, args.repeat)
+
+    # Lags que mezclan dispositivos en el script previo
+    leaked = (old['device_id'] != old['device_id'].shift(1)).iloc[1:].mean()
+    print(f"[BENCH] {len(df)} filas, {args.devices} dispositivos (mejor de {args.repeat})")
+    print(f"        prepare.py previo (global):   {t_old:7.3f} s  (lag_1 de otro dispositivo en {leaked:.0%} de filas)")
+    print(f"        pandas groupby().rolling():   {t_ref:7.3f} s")
+    print(f"        feature_engine (cumsum):      {t_new:7.3f} s  (x{t_old / t_new:.1f} vs previo, x{t_ref / t_new:.1f} vs groupby)")
+
+if __name__ == '__main__':
+    main()
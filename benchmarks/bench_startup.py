@@ -0,0 +1,86 @@
+"""
+benchmarks/bench_startup.py
+Tiempo de arranque de src/pipeline.py en un proceso limpio (mínimo de --repeat corridas):
+`--help`, la ayuda de cada etapa, un `ingest` real contra un share temporal con CSV chicos
+y la importación de app.py. Para cada comando lista los módulos pesados que llegó a importar
+(pandas, NumPy, pyarrow, scikit-learn, TensorFlow) según `python -X importtime`.
+Los comandos corren en un directorio temporal: no escriben en data/ del proyecto.
+
+Uso: python benchmarks/bench_startup.py --repeat 5 --budget 1.0
+"""
+import argparse
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+PIPELINE = str(ROOT / 'src' / 'pipeline.py')
+HEAVY = ('pandas', 'numpy', 'pyarrow', 'sklearn', 'tensorflow')
+
+# (nombre, argv, ¿debe arrancar en menos de --budget?)
+COMMANDS = [
+    ('pipeline --help', [PIPELINE, '--help'], True),
+    ('ingest', [PIPELINE, 'ingest'], True),
+    ('ingest --help', [PIPELINE, 'ingest', '--help'], True),
+    ('registry --help', [PIPELINE, 'registry', '--help'], True),
+    ('train-lines --help', [PIPELINE, 'train-lines', '--help'], True),
+    ('train --help', [PIPELINE, 'train', '--help'], False),
+    ('predict --help', [PIPELINE, 'predict', '--help'], False),
+    ('import app', ['-c', f'import sys; sys.path.insert(0, {str(ROOT)!r}); import app'], False),
+]
+
+# -----------------------------------
+# Medición
+# -----------------------------------
+def run_once(argv: list, cwd: str, env: dict) -> float:
+    start = time.perf_counter()
+    subprocess.run([sys.executable] + argv, cwd=cwd, env=env, check=True,
+                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return time.perf_counter() - start
+
+def heavy_imports(argv: list, cwd: str, env: dict) -> list:
+    err = subprocess.run([sys.executable, '-X', 'importtime'] + argv, cwd=cwd, env=env,
+                         capture_output=True, text=True).stderr
+    top = set(re.findall(r'\|\s+(\w+)$', err, flags=re.M))
+    return [m for m in HEAVY if m in top]
+
+def fake_share(share: Path):
+    share.mkdir(parents=True, exist_ok=True)
+    (share / 'calidad_2025-01-01.csv').write_text(
+        "_time,linea,_value,real_velocity,product_id,device_id\n"
+        "2025-01-01T00:00:00Z,linea01,300,300,P1,01-A\n")
+    (share / 'disponibilidad_2025-01-01.csv').write_text(
+        "_time,device_id,_value,stopping_reason\n"
+        "2025-01-01T00:00:00Z,01-A,Produciendo,-\n")
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--budget', type=float, default=1.0, help='Segundos máximos para los comandos livianos')
+    args = parser.parse_args()
+
+    failed = []
+    with tempfile.TemporaryDirectory() as tmp:
+        share = Path(tmp) / 'share'
+        fake_share(share)
+        env = dict(os.environ, PLC_SHARE_DIR=str(share))
+        print(f"{'comando':<20} {'mínimo':>8} {'mediana':>8}  importa")
+        for name, argv, light in COMMANDS:
+            times = sorted(run_once(argv, tmp, env) for _ in range(args.repeat))
+            heavy = heavy_imports(argv, tmp, env)
+            mark = ''
+            if light and (times[0] > args.budget or heavy):
+                mark = '  <-- excede'
+                failed.append(name)
+            print(f"{name:<20} {times[0]:7.3f}s {times[len(times) // 2]:7.3f}s  {', '.join(heavy) or '-'}{mark}")
+
+    if failed:
+        raise SystemExit(f"Arranque lento o con dependencias pesadas: {', '.join(failed)}")
+
+
+if __name__ == '__main__':
+    main()
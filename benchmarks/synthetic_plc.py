@@ -0,0 +1,138 @@
+"""
+benchmarks/synthetic_plc.py
+Generador de exportaciones sintéticas del PLC con el formato que consume ingest.py:
+- `calidad_<fecha>.csv` (_time, linea, _value, real_velocity, product_id, device_id)
+- `disponibilidad_<fecha>.csv` (_time, device_id, _value, stopping_reason)
+Una muestra cada 30 s (con jitter de segundos) por dispositivo durante `days` días.
+Los paros llegan como episodios (inicio con probabilidad por muestra, duración geométrica)
+y su motivo se sortea entre los códigos de CAUSE_MAP con la distribución indicada;
+durante un paro la velocidad cae a cero. Fuera de los paros la velocidad sigue un
+patrón diario por turno más ruido.
+
+Uso: python benchmarks/synthetic_plc.py --out /tmp/share --lines 2 --devices 3 --days 7 \
+         --stop-dist M01=3 P01=2 CO1=1
+"""
+import argparse
+import json
+import sys
+from pathlib import Path
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'src'))
+from merge_quality_availability import CAUSE_MAP  # noqa: E402
+
+SAMPLES_PER_DAY = 24 * 60 * 2
+TIME_FORMAT = '%Y-%m-%dT%H:%M:%S.%fZ'
+
+
+def stop_distribution(weights: dict = None) -> tuple:
+    """
+    (códigos, probabilidades) sobre los códigos de CAUSE_MAP. Sin pesos, uniforme;
+    los códigos que no aparecen en `weights` quedan con probabilidad 0.
+    """
+    codes = list(CAUSE_MAP)
+    if not weights:
+        return codes, np.full(len(codes), 1 / len(codes))
+    unknown = set(weights) - set(codes)
+    if unknown:
+        raise ValueError(f"Motivos de paro fuera de CAUSE_MAP: {sorted(unknown)}")
+    p = np.array([float(weights.get(c, 0)) for c in codes])
+    if p.sum() <= 0:
+        raise ValueError("La distribución de motivos de paro no tiene peso positivo")
+    return codes, p / p.sum()
+
+def device_ids(lines: int, devices: int) -> list:
+    # linea03 -> 03-A, 03-B, ... como en las exportaciones reales
+    return [(f'linea{l:02d}', f'{l:02d}-{chr(65 + d)}') for l in range(1, lines + 1) for d in range(devices)]
+
+def simulate_device(rng, n: int, start: pd.Timestamp, codes: list, p: np.ndarray,
+                    stop_rate: float, mean_stop: float) -> tuple:
+    """
+    (tiempos, velocidad, produciendo, motivo) de un dispositivo; `stop_rate` es la probabilidad
+    de que empiece un paro en cada muestra y `mean_stop` su duración media en muestras.
+    """
+    t = start + pd.to_timedelta(np.arange(n) * 30 + rng.integers(0, 5, n), unit='s')
+
+    # Episodios de paro: inicios Bernoulli y duraciones geométricas
+    producing = np.ones(n, dtype=bool)
+    reason = np.full(n, '-', dtype=object)
+    starts = np.flatnonzero(rng.random(n) < stop_rate)
+    durations = rng.geometric(1 / mean_stop, len(starts))
+    causes = rng.choice(codes, len(starts), p=p)
+    for s, d, c in zip(starts, durations, causes):
+        producing[s:s + d] = False
+        reason[s:s + d] = c
+
+    base = rng.uniform(250, 350)
+    hours = (t.hour + t.minute / 60).to_numpy()
+    shift = np.where((hours >= 7) & (hours < 19), 1.0, 0.85)
+    velocity = base * shift * (1 + 0.05 * np.sin(2 * np.pi * hours / 24)) + rng.normal(0, base * 0.03, n)
+    velocity = np.where(producing, np.clip(velocity, 0, None), 0.0)
+    return t, velocity, producing, reason
+
+def generate(out_dir: Path, lines: int = 2, devices: int = 3, days: int = 1, stop_weights: dict = None,
+             stop_rate: float = 0.002, mean_stop: float = 20, start: str = '2025-01-01', seed: int = 0) -> dict:
+    """
+    Escribe el par de CSV en `out_dir` y devuelve sus rutas, filas y líneas generadas.
+    """
+    rng = np.random.default_rng(seed)
+    codes, p = stop_distribution(stop_weights)
+    n = int(days * SAMPLES_PER_DAY)
+    start_ts = pd.Timestamp(start, tz='UTC')
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+
+    quality, availability = [], []
+    for line, device in device_ids(lines, devices):
+        t, velocity, producing, reason = simulate_device(rng, n, start_ts, codes, p, stop_rate, mean_stop)
+        stamps = t.strftime(TIME_FORMAT)
+        quality.append(pd.DataFrame({
+            '_time': stamps, 'linea': line, '_value': velocity.round(2),
+            'real_velocity': (velocity + rng.normal(0, 1, n)).clip(0).round(2),
+            'product_id': f'P{rng.integers(1, 4)}', 'device_id': device,
+        }))
+        availability.append(pd.DataFrame({
+            '_time': stamps, 'device_id': device,
+            '_value': np.where(producing, 'Produciendo', 'Parado'), 'stopping_reason': reason,
+        }))
+
+    day = (start_ts + pd.Timedelta(days=days)).date().isoformat()
+    paths = {'calidad': out_dir / f'calidad_{day}.csv', 'disponibilidad': out_dir / f'disponibilidad_{day}.csv'}
+    pd.concat(quality, ignore_index=True).to_csv(paths['calidad'], index=False)
+    pd.concat(availability, ignore_index=True).to_csv(paths['disponibilidad'], index=False)
+    return {'paths': paths, 'rows': n * lines * devices, 'lines': [f'linea{l:02d}' for l in range(1, lines + 1)]}
+
+def parse_weights(items: list) -> dict:
+    weights = {}
+    for item in items or []:
+        code, _, weight = item.partition('=')
+        weights[code] = float(weight)
+    return weights
+
+def main():
+    parser = argparse.ArgumentParser(description="Genera CSV sintéticos de calidad y disponibilidad.")
+    parser.add_argument('--out', type=Path, required=True, help='Carpeta destino (p.ej. la de PLC_SHARE_DIR)')
+    parser.add_argument('--lines', type=int, default=2)
+    parser.add_argument('--devices', type=int, default=3, help='Dispositivos por línea')
+    parser.add_argument('--days', type=float, default=1)
+    parser.add_argument('--stop-dist', nargs='*', metavar='CODIGO=PESO',
+                        help='Pesos de los motivos de paro (códigos de CAUSE_MAP); por defecto uniforme')
+    parser.add_argument('--stop-rate', type=float, default=0.002, help='Probabilidad de inicio de paro por muestra')
+    parser.add_argument('--mean-stop', type=float, default=20, help='Duración media de un paro en muestras de 30 s')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', action='store_true', help='Imprime rutas, filas y líneas como JSON')
+    args = parser.parse_args()
+
+    info = generate(args.out, args.lines, args.devices, args.days, parse_weights(args.stop_dist),
+                    args.stop_rate, args.mean_stop, seed=args.seed)
+    if args.json:
+        print(json.dumps(dict(info, paths={k: str(p) for k, p in info['paths'].items()})))
+        return
+    print(f"{info['rows']} filas por archivo ({', '.join(info['lines'])}):")
+    for path in info['paths'].values():
+        print(f"  {path}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+"""
+src/compact_schema.py
+Representación compacta del dataset merged (`merged_schema: compact` en config.yaml):
+- `device_id`, `linea`, `product_id` como categorías (diccionario en Parquet)
+- Numéricos reducidos (float32, state_flag int8)
+- stop_group como un único código int8 `stop_code` (índice en la lista de grupos
+  guardada en el manifest; -1 = sin registro de availability) en lugar de un one-hot por grupo
+- `expand_stop_codes` regenera las columnas stop_* sólo cuando se necesitan
+- `compare_layouts` mide memoria y tamaño Parquet frente al layout ancho (one-hot, object, float64)
+"""
+import io
+import numpy as np
+import pandas as pd
+
+STOP_PREFIX = 'stop'
+STOP_CODE = 'stop_code'
+CATEGORY_COLS = ['linea', 'product_id', 'device_id']
+
+# -----------------------------------
+# Conversión
+# -----------------------------------
+def compact_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Categorías para columnas de texto y downcast de numéricos; `stop_group`
+    (categórico) se reemplaza por su código int8.
+    """
+    out = df.copy()
+    for col in CATEGORY_COLS:
+        if col in out.columns:
+            out[col] = out[col].astype('category')
+    if 'stop_group' in out.columns:
+        out[STOP_CODE] = out.pop('stop_group').cat.codes.astype('int8')
+    for col in out.columns:
+        kind = out[col].dtype.kind
+        if kind == 'f':
+            out[col] = out[col].astype('float32')
+        elif kind in 'iu' and col != STOP_CODE:
+            out[col] = pd.to_numeric(out[col], downcast='integer')
+    return out
+
+def expand_stop_codes(df: pd.DataFrame, groups: list, drop: bool = True) -> pd.DataFrame:
+    """
+    Columnas one-hot stop_<grupo> (bool, como pd.get_dummies) a partir de `stop_code`.
+    """
+    if STOP_CODE not in df.columns:
+        return df
+    codes = df[STOP_CODE].to_numpy()
+    flags = codes[:, None] == np.arange(len(groups), dtype=codes.dtype)[None, :]
+    dummies = pd.DataFrame(flags, columns=[f'{STOP_PREFIX}_{g}' for g in groups], index=df.index)
+    base = df.drop(columns=[STOP_CODE]) if drop else df
+    return pd.concat([base, dummies], axis=1)
+
+def widen_frame(df: pd.DataFrame, groups: list) -> pd.DataFrame:
+    """
+    Layout ancho (el de get_dummies previo): strings object, float64, int64 y one-hot de stop_group.
+    """
+    out = expand_stop_codes(df, groups)
+    for col in out.columns:
+        kind = out[col].dtype.kind
+        if isinstance(out[col].dtype, pd.CategoricalDtype):
+            out[col] = out[col].astype(object)
+        elif kind == 'f':
+            out[col] = out[col].astype('float64')
+        elif kind in 'iu':
+            out[col] = out[col].astype('int64')
+    return out
+
+# -----------------------------------
+# Comparación de layouts
+# -----------------------------------
+def _parquet_bytes(df: pd.DataFrame) -> int:
+    buf = io.BytesIO()
+    df.to_parquet(buf, index=False)
+    return buf.tell()
+
+def compare_layouts(df: pd.DataFrame, groups: list) -> dict:
+    """
+    Memoria en pandas (deep) y tamaño Parquet del mismo dataset en layout ancho y compacto.
+    """
+    compact = compact_frame(df) if 'stop_group' in df.columns else df
+    wide = widen_frame(compact, groups)
+    # Por layout, su dict de medidas; además filas y ratios
+    report: dict = {}
+    for name, frame in (('wide', wide), ('compact', compact)):
+        report[name] = {
+            'columns': frame.shape[1],
+            'memory_bytes': int(frame.memory_usage(index=True, deep=True).sum()),
+            'parquet_bytes': _parquet_bytes(frame),
+        }
+    report['rows'] = len(df)
+    report['memory_ratio'] = round(report['wide']['memory_bytes'] / report['compact']['memory_bytes'], 2)
+    report['parquet_ratio'] = round(report['wide']['parquet_bytes'] / report['compact']['parquet_bytes'], 2)
+    return report
@@ -0,0 +1,316 @@
+"""
+src/datalake.py
+Almacenamiento Parquet particionado estilo Hive para los datasets merged y final:
+- Particiones linea=<línea>/date=<YYYY-MM-DD> con uno o más part-*.parquet
+- Manifest `_manifest.json` con archivos, filas y rango de `_time` por partición
+- Lectura con poda de particiones vía manifest (sin listar directorios),
+  filtro de `_time` empujado a Parquet y proyección de columnas
+- Respaldo a los archivos únicos legacy (merged_*.parquet, dataset_final_*.parquet)
+- Metadatos del dataset en el manifest (p.ej. esquema compacto y lista de grupos de paro)
+- Reescritura completa en un directorio de generación nuevo (`gen-<ts>/`); el manifest apunta a
+  su generación (`base`) y se publica con un solo `replace`, así `exists(root)` nunca es falso
+  y un lector ve la generación anterior o la nueva completa. La generación anterior se conserva
+  hasta la siguiente reescritura (lectores que ya resolvieron sus archivos)
+- Lock entre procesos por dataset (`<dataset>.lock`, ver file_lock.py): cada DatasetWriter lo
+  toma de principio a fin, y quien además actualiza estado propio (high-water marks del merge,
+  estado del feature store) envuelve lectura del estado + escritura en `locked(root)`
+"""
+import datetime
+import hashlib
+import json
+import shutil
+from pathlib import Path
+from typing import Optional
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+from file_lock import locked as _file_locked
+
+PARTITION_COLS = ['linea', 'date']
+MANIFEST_NAME = '_manifest.json'
+GENERATION_PREFIX = 'gen-'
+
+# Rutas de los datasets (relativas a la raíz del proyecto, como el resto de scripts)
+MERGED_LAKE = Path('data/processed/merged')
+FINAL_LAKE  = Path('data/processed/final/dataset')
+
+# -----------------------------------
+# Manifest
+# -----------------------------------
+def manifest_path(root: Path) -> Path:
+    return Path(root) / MANIFEST_NAME
+
+def load_manifest(root: Path) -> dict:
+    path = manifest_path(root)
+    if not path.exists():
+        return {'version': 0, 'columns': [], 'partitions': {}}
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def _save_manifest(root: Path, manifest: dict):
+    manifest['version'] = manifest.get('version', 0) + 1
+    manifest['updated'] = datetime.datetime.now().isoformat()
+    tmp = manifest_path(root).with_suffix('.tmp')
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+    tmp.replace(manifest_path(root))
+
+def lock_path(root: Path) -> Path:
+    root = Path(root)
+    return root.with_name(root.name + '.lock')
+
+def locked(root: Path):
+    """
+    Lock exclusivo (entre procesos, reentrante en el hilo) para leer-modificar-escribir el
+    manifest del dataset y el estado que dependa de él. Las lecturas no lo necesitan.
+    """
+    return _file_locked(lock_path(root))
+
+def exists(root: Path) -> bool:
+    return manifest_path(root).exists()
+
+def data_dir(root: Path, manifest: dict) -> Path:
+    # Directorio de las particiones: la generación del manifest (la raíz en datasets anteriores)
+    return Path(root) / manifest.get('base', '')
+
+def _prune_generations(root: Path, keep: set):
+    """
+    Borra las generaciones que no están en `keep` (la generación '' son las particiones
+    linea=... directamente bajo la raíz, del layout anterior).
+    """
+    for entry in Path(root).iterdir():
+        if not entry.is_dir():
+            continue
+        generation = entry.name if entry.name.startswith(GENERATION_PREFIX) else ('' if entry.name.startswith('linea=') else None)
+        if generation is not None and generation not in keep:
+            shutil.rmtree(entry, ignore_errors=True)
+
+# -----------------------------------
+# Escritura
+# -----------------------------------
+def _write_parts(df: pd.DataFrame, root: Path, manifest: dict) -> list:
+    stamp = datetime.datetime.now().strftime('%Y%m%dT%H%M%S%f')
+    df = df.assign(date=df['_time'].dt.strftime('%Y-%m-%d'))
+    # Categorías como string plano: Parquet ya las codifica por diccionario y así el ancho
+    # de índice no varía entre parts (se recuperan con read_partitioned(categorical=True))
+    cats = [c for c in df.columns if isinstance(df[c].dtype, pd.CategoricalDtype) and c not in PARTITION_COLS]
+    if cats:
+        df = df.astype({c: object for c in cats})
+    written = []
+    for (linea, date), part in df.groupby(PARTITION_COLS, sort=False, observed=True):
+        key = f'linea={linea}/date={date}'
+        (root / key).mkdir(parents=True, exist_ok=True)
+        fname = f'part-{stamp}.parquet'
+        part.drop(columns=PARTITION_COLS).to_parquet(root / key / fname, index=False)
+        entry = manifest['partitions'].setdefault(
+            key, {'linea': str(linea), 'date': date, 'files': [], 'rows': 0, 'min_time': None, 'max_time': None})
+        entry['files'].append(fname)
+        entry['rows'] += len(part)
+        t_min, t_max = part['_time'].min().isoformat(), part['_time'].max().isoformat()
+        entry['min_time'] = t_min if entry['min_time'] is None else min(entry['min_time'], t_min)
+        entry['max_time'] = t_max if entry['max_time'] is None else max(entry['max_time'], t_max)
+        written.append(root / key / fname)
+    manifest['columns'] = list(df.columns.drop('date'))
+    return written
+
+class DatasetWriter:
+    """
+    Escribe un dataset particionado por chunks. mode='append' agrega parts a la generación
+    actual; mode='replace' escribe una generación nueva y la publica al cerrar.
+    El manifest sólo se publica si el bloque termina sin error. Se usa siempre con `with`:
+    el lock del dataset se toma en `__enter__` y se suelta en `__exit__`.
+    """
+    def __init__(self, root: Path, mode: str = 'append', meta: Optional[dict] = None):
+        self.root = Path(root)
+        self.mode = mode
+        self.meta = meta
+        self.written: list = []
+        self.previous_base = ''
+        self.manifest: dict = {}
+        self.target = self.root
+        self._lock = locked(self.root)
+
+    def _open(self):
+        if self.mode == 'replace':
+            previous = load_manifest(self.root)
+            self.previous_base = previous.get('base', '')
+            base = GENERATION_PREFIX + datetime.datetime.now().strftime('%Y%m%dT%H%M%S%f')
+            self.manifest = {'version': previous.get('version', 0), 'base': base, 'columns': [], 'partitions': {},
+                             'created': datetime.datetime.now().isoformat()}
+        else:
+            self.manifest = load_manifest(self.root)
+        self.target = data_dir(self.root, self.manifest)
+        if self.meta is not None:
+            self.manifest['meta'] = dict(self.meta)
+        self.target.mkdir(parents=True, exist_ok=True)
+
+    def update_meta(self, **fields):
+        # Estado que debe publicarse junto con los parts (p. ej. high-water marks del merge)
+        self.manifest.setdefault('meta', {}).update(fields)
+
+    def write(self, df: pd.DataFrame):
+        if not df.empty:
+            self.written.extend(_write_parts(df, self.target, self.manifest))
+
+    def close(self):
+        # Un append sin filas no cambia la versión del dataset (no invalida caches)
+        if self.mode == 'append' and not self.written:
+            return
+        self.root.mkdir(parents=True, exist_ok=True)
+        _save_manifest(self.root, self.manifest)
+        if self.mode == 'replace':
+            _prune_generations(self.root, {self.manifest['base'], self.previous_base})
+
+    def __enter__(self):
+        # El manifest se lee y se publica con el lock tomado: otro proceso no puede intercalar su escritura
+        self._lock.__enter__()
+        try:
+            self._open()
+        except BaseException:
+            self._lock.__exit__(None, None, None)
+            raise
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            if exc_type is None:
+                self.close()
+            elif self.mode == 'replace':
+                shutil.rmtree(self.target, ignore_errors=True)
+        finally:
+            self._lock.__exit__(None, None, None)
+        return False
+
+def append_partitioned(df: pd.DataFrame, root: Path) -> list:
+    """
+    Agrega `df` como parts nuevos en sus particiones (linea, date) y actualiza el manifest.
+    """
+    with DatasetWriter(root, mode='append') as writer:
+        writer.write(df)
+    return writer.written
+
+def replace_partitioned(df: pd.DataFrame, root: Path, meta: Optional[dict] = None) -> list:
+    """
+    Reescribe el dataset completo en una generación nueva y la publica en el manifest.
+    """
+    with DatasetWriter(root, mode='replace', meta=meta) as writer:
+        writer.write(df)
+    return writer.written
+
+# -----------------------------------
+# Lectura
+# -----------------------------------
+def partition_files(root: Path, line: Optional[str] = None, start=None, end=None) -> list:
+    """
+    Archivos de las particiones que pueden contener filas de `line` entre `start` y `end`,
+    usando sólo el manifest.
+    """
+    root = Path(root)
+    manifest = load_manifest(root)
+    base = data_dir(root, manifest)
+    start = pd.Timestamp(start) if start is not None else None
+    end = pd.Timestamp(end) if end is not None else None
+    files: list = []
+    for key, p in manifest['partitions'].items():
+        if line is not None and p['linea'] != line:
+            continue
+        if start is not None and pd.Timestamp(p['max_time']) < start:
+            continue
+        if end is not None and pd.Timestamp(p['min_time']) > end:
+            continue
+        files.extend(str(base / key / f) for f in p['files'])
+    return files
+
+def open_dataset(root: Path, line: Optional[str] = None, start=None, end=None):
+    """
+    pyarrow Dataset sólo con las particiones necesarias (None si no hay ninguna).
+    """
+    root = Path(root)
+    files = partition_files(root, line, start, end)
+    if not files:
+        return None
+    # La base de las particiones es el prefijo común (la generación del manifest leído)
+    base = Path(files[0]).parent.parent.parent
+    partitioning = ds.partitioning(pa.schema([('linea', pa.string()), ('date', pa.string())]), flavor='hive')
+    return ds.dataset(files, format='parquet', partitioning=partitioning, partition_base_dir=str(base))
+
+def time_filter(dataset, start=None, end=None):
+    time_type = dataset.schema.field('_time').type
+    filt = None
+    if start is not None:
+        filt = ds.field('_time') >= pa.scalar(pd.Timestamp(start), type=time_type)
+    if end is not None:
+        cond = ds.field('_time') <= pa.scalar(pd.Timestamp(end), type=time_type)
+        filt = cond if filt is None else filt & cond
+    return filt
+
+def read_partitioned(root: Path, line: Optional[str] = None, start=None, end=None, columns: Optional[list] = None,
+                     categorical: bool = False) -> pd.DataFrame:
+    """
+    Lee sólo las particiones necesarias, empuja el filtro de `_time` al lector Parquet
+    y proyecta `columns` (incluye `linea` si se pide). Con `categorical` las columnas
+    de texto se devuelven como categorías directamente desde el diccionario Parquet.
+    """
+    dataset = open_dataset(root, line, start, end)
+    if dataset is None:
+        return pd.DataFrame(columns=columns or load_manifest(root).get('columns', []))
+    if columns is None:
+        columns = [c for c in dataset.schema.names if c != 'date']
+    return dataset.to_table(columns=columns, filter=time_filter(dataset, start, end)).to_pandas(
+        strings_to_categorical=categorical)
+
+def iter_batches(root: Path, line: Optional[str] = None, start=None, end=None, columns: Optional[list] = None,
+                 batch_rows: int = 65_536):
+    """
+    Recorre el dataset en record batches de hasta `batch_rows` filas (DataFrames),
+    sin materializar la tabla completa.
+    """
+    dataset = open_dataset(root, line, start, end)
+    if dataset is None:
+        return
+    if columns is None:
+        columns = [c for c in dataset.schema.names if c != 'date']
+    for batch in dataset.to_batches(columns=columns, filter=time_filter(dataset, start, end), batch_size=batch_rows):
+        if batch.num_rows:
+            yield batch.to_pandas()
+
+def read_dataset(root: Path, legacy_dir: Path, legacy_pattern: str, line: Optional[str] = None,
+                 start=None, end=None, columns: Optional[list] = None, categorical: bool = False) -> pd.DataFrame:
+    """
+    Lee del dataset particionado si existe; si no, del archivo único legacy más reciente.
+    """
+    if exists(root):
+        return read_partitioned(root, line=line, start=start, end=end, columns=columns, categorical=categorical)
+    files = sorted(Path(legacy_dir).glob(legacy_pattern), key=lambda f: f.stat().st_mtime)
+    if not files:
+        raise FileNotFoundError(f"No se encontró dataset en {root} ni archivo {legacy_pattern} en {legacy_dir}")
+    df = pd.read_parquet(files[-1])
+    if line is not None:
+        df = df[df['linea'] == line].reset_index(drop=True)
+    if start is not None:
+        df = df[df['_time'] >= pd.Timestamp(start)]
+    if end is not None:
+        df = df[df['_time'] <= pd.Timestamp(end)]
+    return df if columns is None else df[columns]
+
+def dataset_meta(root: Path) -> dict:
+    return load_manifest(root).get('meta', {})
+
+def content_fingerprint(root: Path, line: Optional[str] = None) -> str:
+    """
+    Fingerprint del contenido (archivos, filas y rango de `_time` de cada partición, sólo de
+    `line` si se indica) a partir del manifest; no cambia si sólo se reescribe el manifest.
+    """
+    parts = load_manifest(root).get('partitions', {})
+    parts = {k: v for k, v in parts.items() if line is None or v.get('linea') == line}
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode()).hexdigest()[:16]
+
+def dataset_version(root: Path) -> str:
+    """
+    Versión barata del dataset (nombre y mtime del manifest) para caches e invalidación.
+    """
+    path = manifest_path(root)
+    if not path.exists():
+        return ''
+    st = path.stat()
+    return f"{root}:{st.st_size}:{st.st_mtime_ns}"
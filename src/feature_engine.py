@@ -0,0 +1,119 @@
+"""
+src/feature_engine.py
+Feature engineering vectorizado por dispositivo:
+- Ordena con índices NumPy (sin reordenar el DataFrame más de una vez)
+- lag_* por (linea, device_id) sin mezclar dispositivos (NaN en las primeras filas de cada grupo)
+- roll_mean_* por grupo con sumas acumuladas (una pasada NumPy, sin groupby().rolling())
+- Features de tiempo, cíclicos y turno de feature_pipeline.py (definición compartida con train y predict)
+"""
+from typing import Optional
+import numpy as np
+import pandas as pd
+from feature_pipeline import time_features
+
+GROUP_KEYS = ['linea', 'device_id']
+
+# -----------------------------------
+# Grupos
+# -----------------------------------
+def group_codes(df: pd.DataFrame, keys: list = GROUP_KEYS) -> tuple:
+    """
+    Código entero por combinación de `keys` (orden lexicográfico de los valores, no el de las
+    categorías de un Categorical; NaN es un grupo más, al final) y los códigos de cada key por separado.
+    """
+    codes = np.zeros(len(df), dtype=np.int64)
+    per_key = {}
+    for key in keys:
+        c, uniques = pd.factorize(np.asarray(df[key], dtype=object), sort=True, use_na_sentinel=False)
+        codes = codes * len(uniques) + c
+        per_key[key] = (c, len(uniques))
+    return codes, per_key
+
+def group_layout(sorted_groups: np.ndarray) -> tuple:
+    """
+    Para códigos de grupo contiguos: (inicio del grupo por fila, posición dentro del grupo).
+    """
+    n = len(sorted_groups)
+    new_group = np.ones(n, dtype=bool)
+    new_group[1:] = sorted_groups[1:] != sorted_groups[:-1]
+    starts = np.flatnonzero(new_group)
+    group_start = np.repeat(starts, np.diff(np.append(starts, n)))
+    return group_start, np.arange(n) - group_start
+
+# -----------------------------------
+# Lags y medias móviles
+# -----------------------------------
+def grouped_lag(values: np.ndarray, pos: np.ndarray, lag: int) -> np.ndarray:
+    out = np.full(len(values), np.nan, dtype=values.dtype if values.dtype.kind == 'f' else np.float64)
+    if lag < len(values):
+        out[lag:] = values[:len(values) - lag]
+    out[pos < lag] = np.nan
+    return out
+
+def grouped_rolling_means(values: np.ndarray, group_start: np.ndarray, windows: list) -> dict:
+    """
+    Medias móviles de cada ventana dentro de cada grupo (min_periods=1, ignora NaN),
+    como diferencia de una misma suma acumulada.
+    """
+    v = values.astype(np.float64)
+    valid = ~np.isnan(v)
+    has_nan = not valid.all()
+    csum = np.empty(len(v) + 1)
+    csum[0] = 0.0
+    np.cumsum(np.where(valid, v, 0.0) if has_nan else v, out=csum[1:])
+    ccnt = np.concatenate(([0], np.cumsum(valid))) if has_nan else np.empty(0, dtype=np.int64)
+    idx = np.arange(len(v))
+    means = {}
+    for w in windows:
+        lo = np.maximum(idx - w + 1, group_start)
+        total = csum[idx + 1] - csum[lo]
+        count = ccnt[idx + 1] - ccnt[lo] if has_nan else idx + 1 - lo
+        with np.errstate(invalid='ignore', divide='ignore'):
+            means[w] = np.where(count > 0, total / count, np.nan) if has_nan else total / count
+    return means
+
+# -----------------------------------
+# Pipeline
+# -----------------------------------
+def build_features(df: pd.DataFrame, lags: list, roll_windows: list, keys: list = GROUP_KEYS,
+                   devices: Optional[list] = None) -> pd.DataFrame:
+    """
+    lags, medias móviles y features de tiempo por (linea, device_id); descarta las primeras
+    max(lags) filas de cada grupo (lags incompletos). Devuelve el resultado ordenado por
+    (_time, linea, device_id). `devices` fija el orden de device_idx (por defecto, orden alfabético).
+    """
+    times = pd.to_datetime(df['_time'])
+    groups, per_key = group_codes(df, list(dict.fromkeys(keys + ['device_id'])))
+
+    # Orden de salida (por _time y grupo) y, dentro de él, orden por grupo para los features
+    order = np.lexsort((groups, times.array.asi8))
+    by_group = np.argsort(groups[order], kind='stable')
+    group_start, pos_sorted = group_layout(groups[order][by_group])
+    velocity = df['velocity_bpm'].to_numpy()[order][by_group]
+
+    # Posición en el orden por grupo de cada fila de salida; se descartan filas con lags incompletos
+    inverse = np.empty_like(by_group)
+    inverse[by_group] = np.arange(len(by_group))
+    inverse = inverse[pos_sorted[inverse] >= max(lags, default=0)]
+    rows = order[by_group[inverse]]
+    out = df.take(rows).reset_index(drop=True)
+    out['_time'] = pd.to_datetime(out['_time'])
+
+    # Convertir device_id a índice numérico (para embeddings), mismo orden que .astype('category')
+    if devices is None:
+        device_codes, n_devices = per_key['device_id']
+        device_codes = device_codes[rows]
+    else:
+        n_devices = len(devices)
+        device_codes = pd.Index(devices).get_indexer(out['device_id'])
+    out['device_idx'] = device_codes.astype(np.int8 if n_devices < 128 else np.int32)
+
+    # Lags (pasos de 30s) y rolling means dentro de cada dispositivo
+    for lag in lags:
+        out[f'lag_{lag}'] = grouped_lag(velocity, pos_sorted, lag)[inverse]
+    for w, means in grouped_rolling_means(velocity, group_start, roll_windows).items():
+        out[f'roll_mean_{w}'] = means[inverse]
+
+    for name, values in time_features(out['_time']).items():
+        out[name] = values
+    return out
@@ -0,0 +1,185 @@
+"""
+src/feature_pipeline.py
+Definición única de features para entrenamiento y pronóstico:
+- Features de tiempo y cíclicos (los usan prepare.py, train.py y el forecaster)
+- `FeaturePipeline`: orden de features, scaler y lags/roll_windows con los que se entrenó el modelo
+  - modo batch: DataFrame -> matriz (n, n_features) en el orden del modelo (train.py)
+  - modo incremental: matrices de tiempo y transformación afín del scaler para el
+    forecaster, sin trabajo de pandas por paso
+  - salida del modelo: un paso de 30 s (recursivo) o `n_blocks` medias de `block_steps` pasos
+    (modelo directo multi-horizonte, ver forecast_engine.DirectForecaster)
+- Se serializa junto al modelo (`pipeline_<fecha>.pkl`) como un dict simple
+"""
+from typing import Optional
+import joblib
+import numpy as np
+import pandas as pd
+from compact_schema import expand_stop_codes
+
+PIPELINE_VERSION = 1
+
+# Columnas de tiempo (se recalculan en cada paso del pronóstico)
+TIME_FEATURES = [
+    'hour', 'minute', 'dayofweek', 'is_weekend',
+    'hour_sin', 'hour_cos', 'minute_sin', 'minute_cos',
+    'dayofweek_sin', 'dayofweek_cos',
+]
+
+# Columnas que nunca son features del modelo
+EXCLUDED = ['_time', 'linea', 'velocity_bpm', 'shift']
+
+# -----------------------------------
+# Features de tiempo
+# -----------------------------------
+def time_features(times) -> dict:
+    """
+    Features de tiempo, cíclicos y turno para una Serie/índice de timestamps, con
+    aritmética entera sobre los segundos epoch (hora local si tiene zona horaria).
+    """
+    times = pd.DatetimeIndex(times)
+    if times.tz is not None and str(times.tz) != 'UTC':
+        times = times.tz_localize(None)
+    per_second = np.timedelta64(1, 's') // np.timedelta64(1, times.unit)
+    seconds = times.asi8 // per_second
+    hour = (seconds // 3600) % 24
+    minute = (seconds // 60) % 60
+    dayofweek = (seconds // 86400 + 3) % 7  # 1970-01-01 fue jueves
+    return {
+        'hour': hour.astype(np.int32),
+        'minute': minute.astype(np.int32),
+        'dayofweek': dayofweek.astype(np.int32),
+        'is_weekend': (dayofweek >= 5).astype(int),
+        'hour_sin': np.sin(2 * np.pi * hour / 24),
+        'hour_cos': np.cos(2 * np.pi * hour / 24),
+        'minute_sin': np.sin(2 * np.pi * minute / 60),
+        'minute_cos': np.cos(2 * np.pi * minute / 60),
+        'dayofweek_sin': np.sin(2 * np.pi * dayofweek / 7),
+        'dayofweek_cos': np.cos(2 * np.pi * dayofweek / 7),
+        # Turno: 'day' si entre 7 y 18, 'night' en otro caso
+        'shift': np.array(['night', 'day'], dtype=object)[((hour >= 7) & (hour < 19)).astype(np.int8)],
+    }
+
+def add_time_features(df: pd.DataFrame) -> pd.DataFrame:
+    df['_time'] = pd.to_datetime(df['_time'])
+    for name, values in time_features(df['_time']).items():
+        df[name] = values
+    return df
+
+# -----------------------------------
+# Pipeline
+# -----------------------------------
+class FeaturePipeline:
+    def __init__(self, lags: list, roll_windows: list, feature_names: Optional[list] = None, scaler=None,
+                 stop_groups: Optional[list] = None, block_steps: Optional[int] = None,
+                 n_blocks: Optional[int] = None):
+        self.lags = list(lags)
+        self.roll_windows = list(roll_windows)
+        self.feature_names = list(feature_names) if feature_names is not None else None
+        self.scaler = scaler
+        self.stop_groups = list(stop_groups or [])
+        self.block_steps = block_steps
+        self.n_blocks = n_blocks
+        self._compile()
+
+    def _compile(self):
+        """
+        Precalcula índices de columnas y la transformación afín del scaler.
+        """
+        if self.feature_names is None:
+            return
+        n = len(self.feature_names)
+        self.index = {name: j for j, name in enumerate(self.feature_names)}
+        scale = getattr(self.scaler, 'scale_', None)
+        mean = getattr(self.scaler, 'mean_', None)
+        # scaler.transform(X) == X * a + b
+        self.a = np.ones(n) if scale is None else 1.0 / np.asarray(scale, dtype=np.float64)
+        self.b = np.zeros(n) if mean is None else -np.asarray(mean, dtype=np.float64) * self.a
+        self.time_cols = [(name, self.index[name]) for name in TIME_FEATURES if name in self.index]
+
+    # -----------------------------------
+    # Modo batch (entrenamiento)
+    # -----------------------------------
+    def frame(self, df: pd.DataFrame) -> pd.DataFrame:
+        """
+        Completa las columnas derivadas: stop_* del esquema compacto y features de tiempo.
+        """
+        df = expand_stop_codes(df, self.stop_groups)
+        if any(name not in df.columns for name in TIME_FEATURES):
+            df = add_time_features(df)
+        return df
+
+    def select_features(self, df: pd.DataFrame) -> np.ndarray:
+        """
+        Fija el orden de features (numéricas, sin target ni columnas de texto/tiempo)
+        de un DataFrame ya completado con `frame` y devuelve su matriz sin escalar.
+        """
+        self.feature_names = df.drop(columns=EXCLUDED, errors='ignore').select_dtypes(include=['number']).columns.tolist()
+        self._compile()
+        return self.matrix(df, framed=True)
+
+    def fit_scaler(self, X: np.ndarray):
+        from sklearn.preprocessing import StandardScaler
+        self.scaler = StandardScaler().fit(X)
+        self._compile()
+        return self
+
+    def matrix(self, df: pd.DataFrame, framed: bool = False) -> np.ndarray:
+        """
+        Matriz sin escalar (n, n_features) en el orden del modelo.
+        """
+        if not framed:
+            df = self.frame(df)
+        return df[self.feature_names].to_numpy(dtype=np.float64)
+
+    def scale(self, X: np.ndarray) -> np.ndarray:
+        # Misma transformación afín en entrenamiento y pronóstico
+        return X * self.a + self.b
+
+    def transform(self, df: pd.DataFrame, framed: bool = False) -> np.ndarray:
+        return self.scale(self.matrix(df, framed))
+
+    # -----------------------------------
+    # Modo incremental (pronóstico)
+    # -----------------------------------
+    def static_row(self, last_row: pd.Series, dynamic: set) -> np.ndarray:
+        """
+        Valores (sin escalar) de los features que no cambian durante el pronóstico.
+        """
+        static = np.zeros(len(self.index))
+        for name, j in self.index.items():
+            if j not in dynamic:
+                static[j] = last_row[name]
+        return static
+
+    def time_matrix(self, times: pd.DatetimeIndex) -> dict:
+        """
+        Columnas de tiempo ya escaladas {índice de feature: valores} para todo el horizonte.
+        """
+        tf = time_features(times)
+        return {j: tf[name] * self.a[j] + self.b[j] for name, j in self.time_cols}
+
+    # -----------------------------------
+    # Serialización
+    # -----------------------------------
+    def to_dict(self) -> dict:
+        return {
+            'version': PIPELINE_VERSION,
+            'lags': self.lags,
+            'roll_windows': self.roll_windows,
+            'feature_names': self.feature_names,
+            'scaler': self.scaler,
+            'stop_groups': self.stop_groups,
+            'block_steps': self.block_steps,
+            'n_blocks': self.n_blocks,
+        }
+
+    def save(self, path):
+        joblib.dump(self.to_dict(), path)
+
+    @classmethod
+    def load(cls, path):
+        state = joblib.load(path)
+        if state.get('version') != PIPELINE_VERSION:
+            raise ValueError(f"Versión de pipeline no soportada en {path}: {state.get('version')}")
+        return cls(state['lags'], state['roll_windows'], state['feature_names'], state['scaler'],
+                   state.get('stop_groups'), state.get('block_steps'), state.get('n_blocks'))
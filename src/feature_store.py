@@ -0,0 +1,177 @@
+"""
+src/feature_store.py
+Feature store incremental del dataset final:
+- Guarda por dispositivo las últimas max(lags, roll_windows) filas de merged (`feature_tail.parquet`)
+  y el último `_time` con features (`feature_state.json`)
+- En cada corrida lee de merged sólo las filas posteriores, calcula sus features con la cola
+  guardada como contexto y las agrega como parts nuevos del dataset final
+- Recalcula todo si cambian `lags`/`roll_windows` (fingerprint de config), si falta el estado o
+  si el dataset merged cambió de contenido. Un merge completo reescribe merged (y su `created`)
+  en cada corrida del DAG; si las filas de la cola guardada siguen iguales en el merged nuevo,
+  lo anterior no cambió y basta el incremental
+"""
+import hashlib
+import json
+from pathlib import Path
+from typing import Optional
+import pandas as pd
+from feature_engine import GROUP_KEYS, build_features
+import datalake
+
+# Versión de la definición de features: cambiarla fuerza un recálculo completo
+FEATURES_VERSION = 2
+
+
+def config_fingerprint(lags: list, roll_windows: list) -> str:
+    payload = json.dumps({'lags': list(lags), 'roll_windows': list(roll_windows), 'version': FEATURES_VERSION},
+                         sort_keys=True)
+    return hashlib.sha256(payload.encode()).hexdigest()[:16]
+
+
+class FeatureStore:
+    def __init__(self, final_dir: Path, lags: list, roll_windows: list,
+                 merged_lake: Path = datalake.MERGED_LAKE, final_lake: Path = datalake.FINAL_LAKE):
+        self.final_dir = Path(final_dir)
+        self.lags = list(lags)
+        self.roll_windows = list(roll_windows)
+        self.merged_lake = Path(merged_lake)
+        self.final_lake = Path(final_lake)
+        self.state_path = self.final_dir / 'feature_state.json'
+        self.tail_path = self.final_dir / 'feature_tail.parquet'
+        self.fingerprint = config_fingerprint(self.lags, self.roll_windows)
+        # Filas de contexto por dispositivo para lags y medias móviles
+        self.tail_rows = max(self.lags + self.roll_windows)
+
+    # -----------------------------------
+    # Estado
+    # -----------------------------------
+    def load_state(self) -> dict:
+        if not self.state_path.exists() or not self.tail_path.exists():
+            return {}
+        with open(self.state_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def _save(self, merged: pd.DataFrame, devices: list, last_time: dict):
+        tail = self._tail(merged)
+        tmp = self.tail_path.with_suffix('.tmp')
+        tail.to_parquet(tmp, index=False)
+        tmp.replace(self.tail_path)
+        state = {
+            'fingerprint': self.fingerprint,
+            'merged_created': datalake.load_manifest(self.merged_lake).get('created'),
+            'devices': devices,
+            'last_time': {dev: ts.isoformat() for dev, ts in last_time.items()},
+        }
+        tmp = self.state_path.with_suffix('.tmp')
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(state, f, indent=2)
+        tmp.replace(self.state_path)
+
+    def _tail(self, df: pd.DataFrame) -> pd.DataFrame:
+        tail = df.sort_values('_time', kind='stable').groupby(GROUP_KEYS, sort=False, observed=True).tail(self.tail_rows)
+        return tail.astype({c: object for c in tail.columns if isinstance(tail[c].dtype, pd.CategoricalDtype)})
+
+    def tail_matches(self, state: dict, read_merged) -> bool:
+        """
+        True si merged tiene, hasta el último `_time` con features de cada dispositivo, las mismas
+        filas finales que la cola guardada: el contenido ya procesado no cambió.
+        """
+        stored = pd.read_parquet(self.tail_path)
+        if stored.empty:
+            return False
+        merged = read_merged(start=stored['_time'].min())
+        last_time = merged['device_id'].astype(object).map({dev: pd.Timestamp(ts) for dev, ts in state['last_time'].items()})
+        current = self._tail(merged[(last_time.notna() & (merged['_time'] <= last_time)).to_numpy()])
+        if len(current) != len(stored) or list(current.columns) != list(stored.columns):
+            return False
+        order = GROUP_KEYS + ['_time']
+        current = current.sort_values(order, kind='stable').reset_index(drop=True)
+        stored = stored.sort_values(order, kind='stable').reset_index(drop=True)
+        return current.astype(stored.dtypes.to_dict()).equals(stored)
+
+    def needs_full(self, state: dict, read_merged) -> str:
+        """
+        Motivo por el que hace falta un recálculo completo, o '' si basta el incremental.
+        """
+        if not state:
+            return 'sin estado previo'
+        if state.get('fingerprint') != self.fingerprint:
+            return 'cambió la definición de features (lags/roll_windows)'
+        if not datalake.exists(self.final_lake):
+            return 'no existe el dataset final'
+        if state.get('merged_created') != datalake.load_manifest(self.merged_lake).get('created'):
+            if not self.tail_matches(state, read_merged):
+                return 'el dataset merged se reescribió con otro contenido'
+            print("[PREP] El dataset merged se reescribió con el mismo contenido; se sigue en incremental")
+        return ''
+
+    # -----------------------------------
+    # Cálculo
+    # -----------------------------------
+    def _meta(self) -> dict:
+        meta = {k: v for k, v in datalake.dataset_meta(self.merged_lake).items() if k != 'high_water'}
+        return dict(meta, features=self.fingerprint)
+
+    def rebuild(self, merged: pd.DataFrame) -> pd.DataFrame:
+        # Mismo orden de device_idx que el persistido en el estado (y que usa el incremental)
+        devices = sorted(merged['device_id'].astype(object).unique())
+        df_final = build_features(merged, self.lags, self.roll_windows, devices=devices)
+        datalake.replace_partitioned(df_final, self.final_lake, meta=self._meta())
+        self._save(merged, devices, merged.groupby('device_id', observed=True)['_time'].max().to_dict())
+        return df_final
+
+    def _read_start(self, last_time: dict) -> Optional[pd.Timestamp]:
+        """
+        Desde dónde leer merged: el menor `_time` con features, o el inicio si merged tiene
+        dispositivos sin features previas (según el high-water del merge) o no lo informa.
+        """
+        merged_devices = datalake.dataset_meta(self.merged_lake).get('high_water')
+        if not last_time or merged_devices is None:
+            return None
+        new_devices = set(merged_devices) - set(last_time)
+        if new_devices:
+            print(f"[PREP] Dispositivos nuevos en merged ({', '.join(sorted(new_devices))}); se lee desde el inicio")
+            return None
+        return min(last_time.values())
+
+    def update(self, read_merged, full: bool = False) -> pd.DataFrame:
+        """
+        Agrega al dataset final los features de las filas nuevas de merged.
+        `read_merged(start=None)` lee merged (desde `start` si se indica).
+        Estado y dataset final se leen y actualizan bajo el lock del dataset final.
+        """
+        with datalake.locked(self.final_lake):
+            return self._update(read_merged, full)
+
+    def _update(self, read_merged, full: bool) -> pd.DataFrame:
+        state = self.load_state()
+        reason = 'solicitado' if full else self.needs_full(state, read_merged)
+        if reason:
+            print(f"[PREP] Recálculo completo de features ({reason})")
+            return self.rebuild(read_merged())
+
+        last_time = {dev: pd.Timestamp(ts) for dev, ts in state['last_time'].items()}
+        merged = read_merged(start=self._read_start(last_time))
+        cutoff = merged['device_id'].astype(object).map(last_time)
+        new = merged[(cutoff.isna() | (merged['_time'] > cutoff)).to_numpy()]
+        if new.empty:
+            print("[PREP] Sin filas nuevas en merged")
+            return new
+
+        # Contexto: cola guardada de cada dispositivo + filas nuevas; sólo se conservan las nuevas
+        tail = pd.read_parquet(self.tail_path)
+        devices = state['devices'] + sorted(set(new['device_id'].astype(object)) - set(state['devices']))
+        combined = pd.concat([tail, new.astype({c: object for c in new.columns
+                                                if isinstance(new[c].dtype, pd.CategoricalDtype)})],
+                             ignore_index=True)
+        features = build_features(combined, self.lags, self.roll_windows, devices=devices)
+        cutoff = features['device_id'].astype(object).map(last_time)
+        features = features[(cutoff.isna() | (features['_time'] > cutoff)).to_numpy()].reset_index(drop=True)
+
+        with datalake.DatasetWriter(self.final_lake, mode='append', meta=self._meta()) as writer:
+            writer.write(features)
+        for dev, ts in new.groupby('device_id', observed=True)['_time'].max().items():
+            last_time[dev] = max(ts, last_time.get(dev, ts))
+        self._save(combined, devices, last_time)
+        print(f"[PREP] {len(features)} filas nuevas con features agregadas en {len(writer.written)} archivos")
+        return features
@@ -0,0 +1,50 @@
+"""
+src/file_lock.py
+Lock exclusivo entre procesos sobre un archivo (`fcntl.flock`, `msvcrt.locking` en Windows):
+- Lo usan el registro de modelos y el data lake (manifest + estado de merge/features), que
+  escriben a la vez train_lines.py, el DAG, la API y `pipeline.py watch` en otro proceso
+- Reentrante dentro de un mismo hilo (p.ej. el feature store que reescribe el dataset final
+  mientras tiene tomado su lock); otros hilos del proceso esperan como otro proceso
+"""
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None  # type: ignore[assignment]
+    import msvcrt
+
+_guard = threading.Lock()
+_held: dict = {}  # ruta -> [RLock, profundidad, archivo abierto]
+
+
+@contextmanager
+def locked(path: Path):
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    key = str(path.resolve())
+    with _guard:
+        entry = _held.setdefault(key, [threading.RLock(), 0, None])
+    with entry[0]:
+        if entry[1] == 0:
+            f = open(path, 'a+')
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            else:
+                msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+            entry[2] = f
+        entry[1] += 1
+        try:
+            yield
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                f, entry[2] = entry[2], None
+                if fcntl is not None:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+                else:
+                    f.seek(0)
+                    msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+                f.close()
@@ -0,0 +1,118 @@
+"""
+src/forecast_cache.py
+Caché LRU de pronósticos en memoria:
+- Clave (línea, versión de modelo, versión de dataset); guarda el horizonte más largo calculado
+- Horizontes más cortos de la misma línea se sirven recortando el pronóstico guardado
+- Expulsión LRU por número de entradas y por tamaño total en bytes
+- Entradas de versiones anteriores se descartan al publicarse artefactos nuevos
+"""
+import hashlib
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import TYPE_CHECKING, Optional
+
+if TYPE_CHECKING:  # pandas sólo para anotaciones: importar la caché no lo carga
+    import pandas as pd
+
+STEPS_PER_HOUR = 60 * 2  # intervalos de 30s
+
+# -----------------------------------
+# Fingerprints de artefactos
+# -----------------------------------
+_hash_memo: dict = {}
+
+def file_hash(path: Path) -> str:
+    """
+    sha256 del contenido, memorizado por (ruta, tamaño, mtime) para no releer el archivo.
+    """
+    st = path.stat()
+    key = (str(path), st.st_size, st.st_mtime_ns)
+    if key not in _hash_memo:
+        h = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                h.update(chunk)
+        _hash_memo[key] = h.hexdigest()
+    return _hash_memo[key]
+
+def artifacts_version(paths) -> str:
+    h = hashlib.sha256()
+    for p in paths:
+        h.update(file_hash(p).encode())
+    return h.hexdigest()[:16]
+
+def dataset_fingerprint(paths) -> str:
+    """
+    Fingerprint barato (nombre, tamaño, mtime) de los parquet de los que depende el pronóstico.
+    """
+    h = hashlib.sha256()
+    for p in paths:
+        st = p.stat()
+        h.update(f"{p.name}:{st.st_size}:{st.st_mtime_ns}".encode())
+    return h.hexdigest()[:16]
+
+# -----------------------------------
+# Caché
+# -----------------------------------
+class ForecastCache:
+    def __init__(self, max_entries: int = 32, max_bytes: int = 64 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries: OrderedDict = OrderedDict()  # (line, model_v, data_v) -> (steps, DataFrame, nbytes)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, line: str, hours: int, model_version: str, data_version: str):
+        key = (line, model_version, data_version)
+        steps = hours * STEPS_PER_HOUR
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < steps:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1].iloc[:steps]
+
+    def put(self, line: str, df: 'pd.DataFrame', model_version: str, data_version: str):
+        key = (line, model_version, data_version)
+        nbytes = int(df.memory_usage(index=True, deep=True).sum())
+        with self._lock:
+            old = self._entries.get(key)
+            if old is not None:
+                if old[0] >= len(df):
+                    self._entries.move_to_end(key)
+                    return
+                self._bytes -= old[2]
+            self._entries[key] = (len(df), df, nbytes)
+            self._entries.move_to_end(key)
+            self._bytes += nbytes
+            self._evict()
+
+    def _evict(self):
+        while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+            _, (_, _, nbytes) = self._entries.popitem(last=False)
+            self._bytes -= nbytes
+
+    def retain(self, model_version: str, data_version: str, line: Optional[str] = None):
+        """
+        Descarta las entradas calculadas con otro dataset o con otro modelo
+        (sólo las de `line` si se indica: cada línea puede tener su propio modelo).
+        """
+        with self._lock:
+            stale = [k for k in self._entries
+                     if k[2] != data_version or (k[1] != model_version and line in (None, k[0]))]
+            for key in stale:
+                self._bytes -= self._entries.pop(key)[2]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {'entries': len(self._entries), 'bytes': self._bytes, 'hits': self.hits, 'misses': self.misses}
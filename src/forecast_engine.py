@@ -0,0 +1,314 @@
+"""
+src/forecast_engine.py
+Motor de pronóstico recursivo sin asignaciones por paso:
+- Historial de velocidad en un ring buffer NumPy de tamaño fijo (lags y medias móviles), sembrado
+  con las filas del dispositivo de la última fila: los lags de entrenamiento son por
+  (linea, device_id) (feature_engine.py), no sobre las filas intercaladas de la línea
+- Sumas móviles incrementales en lugar de recalcular cada ventana
+- Features de tiempo y cíclicos precalculados para todo el horizonte en una sola pasada
+- Orden de features, features de tiempo y scaler (afín, x * a + b) del FeaturePipeline
+  guardado con el modelo (ver feature_pipeline.py), el mismo usado en train.py
+- Modo batch: varias líneas avanzan en lockstep con una llamada al modelo por paso
+- También arranca desde un estado en memoria (cola de velocidad, última fila, límites acumulados
+  en `VelocityStats`) sin DataFrame del histórico, para la telemetría en vivo (telemetry.py)
+- Alternativa directa (`DirectForecaster`): un modelo multi-salida entrenado con `train.py --direct`
+  predice la media de cada bloque del horizonte desde la última fila, en una sola llamada al modelo
+  para todas las líneas en lugar de un paso secuencial por cada 30 s
+"""
+from typing import Optional
+import numpy as np
+import pandas as pd
+
+STEP = pd.Timedelta(seconds=30)
+
+# -----------------------------------
+# Estado inicial
+# -----------------------------------
+def device_velocity(history: pd.DataFrame) -> np.ndarray:
+    """
+    Velocidades (en orden de `_time`) del dispositivo de la última fila del histórico de una
+    línea, la misma secuencia sobre la que feature_engine calcula lags y medias móviles.
+    """
+    if 'device_id' in history.columns:
+        device = history['device_id'].to_numpy()
+        history = history[device == device[-1]]
+    return history['velocity_bpm'].to_numpy(dtype=np.float64)
+
+# -----------------------------------
+# Límites de validación
+# -----------------------------------
+def prediction_bounds(velocity: pd.Series) -> tuple:
+    """
+    Límites absolutos (histórico) y estadísticos (media ± 3σ) usados para recortar predicciones.
+    """
+    mean_vel = velocity.mean()
+    std_vel = velocity.std()
+    lower_bound = max(0, velocity.min() * 0.5)  # No menos del 50% del mínimo histórico
+    upper_bound = velocity.max() * 1.2          # No más del 120% del máximo histórico
+    return lower_bound, upper_bound, mean_vel - 3 * std_vel, mean_vel + 3 * std_vel
+
+class VelocityStats:
+    """
+    Mínimo, máximo, media y varianza (ddof=1, Welford) acumulados de la velocidad de una línea:
+    los mismos límites que `prediction_bounds` sin conservar el histórico.
+    """
+    def __init__(self, values: Optional[np.ndarray] = None):
+        self.n, self.mean, self.m2 = 0, 0.0, 0.0
+        self.min, self.max = np.inf, -np.inf
+        if values is not None and len(values):
+            self.extend(values)
+
+    def extend(self, values: np.ndarray):
+        # Combinación de dos grupos (Chan et al.) con la media y varianza del bloque nuevo
+        values = np.asarray(values, dtype=np.float64)
+        n, mean = len(values), values.mean()
+        m2 = ((values - mean) ** 2).sum()
+        total = self.n + n
+        delta = mean - self.mean
+        self.mean += delta * n / total
+        self.m2 += m2 + delta ** 2 * self.n * n / total
+        self.n = total
+        self.min, self.max = min(self.min, values.min()), max(self.max, values.max())
+
+    def push(self, value: float):
+        self.n += 1
+        delta = value - self.mean
+        self.mean += delta / self.n
+        self.m2 += delta * (value - self.mean)
+        self.min, self.max = min(self.min, value), max(self.max, value)
+
+    def bounds(self) -> tuple:
+        std = np.sqrt(self.m2 / (self.n - 1)) if self.n > 1 else np.nan
+        return max(0, self.min * 0.5), self.max * 1.2, self.mean - 3 * std, self.mean + 3 * std
+
+def clip_predictions(pred: np.ndarray, bounds: np.ndarray) -> np.ndarray:
+    """
+    Recorta un vector de predicciones (una por serie) con `bounds` de forma (n_series, 4).
+    """
+    pred = np.clip(pred, bounds[:, 0], bounds[:, 1])
+    return np.clip(pred, bounds[:, 2], bounds[:, 3])
+
+# -----------------------------------
+# Ring buffer de velocidad
+# -----------------------------------
+class VelocityRingBuffer:
+    """
+    Mantiene los últimos `size` valores de velocidad de cada serie (n_series, size)
+    y las sumas de cada ventana móvil. Todas las series avanzan al mismo paso.
+    """
+    def __init__(self, histories: list, lags: list, roll_windows: list):
+        self.lags = np.asarray(lags, dtype=np.int64)
+        self.windows = np.asarray(roll_windows, dtype=np.int64)
+        self.size = int(max(list(lags) + list(roll_windows)))
+        for history in histories:
+            if len(history) < self.size:
+                raise ValueError(f"Se requieren al menos {self.size} registros históricos, hay {len(history)}")
+        self.buf = np.array([h[-self.size:] for h in histories], dtype=np.float64)
+        self.pos = 0  # próxima posición a escribir (= la más antigua)
+        self.sums = np.array(
+            [[row[self.size - w:].sum() for w in self.windows] for row in self.buf],
+            dtype=np.float64,
+        ).reshape(len(histories), len(self.windows))
+
+    def lag_values(self, out: np.ndarray) -> np.ndarray:
+        np.take(self.buf, (self.pos - self.lags) % self.size, axis=1, out=out)
+        return out
+
+    def roll_means(self, out: np.ndarray) -> np.ndarray:
+        np.divide(self.sums, self.windows, out=out)
+        return out
+
+    def push(self, values: np.ndarray):
+        # Valor que sale de cada ventana antes de sobrescribir la posición más antigua
+        self.sums += values[:, None] - self.buf[:, (self.pos - self.windows) % self.size]
+        self.buf[:, self.pos] = values
+        self.pos = (self.pos + 1) % self.size
+
+# -----------------------------------
+# Pronóstico recursivo
+# -----------------------------------
+class RecursiveForecaster:
+    """
+    Pronóstico multi-step de 30 s en 30 s reutilizando buffers preasignados.
+    Varias líneas avanzan en lockstep: cada paso es una sola llamada al modelo
+    con un tensor (n_lines, n_features).
+    """
+    def __init__(self, model, pipeline, max_change_percent: float = 20):
+        self.model = model
+        self.pipeline = pipeline
+        self.feature_names = pipeline.feature_names
+        self.lags = pipeline.lags
+        self.roll_windows = pipeline.roll_windows
+        self.max_change = max_change_percent / 100
+        self.a, self.b = pipeline.a, pipeline.b
+
+        index = pipeline.index
+        lag_pairs = np.array([(k, index[f'lag_{lag}']) for k, lag in enumerate(self.lags)
+                              if f'lag_{lag}' in index], dtype=np.int64).reshape(-1, 2)
+        roll_pairs = np.array([(k, index[f'roll_mean_{w}']) for k, w in enumerate(self.roll_windows)
+                               if f'roll_mean_{w}' in index], dtype=np.int64).reshape(-1, 2)
+        self.lag_k, self.lag_j = lag_pairs[:, 0], lag_pairs[:, 1]
+        self.roll_k, self.roll_j = roll_pairs[:, 0], roll_pairs[:, 1]
+        self.dynamic = set(self.lag_j) | set(self.roll_j) | {j for _, j in pipeline.time_cols}
+        # Velocidades del dispositivo necesarias para el primer paso (lag y ventana más largos)
+        self.min_history = int(max(list(self.lags) + list(self.roll_windows)))
+
+    def _base_matrix(self, last_row, times: pd.DatetimeIndex) -> np.ndarray:
+        """
+        Matriz (steps, n_features) ya escalada con features estáticos y de tiempo;
+        sólo las columnas de lags y rollings se completan en cada paso.
+        """
+        static = self.pipeline.static_row(last_row, self.dynamic)
+        base = np.repeat(self.pipeline.scale(static)[None, :], len(times), axis=0)
+        for j, values in self.pipeline.time_matrix(times).items():
+            base[:, j] = values
+        return base
+
+    def forecast(self, df: pd.DataFrame, steps: int) -> pd.DataFrame:
+        """
+        `df` es el histórico de una línea ordenado por `_time`; devuelve `_time` y la predicción.
+        """
+        result = self.forecast_batch({0: df}, steps)
+        if 0 not in result:
+            raise ValueError(f"Se requieren al menos {self.min_history} registros históricos del dispositivo")
+        return result[0]
+
+    def forecast_batch(self, histories: dict, steps: int, progress=None) -> dict:
+        """
+        `histories` mapea cada línea a su histórico ordenado por `_time`;
+        devuelve un DataFrame (`_time`, `predicted_velocity_bpm`) por línea.
+        `progress(fracción)` se invoca cada 120 pasos (1 h) si se indica.
+        Las líneas sin histórico suficiente se omiten (ver `forecast_states`).
+        """
+        states = {
+            k: {'velocity': device_velocity(f), 'last_row': f.iloc[-1],
+                'last_time': pd.Timestamp(f['_time'].iloc[-1]), 'bounds': prediction_bounds(f['velocity_bpm'])}
+            for k, f in histories.items()
+        }
+        return self.forecast_states(states, steps, progress)
+
+    def forecast_states(self, states: dict, steps: int, progress=None) -> dict:
+        """
+        Igual que `forecast_batch` desde el estado de cada línea: `velocity` (al menos las últimas
+        max(lags, roll_windows) velocidades del dispositivo de `last_row`), `last_row` (features
+        de la última fila), `last_time` y `bounds` (ver `prediction_bounds`).
+        Una línea con menos velocidades se omite con un aviso y no aparece en el resultado,
+        sin cortar el pronóstico del resto del batch.
+        """
+        keys = []
+        for k, state in states.items():
+            if len(state['velocity']) < self.min_history:
+                print(f"[PREDICT] {k}: {len(state['velocity'])} registros del dispositivo "
+                      f"{state['last_row'].get('device_id')}, se requieren {self.min_history}; se omite")
+            else:
+                keys.append(k)
+        if not keys:
+            return {}
+        n = len(keys)
+        bounds = np.array([states[k]['bounds'] for k in keys], dtype=np.float64)
+        ring = VelocityRingBuffer([states[k]['velocity'] for k in keys], self.lags, self.roll_windows)
+
+        times = [pd.date_range(states[k]['last_time'] + STEP, periods=steps, freq=STEP) for k in keys]
+        # (steps, n_lines, n_features): base[i] es el bloque contiguo del paso i
+        base = np.stack([self._base_matrix(states[k]['last_row'], t) for k, t in zip(keys, times)], axis=1)
+
+        lag_buf = np.empty((n, len(self.lags)))
+        roll_buf = np.empty((n, len(self.roll_windows)))
+        a_lag, b_lag = self.a[self.lag_j], self.b[self.lag_j]
+        a_roll, b_roll = self.a[self.roll_j], self.b[self.roll_j]
+        x = np.empty((n, len(self.feature_names)), dtype=np.float32)
+        preds = np.empty((steps, n), dtype=np.float64)
+        last_pred = None
+
+        for i in range(steps):
+            row = base[i]
+            ring.lag_values(lag_buf)
+            row[:, self.lag_j] = lag_buf[:, self.lag_k] * a_lag + b_lag
+            ring.roll_means(roll_buf)
+            row[:, self.roll_j] = roll_buf[:, self.roll_k] * a_roll + b_roll
+            x[:] = row
+
+            # predict_on_batch reutiliza la función compilada sin el overhead de model.predict
+            y_pred = np.asarray(self.model.predict_on_batch(x), dtype=np.float64)[:, 0]
+            y_pred = clip_predictions(y_pred, bounds)
+
+            if last_pred is None:
+                last_pred = y_pred
+            # Limitar el cambio porcentual entre predicciones consecutivas
+            delta = last_pred * self.max_change
+            y_pred = np.clip(y_pred, last_pred - delta, last_pred + delta)
+
+            ring.push(y_pred)
+            preds[i] = y_pred
+            last_pred = y_pred
+            if progress is not None and (i + 1) % 120 == 0:
+                progress((i + 1) / steps)
+
+        return {
+            k: pd.DataFrame({'_time': t, 'predicted_velocity_bpm': preds[:, c]})
+            for c, (k, t) in enumerate(zip(keys, times))
+        }
+
+# -----------------------------------
+# Pronóstico directo multi-horizonte
+# -----------------------------------
+class DirectForecaster:
+    """
+    Pronóstico de todo el horizonte en una sola pasada: el modelo devuelve `n_blocks` medias de
+    `block_steps` pasos de 30 s a partir de los features de la última fila de cada línea. Cada
+    bloque se recorta con los mismos límites que el recursivo y se repite en sus pasos de 30 s.
+    Misma interfaz que `RecursiveForecaster` (`forecast`, `forecast_batch`, `forecast_states`).
+    """
+    def __init__(self, model, pipeline):
+        if not pipeline.block_steps or not pipeline.n_blocks:
+            raise ValueError("El pipeline no corresponde a un modelo directo (sin block_steps/n_blocks)")
+        self.model = model
+        self.pipeline = pipeline
+        self.feature_names = pipeline.feature_names
+        self.block_steps = pipeline.block_steps
+        self.n_blocks = pipeline.n_blocks
+        self.horizon_steps = self.block_steps * self.n_blocks
+
+    def forecast(self, df: pd.DataFrame, steps: int) -> pd.DataFrame:
+        return self.forecast_batch({0: df}, steps)[0]
+
+    def forecast_batch(self, histories: dict, steps: int, progress=None) -> dict:
+        states = {
+            k: {'last_row': f.iloc[-1], 'last_time': pd.Timestamp(f['_time'].iloc[-1]),
+                'bounds': prediction_bounds(f['velocity_bpm'])}
+            for k, f in histories.items()
+        }
+        return self.forecast_states(states, steps, progress)
+
+    def forecast_states(self, states: dict, steps: int, progress=None) -> dict:
+        """
+        Desde `last_row`, `last_time` y `bounds` de cada línea (`velocity` no hace falta).
+        """
+        if steps > self.horizon_steps:
+            raise ValueError(f"El modelo directo cubre {self.horizon_steps} pasos "
+                             f"({self.horizon_steps / 120:g} h), se pidieron {steps}")
+        keys = list(states)
+        bounds = np.array([states[k]['bounds'] for k in keys], dtype=np.float64)
+        x = self.pipeline.scale(np.stack([self.pipeline.static_row(states[k]['last_row'], set()) for k in keys]))
+
+        # (n_lines, n_blocks) en una llamada; sólo se calculan los bloques que cubren `steps`
+        n_blocks = -(-steps // self.block_steps)
+        blocks = np.asarray(self.model.predict_on_batch(x.astype(np.float32)), dtype=np.float64)[:, :n_blocks]
+        blocks = clip_predictions(blocks.T, bounds).T
+        preds = np.repeat(blocks, self.block_steps, axis=1)[:, :steps]
+        if progress is not None:
+            progress(1.0)
+
+        times = [pd.date_range(states[k]['last_time'] + STEP, periods=steps, freq=STEP) for k in keys]
+        return {
+            k: pd.DataFrame({'_time': t, 'predicted_velocity_bpm': preds[c]})
+            for c, (k, t) in enumerate(zip(keys, times))
+        }
+
+def make_forecaster(model, pipeline):
+    """
+    Forecaster según la salida del modelo guardada en el pipeline: directo si predice bloques.
+    """
+    if pipeline.block_steps:
+        return DirectForecaster(model, pipeline)
+    return RecursiveForecaster(model, pipeline)
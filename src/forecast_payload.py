@@ -0,0 +1,144 @@
+"""
+src/forecast_payload.py
+Serialización del pronóstico para /forecast/data, en chunks para responder con streaming:
+- `records`: lista de objetos {_time, predicted_velocity_bpm} (formato anterior, `_time` ISO 8601)
+- `columnar`: un arreglo por columna, `_time` en milisegundos epoch y velocidad redondeada
+  a 2 decimales; sin repetir claves por punto
+- `arrow`: stream IPC de Apache Arrow (pyarrow), `_time` timestamp[ms] y velocidad float32
+- LTTB (Largest-Triangle-Three-Buckets) para bajar a `points` puntos conservando la forma
+  (picos y paros) de la curva
+- gzip incremental: cada chunk se comprime y se vacía al cliente sin esperar al resto
+"""
+import hashlib
+import io
+import json
+import zlib
+from typing import Optional
+import numpy as np
+
+FORMATS = {
+    'records': 'application/json',
+    'columnar': 'application/json',
+    'arrow': 'application/vnd.apache.arrow.stream',
+}
+CHUNK_ROWS = 256
+
+# -----------------------------------
+# Downsampling
+# -----------------------------------
+def lttb(x: np.ndarray, y: np.ndarray, n_out: int) -> np.ndarray:
+    """
+    Índices de los `n_out` puntos elegidos por LTTB: el primero, el último y, en cada bucket
+    intermedio, el que forma el triángulo de mayor área con el punto elegido antes y el
+    promedio del bucket siguiente.
+    """
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n) if n_out >= n else np.linspace(0, n - 1, max(n_out, 1)).astype(np.int64)
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)  # n_out - 2 buckets sobre los puntos interiores
+    # Promedio de cada bucket (una pasada); el del último es el punto final
+    counts = np.diff(edges)
+    avg_x = np.append(np.add.reduceat(x[1:n - 1], edges[:-1] - 1) / counts, x[n - 1])
+    avg_y = np.append(np.add.reduceat(y[1:n - 1], edges[:-1] - 1) / counts, y[n - 1])
+    xs, ys, bounds = x.tolist(), y.tolist(), edges.tolist()
+    idx = [0] * n_out
+    idx[-1] = n - 1
+    a = 0
+    for i in range(n_out - 2):
+        ax, ay, cx, cy = xs[a], ys[a], avg_x[i + 1], avg_y[i + 1]
+        best, area = bounds[i], -1.0
+        for j in range(bounds[i], bounds[i + 1]):
+            t = abs((ax - cx) * (ys[j] - ay) - (ax - xs[j]) * (cy - ay))
+            if t > area:
+                best, area = j, t
+        a = idx[i + 1] = best
+    return np.asarray(idx, dtype=np.int64)
+
+def downsample(times: np.ndarray, values: np.ndarray, points: Optional[int] = None) -> tuple:
+    """
+    (tiempos en ms epoch, valores) con a lo sumo `points` puntos.
+    """
+    if points and points < len(times):
+        keep = lttb(times.astype(np.float64), values, points)
+        times, values = times[keep], values[keep]
+    return times, values
+
+def series(df, points: Optional[int] = None) -> tuple:
+    # `_time` (con o sin zona) a milisegundos epoch
+    times = df['_time'].to_numpy(dtype='datetime64[ms]').astype(np.int64)
+    return downsample(times, df['predicted_velocity_bpm'].to_numpy(dtype=np.float64), points)
+
+# -----------------------------------
+# Encoders (generadores de bytes)
+# -----------------------------------
+def _chunks(n: int):
+    for start in range(0, n, CHUNK_ROWS):
+        yield start, min(start + CHUNK_ROWS, n)
+
+def iter_records(times: np.ndarray, values: np.ndarray, meta: dict):
+    iso = np.datetime_as_string(times.astype('datetime64[ms]'), unit='s', timezone='UTC')
+    yield b'['
+    for start, end in _chunks(len(times)):
+        rows = ','.join(json.dumps({'_time': t, 'predicted_velocity_bpm': float(v)})
+                        for t, v in zip(iso[start:end], values[start:end]))
+        yield (',' if start else '').encode() + rows.encode()
+    yield b']'
+
+def iter_columnar(times: np.ndarray, values: np.ndarray, meta: dict, decimals: int = 2):
+    header = dict(meta, points=len(times), time_unit='ms')
+    yield json.dumps(header)[:-1].encode() + b', "_time": ['
+    for start, end in _chunks(len(times)):
+        yield (',' if start else '').encode() + ','.join(map(str, times[start:end].tolist())).encode()
+    yield b'], "predicted_velocity_bpm": ['
+    rounded = np.round(values, decimals)
+    for start, end in _chunks(len(values)):
+        yield (',' if start else '').encode() + ','.join(map(repr, rounded[start:end].tolist())).encode()
+    yield b']}'
+
+def iter_arrow(times: np.ndarray, values: np.ndarray, meta: dict):
+    import pyarrow as pa
+    schema = pa.schema([('_time', pa.timestamp('ms', tz='UTC')), ('predicted_velocity_bpm', pa.float32())],
+                       metadata={k: str(v) for k, v in meta.items()})
+    sink = io.BytesIO()
+
+    def drain() -> bytes:
+        data = sink.getvalue()
+        sink.seek(0)
+        sink.truncate()
+        return data
+
+    with pa.ipc.new_stream(sink, schema) as writer:
+        yield drain()
+        for start, end in _chunks(len(times)):
+            writer.write_batch(pa.record_batch([pa.array(times[start:end], pa.timestamp('ms', tz='UTC')),
+                                                pa.array(values[start:end], pa.float32())], schema=schema))
+            yield drain()
+    yield drain()  # marca de fin de stream
+
+ENCODERS = {'records': iter_records, 'columnar': iter_columnar, 'arrow': iter_arrow}
+
+def encode(df, fmt: str = 'records', points: Optional[int] = None, meta: Optional[dict] = None):
+    """
+    Generador de chunks de bytes del pronóstico en el formato pedido.
+    """
+    times, values = series(df, points)
+    return ENCODERS[fmt](times, values, meta or {})
+
+def gzip_chunks(chunks, level: int = 6):
+    """
+    gzip en streaming: cada chunk se comprime y se vacía (Z_SYNC_FLUSH) al momento.
+    """
+    z = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        out = z.compress(chunk) + z.flush(zlib.Z_SYNC_FLUSH)
+        if out:
+            yield out
+    yield z.flush()
+
+def etag(*parts) -> str:
+    """
+    ETag del payload: versiones de modelo y dataset más los parámetros que cambian el contenido.
+    """
+    return hashlib.sha256('|'.join(map(str, parts)).encode()).hexdigest()[:20]
@@ -0,0 +1,213 @@
+"""
+src/inference_export.py
+Exportación del MLP de train.py a un artefacto de inferencia en NumPy puro:
+- BatchNormalization (modo inferencia) se pliega en la Dense siguiente y Dropout se elimina
+- Resultado: capas (W, b, activación) en `inference_<linea>_<ts>.npz`
+- `NumpyMLP` carga el .npz en milisegundos sin importar TensorFlow y expone `predict_on_batch`
+  como el modelo Keras, así el forecaster lo usa sin cambios
+- Toda exportación verifica equivalencia contra la salida de Keras antes de escribir el artefacto
+- CLI: exporta la versión activa de cada línea (y familia) del registro que aún no tiene artefacto;
+  `--self-test` pliega un Sequential chico con BatchNormalization/Dropout y falla si no coincide
+"""
+import argparse
+import json
+import tempfile
+from pathlib import Path
+from typing import Optional
+import numpy as np
+
+INFERENCE_VERSION = 1
+
+ACTIVATIONS = {
+    'linear': lambda x: x,
+    'relu': lambda x: np.maximum(x, 0, out=x),
+}
+
+# Tolerancia de la verificación (float32, relativa a la escala de la salida)
+RTOL = 1e-4
+ATOL = 1e-3
+
+
+# -----------------------------------
+# Modelo NumPy
+# -----------------------------------
+class NumpyMLP:
+    """
+    Secuencia de capas densas (W, b, activación) en float32.
+    """
+    def __init__(self, layers: list, meta: Optional[dict] = None):
+        self.layers = [(np.ascontiguousarray(W, dtype=np.float32), np.asarray(b, dtype=np.float32), act)
+                       for W, b, act in layers]
+        self.meta = meta or {}
+
+    def predict_on_batch(self, x) -> np.ndarray:
+        h = np.asarray(x, dtype=np.float32)
+        for W, b, act in self.layers:
+            h = h @ W
+            h += b
+            h = ACTIVATIONS[act](h)
+        return h
+
+    __call__ = predict_on_batch
+
+    def save(self, path):
+        arrays = {}
+        for i, (W, b, _) in enumerate(self.layers):
+            arrays[f'W{i}'], arrays[f'b{i}'] = W, b
+        meta = dict(self.meta, version=INFERENCE_VERSION, activations=[act for _, _, act in self.layers])
+        # np.savez agrega .npz si falta; se escribe a un temporal con esa extensión y se reemplaza
+        path = Path(path)
+        tmp = path.with_name(path.stem + '.tmp.npz')
+        np.savez(tmp, meta=np.array(json.dumps(meta)), **arrays)
+        tmp.replace(path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as data:
+            meta = json.loads(str(data['meta']))
+            if meta.get('version') != INFERENCE_VERSION:
+                raise ValueError(f"Versión de artefacto de inferencia no soportada en {path}: {meta.get('version')}")
+            layers = [(data[f'W{i}'], data[f'b{i}'], act) for i, act in enumerate(meta['activations'])]
+        return cls(layers, meta)
+
+# -----------------------------------
+# Plegado de capas Keras
+# -----------------------------------
+def fold_layers(model) -> list:
+    """
+    Capas (W, b, activación) equivalentes al modelo Keras en inferencia. Cada BatchNormalization
+    es una transformación afín x * s + t que se absorbe en la Dense siguiente:
+    (x * s + t) @ W + b = x @ (s[:, None] * W) + (t @ W + b).
+    """
+    layers = []
+    pending = None  # (s, t) de BatchNormalization aún sin plegar
+    for layer in model.layers:
+        kind = type(layer).__name__
+        if kind in ('Dropout', 'InputLayer'):
+            continue
+        if kind == 'BatchNormalization':
+            gamma, beta, mean, var = [w.astype(np.float64) for w in layer.get_weights()]
+            s = gamma / np.sqrt(var + layer.epsilon)
+            t = beta - mean * s
+            # Dos BatchNormalization seguidas se componen
+            pending = (s, t) if pending is None else (pending[0] * s, pending[1] * s + t)
+        elif kind == 'Dense':
+            W, b = [w.astype(np.float64) for w in layer.get_weights()]
+            if pending is not None:
+                s, t = pending
+                W, b = s[:, None] * W, t @ W + b
+                pending = None
+            act = layer.get_config()['activation']
+            if act not in ACTIVATIONS:
+                raise ValueError(f"Activación no soportada en {layer.name}: {act}")
+            layers.append((W, b, act))
+        else:
+            raise ValueError(f"Capa no soportada para exportar: {layer.name} ({kind})")
+    if pending is not None:
+        # BatchNormalization final: capa diagonal
+        s, t = pending
+        layers.append((np.diag(s), t, 'linear'))
+    return layers
+
+def verify(model, numpy_model: NumpyMLP, X: np.ndarray) -> float:
+    """
+    Error absoluto máximo entre Keras y NumPy sobre `X`; lanza ValueError si excede la tolerancia.
+    """
+    X = np.asarray(X, dtype=np.float32)
+    expected = np.asarray(model.predict_on_batch(X), dtype=np.float64)
+    got = numpy_model.predict_on_batch(X).astype(np.float64)
+    err = float(np.max(np.abs(expected - got)))
+    if not np.allclose(got, expected, rtol=RTOL, atol=ATOL * max(1.0, float(np.max(np.abs(expected))))):
+        raise ValueError(f"La exportación NumPy no coincide con Keras (error máximo {err:.3g})")
+    return err
+
+def export(model, out_path: Path, seed: int = 0) -> NumpyMLP:
+    """
+    Pliega `model`, verifica equivalencia contra Keras con 1024 entradas N(0, 1)
+    (la escala de los features ya escalados) y escribe el artefacto.
+    """
+    n_features = model.inputs[0].shape[-1]
+    X = np.random.default_rng(seed).standard_normal((1024, n_features))
+    numpy_model = NumpyMLP(fold_layers(model), meta={'n_features': int(n_features)})
+    numpy_model.meta['max_abs_error'] = verify(model, numpy_model, X)
+    numpy_model.save(out_path)
+    print(f"[EXPORT] Artefacto NumPy guardado en: {out_path} "
+          f"({len(numpy_model.layers)} capas, error máximo vs Keras {numpy_model.meta['max_abs_error']:.2e})")
+    return numpy_model
+
+def self_test(n_features: int = 8, seed: int = 0) -> float:
+    """
+    Smoke test sin modelos entrenados: Sequential con BatchNormalization al inicio, después de un
+    Dropout, dos seguidas y una final (pesos y estadísticas no triviales), plegado, guardado,
+    recargado y comparado contra Keras con np.allclose. Devuelve el error absoluto máximo.
+    """
+    from tensorflow.keras.models import Sequential
+    from tensorflow.keras.layers import Input, Dense, Dropout, BatchNormalization
+
+    rng = np.random.default_rng(seed)
+    model = Sequential([
+        Input(shape=(n_features,)),
+        BatchNormalization(),
+        Dense(16, activation='relu'),
+        Dropout(0.3),
+        BatchNormalization(),
+        BatchNormalization(),
+        Dense(8, activation='relu'),
+        Dense(3),
+        BatchNormalization(),
+    ])
+    for layer in model.layers:
+        if type(layer).__name__ == 'BatchNormalization':
+            n = layer.get_weights()[0].shape[0]
+            layer.set_weights([rng.uniform(0.5, 2.0, n), rng.normal(0, 0.5, n),
+                               rng.normal(0, 1.0, n), rng.uniform(0.5, 2.0, n)])
+    X = rng.standard_normal((256, n_features)).astype(np.float32)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / 'inference_selftest.npz'
+        NumpyMLP(fold_layers(model)).save(path)
+        loaded = NumpyMLP.load(path)
+    expected = np.asarray(model(X, training=False), dtype=np.float64)
+    got = loaded.predict_on_batch(X).astype(np.float64)
+    if len(loaded.layers) != 4 or not np.allclose(got, expected, rtol=RTOL, atol=ATOL):
+        raise ValueError(f"Self-test de plegado fallido: {len(loaded.layers)} capas, "
+                         f"error máximo {np.max(np.abs(got - expected)):.3g}")
+    return float(np.max(np.abs(got - expected)))
+
+def inference_path(model_path: Path) -> Path:
+    # model_linea03_20250508T101000.h5 -> inference_linea03_20250508T101000.npz
+    return model_path.with_name(model_path.name.replace('model_', 'inference_', 1)).with_suffix('.npz')
+
+# -----------------------------------
+# Main
+# -----------------------------------
+def main(argv=None):
+    from model_registry import ModelRegistry
+
+    parser = argparse.ArgumentParser(description="Exporta las versiones activas a inferencia NumPy.")
+    parser.add_argument('--models-dir', type=Path, default=Path('models'))
+    parser.add_argument('--force', action='store_true', help='Reexporta aunque ya exista el artefacto')
+    parser.add_argument('--self-test', action='store_true',
+                        help='Verifica el plegado con un modelo sintético con BatchNormalization/Dropout y termina')
+    args = parser.parse_args(argv)
+
+    if args.self_test:
+        try:
+            err = self_test()
+        except ValueError as e:
+            print(f"[EXPORT] {e}")
+            raise SystemExit(1)
+        print(f"[EXPORT] Self-test OK: plegado de BatchNormalization/Dropout igual a Keras (error máximo {err:.2e})")
+        return
+
+    from tensorflow.keras.models import load_model
+    registry = ModelRegistry(args.models_dir)
+    for entry in sorted(registry.active_runs(), key=lambda e: e['run_id']):
+        if 'inference' in entry['paths'] and not args.force:
+            print(f"[EXPORT] {entry['line']}: {entry['run_id']} ya exportado")
+            continue
+        out_path = inference_path(entry['paths']['model'])
+        export(load_model(entry['paths']['model'], compile=False), out_path)
+        registry.add_artifact(entry['run_id'], 'inference', out_path)
+
+if __name__ == '__main__':
+    main()
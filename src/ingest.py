@@ -1,14 +1,27 @@
-
 # src/ingest.py
 # -------------------------------
 # Copia los CSV de calidad y disponibilidad desde el servidor local
 # a la carpeta data/raw/ con nombre con la fecha actual.
+# - Un solo listado del directorio compartido (os.scandir) en lugar de un stat por archivo
+# - Manifest local (data/raw/ingest_manifest.json) con tamaño, mtime y sha256 de cada archivo remoto
+# - Archivos sin cambios (mismo tamaño y mtime) no se vuelven a copiar
+# - Se copia hasta el tamaño del listado aunque el PLC siga agregando filas (el resto, en la próxima corrida)
+# - Copias parciales (.part) se reanudan leyendo sólo el rango faltante
+# - El rango copiado se relee en local y se compara con el sha256 de los bytes leídos del share
+#   (detecta escrituras corruptas; el prefijo de una copia reanudada no se revalida contra el remoto)
+# - calidad y disponibilidad se copian en paralelo
+# La carpeta de origen se puede cambiar con `plc_share_dir` en config.yaml o la
+# variable de entorno PLC_SHARE_DIR (p.ej. una carpeta local en pruebas).
 # -------------------------------
 
+import argparse
 import os
-import shutil
-import glob
+import json
+import hashlib
 import datetime
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
 
 # ---------------------------------------------
 # CONFIGURACIÓN DE RUTAS
@@ -20,45 +33,197 @@ SERVER_DIR = r"\\192.168.1.100\DatosPLC"
 # Carpeta local donde guardaremos los CSV descargados
 git_root = os.getcwd()  # asume que corres desde la raíz del proyecto
 data_raw = os.path.join(git_root, "data", "raw")
+MANIFEST_PATH = os.path.join(data_raw, "ingest_manifest.json")
 
 # Prefijos de archivos a copiar (calidad y disponibilidad)
 PREFIXES = ["calidad", "disponibilidad"]
 
+# Tamaño de bloque de lectura del share
+CHUNK_BYTES = 4 * 1024 * 1024
+
 # ---------------------------------------------
 # FUNCIONES AUXILIARES
 # ---------------------------------------------
+def server_dir() -> str:
+    if os.environ.get("PLC_SHARE_DIR"):
+        return os.environ["PLC_SHARE_DIR"]
+    try:
+        from config import get_pipeline_config
+        return get_pipeline_config().get("plc_share_dir", SERVER_DIR)
+    except (FileNotFoundError, KeyError):
+        return SERVER_DIR
+
+def scan_share(share: str) -> dict:
+    """
+    Lista el directorio compartido una sola vez y devuelve, por prefijo, el CSV más reciente
+    como (ruta, tamaño, mtime_ns). En Windows/SMB el stat de cada entrada viene en el mismo listado.
+    """
+    latest: dict = {}
+    with os.scandir(share) as entries:
+        for entry in entries:
+            if not entry.name.endswith(".csv") or not entry.is_file():
+                continue
+            for prefix in PREFIXES:
+                if entry.name.startswith(prefix):
+                    st = entry.stat()
+                    if prefix not in latest or st.st_mtime_ns > latest[prefix][2]:
+                        latest[prefix] = (entry.path, st.st_size, st.st_mtime_ns)
+    missing = [p for p in PREFIXES if p not in latest]
+    if missing:
+        raise FileNotFoundError(f"No se encontró ningún archivo con prefijo {missing} en {share}")
+    return latest
+
 def latest_file(prefix: str) -> str:
     """
-    Busca en SERVER_DIR el CSV que comience con `prefix` y devuelve el más reciente.
+    Busca en el directorio compartido el CSV que comience con `prefix` y devuelve el más reciente.
     """
-    pattern = os.path.join(SERVER_DIR, f"{prefix}*.csv")
-    files = glob.glob(pattern)
-    if not files:
-        raise FileNotFoundError(f"No se encontró ningún archivo con prefijo '{prefix}' en {SERVER_DIR}")
-    # Ordenar por fecha de modificación y retornar el más reciente
-    files.sort(key=os.path.getmtime)
-    return files[-1]
+    return scan_share(server_dir())[prefix][0]
+
+def file_sha256(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(CHUNK_BYTES), b""):
+            h.update(block)
+    return h.hexdigest()
+
+def range_sha256(path: str, start: int, end: int) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        f.seek(start)
+        remaining = end - start
+        while remaining > 0:
+            block = f.read(min(CHUNK_BYTES, remaining))
+            if not block:
+                break
+            h.update(block)
+            remaining -= len(block)
+    return h.hexdigest()
+
+# ---------------------------------------------
+# MANIFEST
+# ---------------------------------------------
+class Manifest:
+    """
+    Estado de ingestión por prefijo: último archivo remoto copiado (tamaño, mtime, sha256, destino)
+    y, si hay una copia en curso, el archivo remoto al que corresponde el .part.
+    """
+    def __init__(self, path: str = MANIFEST_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self.data = {}
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                self.data = json.load(f)
+
+    def get(self, prefix: str) -> dict:
+        with self._lock:
+            return dict(self.data.get(prefix, {}))
+
+    def update(self, prefix: str, **fields):
+        with self._lock:
+            self.data.setdefault(prefix, {}).update(fields)
+            tmp = self.path + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(self.data, f, indent=2)
+            os.replace(tmp, self.path)
+
+# ---------------------------------------------
+# COPIA
+# ---------------------------------------------
+def copy_resumable(src: str, dst: str, size: int, resume: bool) -> str:
+    """
+    Copia los primeros `size` bytes de `src` (el tamaño del listado; lo que el PLC agregue
+    después queda para la próxima corrida) a `dst` vía `dst.part`. Con `resume`, continúa un
+    .part existente leyendo del origen sólo desde su tamaño actual. Devuelve el sha256 del
+    contenido copiado.
+    """
+    part = dst + ".part"
+    offset = os.path.getsize(part) if resume and os.path.exists(part) else 0
+    if offset > size:
+        offset = 0
+
+    h = hashlib.sha256()
+    if offset:
+        # Lo ya copiado se hashea en local, sin volver a leerlo del share
+        with open(part, "rb") as f:
+            for block in iter(lambda: f.read(CHUNK_BYTES), b""):
+                h.update(block)
+        print(f"[INGEST] Reanudando {os.path.basename(src)} desde {offset} de {size} bytes")
+
+    # sha256 del rango leído del share, para verificar lo escrito en local
+    remote_range = hashlib.sha256()
+    with open(src, "rb") as fin, open(part, "ab" if offset else "wb") as fout:
+        fin.seek(offset)
+        remaining = size - offset
+        while remaining > 0:
+            block = fin.read(min(CHUNK_BYTES, remaining))
+            if not block:
+                break
+            fout.write(block)
+            h.update(block)
+            remote_range.update(block)
+            remaining -= len(block)
+        fout.flush()
+        os.fsync(fout.fileno())
+
+    copied = os.path.getsize(part)
+    if copied != size:
+        raise IOError(f"Copia incompleta de {src}: {copied} de {size} bytes")
+    if range_sha256(part, offset, size) != remote_range.hexdigest():
+        os.remove(part)
+        raise IOError(f"Los bytes escritos no coinciden con los leídos al copiar {src}")
+    os.replace(part, dst)
+    return h.hexdigest()
+
+def ingest_prefix(prefix: str, remote: tuple, manifest: Manifest, today: str) -> str:
+    src, size, mtime_ns = remote
+    state = manifest.get(prefix)
+    dst = os.path.join(data_raw, f"{prefix}_{today}.csv")
+
+    # Sin cambios en el remoto y la copia local intacta: no se copia
+    if (state.get("src") == src and state.get("size") == size and state.get("mtime_ns") == mtime_ns
+            and os.path.exists(state.get("dst", "")) and os.path.getsize(state["dst"]) == size):
+        print(f"[INGEST] Sin cambios: {src} (ya en {state['dst']})")
+        return state["dst"]
+
+    # Sólo se reanuda un .part del mismo archivo remoto (misma ruta, tamaño previo <= actual y mtime)
+    partial = state.get("partial") or {}
+    resume = partial.get("src") == src and partial.get("dst") == dst and partial.get("mtime_ns") == mtime_ns
+    manifest.update(prefix, partial={"src": src, "dst": dst, "size": size, "mtime_ns": mtime_ns})
+
+    digest = copy_resumable(src, dst, size, resume)
+    os.utime(dst, ns=(mtime_ns, mtime_ns))
+    manifest.update(prefix, src=src, size=size, mtime_ns=mtime_ns, sha256=digest, dst=dst, partial=None,
+                    copied=datetime.datetime.now().isoformat())
+    print(f"[INGEST] Copiado: {src}\n       -> {dst} (sha256 {digest[:12]})")
+    return dst
 
 # ---------------------------------------------
 # PROCESO PRINCIPAL
 # ---------------------------------------------
-def main():
+def ingest(share: Optional[str] = None) -> dict:
     # Crear carpeta local si no existe
     os.makedirs(data_raw, exist_ok=True)
 
-    # Para cada prefijo, copiar el último CSV
-    today = datetime.date.today().isoformat()
-    for prefix in PREFIXES:
-        src = latest_file(prefix)
-        dst_name = f"{prefix}_{today}.csv"
-        dst = os.path.join(data_raw, dst_name)
+    share = share or server_dir()
+    remote = scan_share(share)
+    manifest = Manifest()
 
-        shutil.copy2(src, dst)
-        print(f"[INGEST] Copiado: {src}\n       -> {dst}")
+    # Copiar el último CSV de cada prefijo en paralelo
+    today = datetime.date.today().isoformat()
+    with ThreadPoolExecutor(max_workers=len(PREFIXES)) as pool:
+        futures = {p: pool.submit(ingest_prefix, p, remote[p], manifest, today) for p in PREFIXES}
+        return {p: f.result() for p, f in futures.items()}
 
-if __name__ == "__main__":
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Copia los CSV del PLC a data/raw/.")
+    parser.add_argument("--share", help="Carpeta de origen (por defecto PLC_SHARE_DIR o plc_share_dir de config.yaml)")
+    args = parser.parse_args(argv)
     try:
-        main()
+        return ingest(args.share)
     except Exception as e:
         print(f"[ERROR INGEST] {e}")
-        exit(1)
+        raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""
+src/jobs.py
+Subsistema de trabajos asíncronos para la API:
+- Ejecuta ingest/merge/train/forecast en un pool de hilos acotado
+- Cada trabajo tiene id, estado, progreso, tiempos y resultado consultables
+- Solicitudes duplicadas en curso (misma clave, p.ej. ('forecast', línea, horas)) se unen al mismo trabajo
+- Cola acotada: si hay demasiados trabajos pendientes se rechaza la solicitud
+"""
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+QUEUED, RUNNING, SUCCEEDED, FAILED = 'queued', 'running', 'succeeded', 'failed'
+
+
+class JobQueueFull(Exception):
+    pass
+
+
+class Job:
+    def __init__(self, kind: str, key: tuple):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.key = key
+        self.status = QUEUED
+        self.progress = 0.0
+        self.created = time.time()
+        self.started: Optional[float] = None
+        self.finished: Optional[float] = None
+        self.result = None
+        self.error: Optional[str] = None
+        self.done = threading.Event()
+
+    def set_progress(self, fraction: float):
+        self.progress = max(0.0, min(1.0, float(fraction)))
+
+    def to_dict(self) -> dict:
+        now = time.time()
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'params': list(self.key[1:]),
+            'status': self.status,
+            'progress': round(self.progress, 4),
+            'created': self.created,
+            'started': self.started,
+            'finished': self.finished,
+            'queued_seconds': round((self.started or now) - self.created, 3),
+            'run_seconds': round((self.finished or now) - self.started, 3) if self.started else None,
+            'result': self.result,
+            'error': self.error,
+        }
+
+
+class JobManager:
+    def __init__(self, max_workers: int = 2, max_pending: int = 16, keep_finished: int = 200):
+        self.max_pending = max_pending
+        self.keep_finished = keep_finished
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='job')
+        self._lock = threading.Lock()
+        self._jobs: dict = {}      # id -> Job (en orden de creación)
+        self._inflight: dict = {}  # key -> Job en cola o en ejecución
+
+    def submit(self, kind: str, params: tuple, fn) -> Job:
+        """
+        Encola `fn(job)` y devuelve el Job. Si ya hay uno en curso con la misma
+        clave (kind, *params) se devuelve ese en lugar de duplicar la ejecución.
+        """
+        key = (kind,) + tuple(params)
+        with self._lock:
+            job = self._inflight.get(key)
+            if job is not None:
+                return job
+            if len(self._inflight) >= self.max_pending:
+                raise JobQueueFull(f"Hay {len(self._inflight)} trabajos pendientes (máximo {self.max_pending})")
+            job = Job(kind, key)
+            self._jobs[job.id] = job
+            self._inflight[key] = job
+            self._prune()
+        self._executor.submit(self._run, job, fn)
+        return job
+
+    def _run(self, job: Job, fn):
+        job.status = RUNNING
+        job.started = time.time()
+        try:
+            job.result = fn(job)
+            job.progress = 1.0
+            job.status = SUCCEEDED
+        except Exception as e:
+            job.error = str(e)
+            job.status = FAILED
+        finally:
+            job.finished = time.time()
+            with self._lock:
+                self._inflight.pop(job.key, None)
+            job.done.set()
+
+    def _prune(self):
+        finished = [j for j in self._jobs.values() if j.done.is_set()]
+        for job in finished[:max(0, len(finished) - self.keep_finished)]:
+            del self._jobs[job.id]
+
+    def get(self, job_id: str):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def list(self) -> list:
+        with self._lock:
+            return [j.to_dict() for j in self._jobs.values()]
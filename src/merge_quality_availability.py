@@ -1,25 +1,41 @@
 """
 Merge Quality & Availability Pipeline
 Lee los CSV de calidad y disponibilidad, limpia, mapea motivos de paro,
-filtra sólo la línea configurada (columna `linea`), pivota availability y crea un Parquet único listo para feature engineering.
+filtra sólo la línea configurada (columna `linea`), pivota availability y guarda el dataset
+particionado `data/processed/merged/` (linea=/date=, ver datalake.py) listo para feature engineering.
+Modo incremental (--incremental): guarda un high-water mark de `_time` por device_id
+(en el `meta` del manifest de merged),
+procesa sólo filas nuevas (con 30 s de solape para el merge asof) y las agrega
+como parts nuevos en sus particiones.
+Los CSV se leen por chunks con esquema explícito (categorías, float32, timestamp ISO 8601):
+availability se reduce chunk a chunk y calidad se mergea y escribe chunk a chunk,
+así la memoria no crece con el tamaño de las exportaciones del PLC.
+Con `merged_schema: compact` los motivos de paro se guardan como un único código int8
+`stop_code` en lugar del one-hot stop_* (ver compact_schema.py); `--compare-layout`
+reporta memoria y tamaño Parquet de ambos layouts.
 """
+import argparse
+import json
+import tempfile
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
 from pathlib import Path
-import datetime
+from typing import IO, Optional, Union
 from config import get_pipeline_config
-
-# ---------------------------------------
-# Configuración dinámica
-# ---------------------------------------
-cfg = get_pipeline_config()
-line = cfg["line"]
+import compact_schema
+import datalake
 
 # ---------------------------------------
 # Rutas
 # ---------------------------------------
 RAW_DIR = Path("data/raw")
 PROC_DIR = Path("data/processed")
-PROC_DIR.mkdir(parents=True, exist_ok=True)
+MERGE_STATE_PATH   = PROC_DIR / "merge_state.json"  # high-water marks de datasets anteriores
+
+# Solape para que el merge asof (tolerancia 30 s) vea la availability previa al high-water mark
+OVERLAP = pd.Timedelta("30s")
 
 # Mapeo completo de stopping_reason a grupos operativos
 CAUSE_MAP = {
@@ -36,10 +52,36 @@ CAUSE_MAP = {
     "-": "Otros", "001": "Falla_Comunicacion",
 }
 
+STOP_GROUPS = sorted(set(CAUSE_MAP.values()))
+
 # Prefijos de archivo raw
 CALIDAD_PREFIX = "calidad"
 DISP_PREFIX    = "disponibilidad"
 
+# Esquema explícito de lectura (sin inferencia de tipos)
+CALIDAD_COLS   = ["_time", "linea", "_value", "real_velocity", "product_id", "device_id"]
+CALIDAD_DTYPES = {"linea": "category", "_value": "float32", "real_velocity": "float32",
+                  "product_id": "category", "device_id": "category", "_time": "string"}
+DISP_COLS      = ["_time", "device_id", "_value", "stopping_reason"]
+DISP_DTYPES    = {"device_id": "category", "_value": "category", "stopping_reason": "category", "_time": "string"}
+
+# ---------------------------------------
+# Configuración dinámica (configure() la lee de config.yaml; importar el módulo no lee nada)
+# ---------------------------------------
+CHUNK_ROWS  = 500_000
+TIME_FORMAT = "ISO8601"
+
+# Layout del dataset merged: "wide" (one-hot stop_*) o "compact" (stop_code int8, categorías)
+SCHEMA = "wide"
+
+def configure(cfg: Optional[dict] = None) -> dict:
+    global CHUNK_ROWS, TIME_FORMAT, SCHEMA
+    cfg = cfg if cfg is not None else get_pipeline_config()
+    CHUNK_ROWS  = cfg.get("csv_chunk_rows", 500_000)
+    TIME_FORMAT = cfg.get("csv_time_format", "ISO8601")
+    SCHEMA      = cfg.get("merged_schema", "wide")
+    return cfg
+
 # ---------------------------------------
 # Funciones auxiliares
 # ---------------------------------------
@@ -49,45 +91,150 @@ def latest_csv(prefix: str) -> Path:
         raise FileNotFoundError(f"No se encontró archivo raw con prefijo '{prefix}' en {RAW_DIR}")
     return files[-1]
 
+def load_state() -> dict:
+    """
+    High-water mark de `_time` por device_id. Vive en el `meta` del manifest de merged, publicado
+    en el mismo `replace` que los parts que cubre; `merge_state.json` sólo se lee en datasets
+    escritos antes de eso.
+    """
+    high_water = datalake.dataset_meta(datalake.MERGED_LAKE).get("high_water")
+    if high_water is None:
+        if not MERGE_STATE_PATH.exists():
+            return {}
+        with open(MERGE_STATE_PATH, "r", encoding="utf-8") as f:
+            high_water = json.load(f).get("high_water", {})
+    return {dev: pd.Timestamp(ts) for dev, ts in high_water.items()}
+
+def encode_state(high_water: dict) -> dict:
+    return {dev: ts.isoformat() for dev, ts in high_water.items()}
+
+def after_high_water(df: pd.DataFrame, high_water: dict, margin=pd.Timedelta(0)) -> pd.DataFrame:
+    """
+    Filas con `_time` posterior al high-water mark de su device_id menos `margin`.
+    """
+    if not high_water:
+        return df
+    cutoff = df["device_id"].astype(object).map(high_water)
+    keep = cutoff.isna() | (df["_time"] > cutoff - margin)
+    return df[keep.to_numpy()]
+
 # ---------------------------------------
-# Pipeline principal
+# Lectura por chunks
 # ---------------------------------------
-def merge_and_clean():
-    # 1. Cargar CSV
-    calidad_path       = latest_csv(CALIDAD_PREFIX)
-    disponibilidad_path= latest_csv(DISP_PREFIX)
-    print(f"[MERGE] Leyendo: {calidad_path.name}, {disponibilidad_path.name}")
+def iter_csv(source: Union[Path, IO[bytes]], usecols: list, dtypes: dict):
+    """
+    Lee el CSV (ruta o buffer de bytes, como los micro-batches del watcher) en chunks de
+    CHUNK_ROWS filas con tipos fijos y normaliza `_time` a pasos de 30 s con un parser de formato fijo.
+    """
+    for chunk in pd.read_csv(source, usecols=usecols, dtype=dtypes, chunksize=CHUNK_ROWS):
+        chunk["_time"] = pd.to_datetime(chunk["_time"], format=TIME_FORMAT).dt.floor("30s")
+        yield chunk
+
+def clean_quality(q: pd.DataFrame) -> pd.DataFrame:
+    return q[CALIDAD_COLS]
 
-    q = pd.read_csv(calidad_path)
-    d = pd.read_csv(disponibilidad_path)
+def clean_availability(d: pd.DataFrame) -> pd.DataFrame:
+    d = d[DISP_COLS]
 
-    # 2. Normalizar timestamp a pasos de 30 s
-    q["_time"] = pd.to_datetime(q["_time"]).dt.floor("30s")
-    d["_time"] = pd.to_datetime(d["_time"]).dt.floor("30s")
+    # Mapear estado y motivo de paro
+    out = pd.DataFrame({
+        "_time": d["_time"],
+        "device_id": d["device_id"],
+        "state_flag": (d["_value"] == "Produciendo").astype("int8"),
+        "stop_group": pd.Categorical(
+            d["stopping_reason"].astype(object).map(CAUSE_MAP).fillna("Otros"), categories=STOP_GROUPS),
+    })
 
-    # 3. Filtrar sólo datos de la línea configurada
-    #q = q[q['linea'] == line].reset_index(drop=True)
-    #d = d[d['linea'] == line].reset_index(drop=True)
+    # Limpiar duplicados en availability
+    return out.drop_duplicates(subset=["_time", "device_id"], keep="first")
 
-    # 4. Eliminar columnas _field que no aportan
-    q = q.drop(columns=[c for c in q.columns if c.startswith("_field")], errors="ignore")
-    d = d.drop(columns=[c for c in d.columns if c.startswith("_field")], errors="ignore")
+class AvailabilityStore:
+    """
+    Availability reducida (mapeo, dedup, tipos compactos) volcada chunk a chunk a Parquet
+    temporal; cada chunk de calidad lee sólo sus dispositivos dentro de su rango de `_time`
+    ± 30 s (filtro empujado al lector). La memoria queda acotada por esa ventana, no por el
+    tamaño de la exportación, y no depende del orden de los CSV (por tiempo o por dispositivo).
+    """
+    def __init__(self, path: Path, high_water: Optional[dict] = None, tmp_dir: Path = PROC_DIR):
+        Path(tmp_dir).mkdir(parents=True, exist_ok=True)
+        self._tmp = tempfile.TemporaryDirectory(prefix=".availability-", dir=tmp_dir)
+        files = []
+        self.rows = 0
+        devices: set = set()
+        for i, chunk in enumerate(iter_csv(path, DISP_COLS, DISP_DTYPES)):
+            chunk = clean_availability(chunk)
+            devices.update(chunk["device_id"].astype(object).unique())
+            if high_water:
+                chunk = after_high_water(chunk, high_water, margin=OVERLAP)
+            if chunk.empty:
+                continue
+            # `_seq` conserva el orden del archivo para el dedup entre chunks (keep="first")
+            chunk = chunk.astype({"device_id": object, "stop_group": object}).assign(
+                _seq=np.arange(self.rows, self.rows + len(chunk)))
+            files.append(Path(self._tmp.name) / f"part-{i:05d}.parquet")
+            chunk.to_parquet(files[-1], index=False)
+            self.rows += len(chunk)
+        # Categorías de device_id de toda la availability, como si estuviera entera en memoria
+        self.devices = pd.Index(sorted(devices))
+        self._dataset = ds.dataset([str(f) for f in files], format="parquet") if files else None
+        self.peak_rows = 0
 
-    # 5. Seleccionar columnas útiles (incluye 'linea')
-    q = q[["_time", "linea", "_value", "real_velocity", "product_id", "device_id"]]
-    d = d[["_time", "device_id", "_value", "stopping_reason"]]
+    def for_chunk(self, q: pd.DataFrame) -> pd.DataFrame:
+        """
+        Availability de los dispositivos de `q` que el merge asof puede emparejar con sus filas.
+        """
+        if self._dataset is None or q.empty:
+            d = clean_availability(pd.DataFrame(columns=DISP_COLS))
+        else:
+            # Rango de `_time` por dispositivo: un chunk puede cerrar un dispositivo y abrir otro
+            time_type = self._dataset.schema.field("_time").type
+            span = q.groupby(q["device_id"].astype(str), observed=True)["_time"].agg(["min", "max"])
+            window = None
+            for dev, (t_min, t_max) in span.iterrows():
+                cond = ((ds.field("device_id") == dev)
+                        & (ds.field("_time") >= pa.scalar(t_min - OVERLAP, type=time_type))
+                        & (ds.field("_time") <= pa.scalar(t_max + OVERLAP, type=time_type)))
+                window = cond if window is None else window | cond
+            d = self._dataset.to_table(filter=window).to_pandas()
+            # Un dedup sobre la ventana cubre duplicados que caen entre dos chunks
+            d = d.sort_values("_seq").drop_duplicates(subset=["_time", "device_id"], keep="first").drop(columns="_seq")
+            self.peak_rows = max(self.peak_rows, len(d))
+        d = d.astype({"_time": q["_time"].dtype, "stop_group": pd.CategoricalDtype(STOP_GROUPS), "state_flag": "int8"})
+        d["device_id"] = pd.Categorical(d["device_id"], categories=self.devices)
+        return d.sort_values("_time")
 
-    # 6. Mapear estado y motivo de paro
-    d["state_flag"] = (d["_value"] == "Produciendo").astype(int)
-    d["stop_group"] = d["stopping_reason"].map(CAUSE_MAP).fillna("Otros")
+    def close(self):
+        self._tmp.cleanup()
 
-    # 7. Limpiar duplicados en availability
-    d = d.drop(columns=["_value", "stopping_reason"])
-    d = d.drop_duplicates(subset=["_time", "device_id"], keep="first")
+    def __enter__(self):
+        return self
 
-    # 8. Merge asof: unir calidad con availability más cercana
-    q = q.sort_values("_time")
-    d = d.sort_values("_time")
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+def iter_quality(path: Path, high_water: Optional[dict] = None):
+    for chunk in iter_csv(path, CALIDAD_COLS, CALIDAD_DTYPES):
+        chunk = clean_quality(chunk)
+        if high_water:
+            chunk = after_high_water(chunk, high_water)
+        if not chunk.empty:
+            yield chunk
+
+# ---------------------------------------
+# Merge
+# ---------------------------------------
+def merge_frames(q: pd.DataFrame, d: pd.DataFrame, schema: str = "wide") -> pd.DataFrame:
+    """
+    Merge asof de calidad con la availability más cercana (±30 s) y one-hot de stop_group.
+    Se generan todas las columnas stop_* de CAUSE_MAP aunque no aparezcan, para que
+    todos los chunks y parts del dataset compartan el mismo esquema.
+    Con schema="compact" se devuelve stop_code (int8) y tipos reducidos en lugar del one-hot.
+    """
+    # merge_asof exige el mismo dtype categórico en la clave `by`
+    devices = d["device_id"].cat.categories.union(q["device_id"].cat.categories)
+    q = q.assign(device_id=q["device_id"].cat.set_categories(devices)).sort_values("_time")
+    d = d.assign(device_id=d["device_id"].cat.set_categories(devices))
     merged = pd.merge_asof(
         q, d,
         on="_time",
@@ -96,23 +243,113 @@ def merge_and_clean():
         tolerance=pd.Timedelta("30s")
     )
 
-    # 9. Rellenar NaNs de state_flag con 0
+    # Rellenar NaNs de state_flag con 0
     merged["state_flag"] = merged["state_flag"].fillna(0).astype(int)
 
-    # 10. Renombrar _value a velocity_bpm
+    # Renombrar _value a velocity_bpm
     merged = merged.rename(columns={"_value": "velocity_bpm"})
 
-    # 11. One-hot de stop_group
-    merged = pd.get_dummies(merged, columns=["stop_group"], prefix="stop")
+    if schema == "compact":
+        return compact_schema.compact_frame(merged)
 
-    # 12. Guardar Parquet, incluyendo línea en el nombre
-    out_path = PROC_DIR / f"merged_{datetime.date.today()}.parquet"
-    merged.to_parquet(out_path, index=False)
-    print(f"[MERGE] Dataset fusionado ({line}) guardado en: {out_path}")
+    # One-hot de stop_group
+    for col in compact_schema.CATEGORY_COLS:
+        merged[col] = merged[col].astype(object)
+    return pd.get_dummies(merged, columns=["stop_group"], prefix="stop")
 
-if __name__ == "__main__":
+def merge_stream(writer, high_water: Optional[dict] = None) -> dict:
+    """
+    Mergea calidad chunk a chunk contra la ventana de availability reducida que le
+    corresponde (ver AvailabilityStore) y escribe cada chunk.
+    Devuelve el último `_time` escrito por device_id.
+    """
+    calidad_path       = latest_csv(CALIDAD_PREFIX)
+    disponibilidad_path= latest_csv(DISP_PREFIX)
+    print(f"[MERGE] Leyendo: {calidad_path.name}, {disponibilidad_path.name} (chunks de {CHUNK_ROWS} filas)")
+
+    last_seen: dict = {}
+    rows = 0
+    with AvailabilityStore(disponibilidad_path, high_water) as avail:
+        for q in iter_quality(calidad_path, high_water):
+            merged = merge_frames(q, avail.for_chunk(q), SCHEMA)
+            writer.write(merged)
+            rows += len(merged)
+            for dev, ts in merged.groupby("device_id", observed=True)["_time"].max().items():
+                last_seen[dev] = max(ts, last_seen.get(dev, ts))
+    print(f"[MERGE] {rows} filas mergeadas (availability en memoria: hasta {avail.peak_rows} de {avail.rows} filas)")
+    return last_seen
+
+# ---------------------------------------
+# Pipeline principal
+# ---------------------------------------
+def merge_and_clean():
+    # Reescribir el dataset particionado completo y reiniciar los high-water marks, que se
+    # publican en el mismo manifest que los parts (una caída no deja uno sin el otro)
+    meta = {"schema": SCHEMA, "stop_groups": STOP_GROUPS}
+    with datalake.DatasetWriter(datalake.MERGED_LAKE, mode="replace", meta=meta) as writer:
+        writer.update_meta(high_water=encode_state(merge_stream(writer)))
+    print(f"[MERGE] Dataset fusionado guardado en: {datalake.MERGED_LAKE}")
+
+def merge_incremental():
+    """
+    Procesa sólo filas de calidad posteriores al high-water mark de cada device_id
+    y las agrega como parts nuevos del dataset `data/processed/merged/`.
+    Lectura del high-water mark y escritura van bajo el lock del dataset; el high-water mark
+    nuevo se publica en el mismo manifest que los parts.
+    """
+    with datalake.locked(datalake.MERGED_LAKE):
+        high_water = load_state()
+        if datalake.exists(datalake.MERGED_LAKE) and datalake.dataset_meta(datalake.MERGED_LAKE).get("schema", "wide") != SCHEMA:
+            raise ValueError(f"El dataset {datalake.MERGED_LAKE} no usa el esquema '{SCHEMA}'; ejecuta un merge completo")
+        with datalake.DatasetWriter(datalake.MERGED_LAKE, mode="append") as writer:
+            last_seen = merge_stream(writer, high_water)
+            high_water.update(last_seen)
+            writer.update_meta(high_water=encode_state(high_water))
+    if not last_seen:
+        print("[MERGE] Sin filas nuevas desde el último merge incremental")
+        return []
+    print(f"[MERGE] Filas nuevas agregadas en {len(writer.written)} archivos de: {datalake.MERGED_LAKE}")
+    return writer.written
+
+def report_layouts():
+    """
+    Compara memoria y tamaño Parquet del dataset merged actual en layout ancho y compacto.
+    """
+    meta = datalake.dataset_meta(datalake.MERGED_LAKE)
+    df = datalake.read_partitioned(datalake.MERGED_LAKE, categorical=True)
+    if meta.get("schema", "wide") != "compact":
+        stop_cols = [f"stop_{g}" for g in STOP_GROUPS]
+        flags = df[stop_cols].to_numpy()
+        codes = np.where(flags.any(axis=1), flags.argmax(axis=1), -1)
+        df = df.drop(columns=stop_cols).assign(stop_group=pd.Categorical.from_codes(codes, STOP_GROUPS))
+    report = compact_schema.compare_layouts(df, STOP_GROUPS)
+    print(f"[MERGE] Layouts ({report['rows']} filas):")
+    for name in ("wide", "compact"):
+        r = report[name]
+        print(f"        {name:<8} columnas={r['columns']:>3}  memoria={r['memory_bytes'] / 1e6:8.2f} MB  "
+              f"parquet={r['parquet_bytes'] / 1e6:8.2f} MB")
+    print(f"        reducción: memoria x{report['memory_ratio']}, parquet x{report['parquet_ratio']}")
+    return report
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Merge de calidad y disponibilidad.")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Agrega sólo filas nuevas al dataset particionado (high-water marks en su manifest)")
+    parser.add_argument("--compare-layout", action="store_true",
+                        help="Reporta memoria y tamaño Parquet del layout ancho vs compacto")
+    args = parser.parse_args(argv)
+    cfg = configure()
+    PROC_DIR.mkdir(parents=True, exist_ok=True)
     try:
-        merge_and_clean()
+        if args.incremental or cfg.get("merge_incremental", False):
+            merge_incremental()
+        else:
+            merge_and_clean()
+        if args.compare_layout:
+            report_layouts()
     except Exception as exc:
         print(f"[ERROR MERGE] {exc}")
         raise
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+"""
+src/model_registry.py
+Registro de modelos entrenados (`models/registry.json`):
+- Una entrada por entrenamiento: línea, artefactos (modelo + pipeline), métricas,
+  fingerprint de los datos de la línea y lista de features
+- Versión activa por línea: lookup O(1) sin listar ni hacer `stat` del directorio de modelos
+- Familias de modelo (`kind`): `recursive` (un paso de 30 s, el de siempre) y `direct` (todo el
+  horizonte en bloques); cada familia tiene su propia versión activa por línea
+- Publicación atómica: los artefactos se escriben antes y la entrada aparece (y pasa a activa)
+  en un solo `replace` del JSON, bajo un lock entre procesos (train_lines.py publica en paralelo)
+- CLI: lista las versiones activas y permite activar un entrenamiento anterior (rollback)
+"""
+import argparse
+import datetime
+import json
+import os
+from pathlib import Path
+from typing import Optional
+from file_lock import locked
+
+REGISTRY_NAME = 'registry.json'
+REGISTRY_VERSION = 1
+
+RECURSIVE = 'recursive'
+DIRECT = 'direct'
+KINDS = (RECURSIVE, DIRECT)
+
+# Registro parseado por ruta, se relee sólo si cambia el archivo
+_cache: dict = {}
+
+
+def active_key(line: str, kind: str = RECURSIVE) -> str:
+    # Clave de la versión activa: la línea para el recursivo (registros anteriores), `linea:kind` si no
+    return line if kind == RECURSIVE else f'{line}:{kind}'
+
+
+class ModelRegistry:
+    def __init__(self, models_dir: Path):
+        self.models_dir = Path(models_dir)
+        self.path = self.models_dir / REGISTRY_NAME
+        self.lock_path = self.models_dir / 'registry.lock'
+
+    # -----------------------------------
+    # Lectura
+    # -----------------------------------
+    def load(self) -> dict:
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            return {'version': REGISTRY_VERSION, 'runs': {}, 'active': {}}
+        cached = _cache.get(self.path)
+        if cached is None or cached[0] != mtime:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                cached = (mtime, json.load(f))
+            _cache[self.path] = cached
+        return cached[1]
+
+    def _entry(self, data: dict, run_id: str) -> dict:
+        entry = dict(data['runs'][run_id], run_id=run_id)
+        entry.setdefault('kind', RECURSIVE)
+        entry['paths'] = {k: self.models_dir / name for k, name in entry['artifacts'].items()}
+        return entry
+
+    def active(self, line: str, kind: str = RECURSIVE) -> Optional[dict]:
+        """
+        Entrenamiento activo de la línea y familia (con `paths` absolutos de sus artefactos) o None.
+        """
+        data = self.load()
+        run_id = data['active'].get(active_key(line, kind))
+        return self._entry(data, run_id) if run_id else None
+
+    def active_runs(self) -> list:
+        data = self.load()
+        return [self._entry(data, run_id) for run_id in data['active'].values()]
+
+    def runs(self, line: Optional[str] = None) -> list:
+        data = self.load()
+        return [self._entry(data, run_id) for run_id, run in data['runs'].items()
+                if line is None or run['line'] == line]
+
+    # -----------------------------------
+    # Escritura
+    # -----------------------------------
+    def _update(self, change):
+        self.models_dir.mkdir(parents=True, exist_ok=True)
+        with locked(self.lock_path):
+            _cache.pop(self.path, None)
+            data = self.load()
+            change(data)
+            data['updated'] = datetime.datetime.now().isoformat()
+            tmp = self.path.with_suffix('.tmp')
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump(data, f, indent=2)
+            tmp.replace(self.path)
+
+    def publish(self, run_id: str, line: str, artifacts: dict, metrics: dict, data_fingerprint: str,
+                features: list, activate: bool = True, kind: str = RECURSIVE) -> str:
+        """
+        Registra un entrenamiento cuyos artefactos (`{'model': Path, 'pipeline': Path}`) ya están
+        escritos en el directorio de modelos y, por defecto, lo deja activo para su línea y familia.
+        """
+        if kind not in KINDS:
+            raise ValueError(f"Familia de modelo desconocida: {kind}")
+        for path in artifacts.values():
+            if not Path(path).exists():
+                raise FileNotFoundError(f"Artefacto no encontrado al publicar {run_id}: {path}")
+
+        def change(data):
+            data['runs'][run_id] = {
+                'line': line,
+                'kind': kind,
+                'created': datetime.datetime.now().isoformat(),
+                'artifacts': {k: Path(p).name for k, p in artifacts.items()},
+                'metrics': metrics,
+                'data_fingerprint': data_fingerprint,
+                'features': list(features),
+            }
+            if activate:
+                data['active'][active_key(line, kind)] = run_id
+        self._update(change)
+        return run_id
+
+    def add_artifact(self, run_id: str, name: str, path: Path):
+        """
+        Agrega un artefacto derivado (p.ej. la exportación de inferencia) a un entrenamiento ya publicado.
+        """
+        if not Path(path).exists():
+            raise FileNotFoundError(f"Artefacto no encontrado al publicar {run_id}: {path}")
+
+        def change(data):
+            data['runs'][run_id]['artifacts'][name] = Path(path).name
+        self._update(change)
+
+    def activate(self, line: str, run_id: str):
+        def change(data):
+            run = data['runs'].get(run_id, {})
+            if run.get('line') != line:
+                raise KeyError(f"No hay un entrenamiento {run_id} para la línea {line}")
+            data['active'][active_key(line, run.get('kind', RECURSIVE))] = run_id
+        self._update(change)
+
+# -----------------------------------
+# Main
+# -----------------------------------
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Versiones de modelo registradas por línea.")
+    parser.add_argument('--models-dir', type=Path, default=Path('models'))
+    parser.add_argument('--activate', nargs=2, metavar=('LINEA', 'RUN_ID'),
+                        help='Activa un entrenamiento anterior de la línea')
+    args = parser.parse_args(argv)
+
+    registry = ModelRegistry(args.models_dir)
+    if args.activate:
+        registry.activate(*args.activate)
+    active = registry.load()['active']
+    for entry in sorted(registry.runs(), key=lambda e: (e['line'], e['kind'], e['created'])):
+        mark = '*' if active.get(active_key(entry['line'], entry['kind'])) == entry['run_id'] else ' '
+        metrics = ', '.join(f"{k}={v:.4f}" if isinstance(v, float) else f"{k}={v}" for k, v in entry['metrics'].items())
+        print(f"{mark} {entry['line']:<10} {entry['kind']:<9} {entry['run_id']:<35} {entry['created'][:19]}  {metrics}")
+
+if __name__ == '__main__':
+    main()
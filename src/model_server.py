@@ -0,0 +1,174 @@
+"""
+src/model_server.py
+Servicio de pronóstico persistente dentro del proceso Flask:
+- Carga cada modelo y su pipeline una sola vez (sin arrancar Python/TensorFlow por request)
+- Un forecaster por versión de modelo: la activa de cada línea en el registro (model_registry.py)
+  o el set compartido anterior al registro
+- Recarga en caliente cuando train.py publica una versión nueva (una lectura del registro, sin
+  listar el directorio de modelos)
+- Mantiene en memoria el histórico de cada línea pedida (sólo sus particiones)
+  y lo descarta cuando cambia el manifest del dataset final o merged
+- Escribe los mismos CSV que predict.py para /forecast
+- Caché de resultados por (línea, horas, versión de modelo, versión de dataset)
+- Familia de modelo por request (`method`): recursivo o directo multi-horizonte; cada una con su
+  versión activa y sus entradas de caché (clave `linea:direct`, ver model_registry.active_key)
+"""
+import threading
+from pathlib import Path
+from typing import Optional
+from forecast_cache import ForecastCache, dataset_fingerprint
+from forecast_engine import make_forecaster
+from model_registry import RECURSIVE, active_key
+from predict import group_by_artifacts, load_artifacts, latest_file, prepare_history, resolve_artifacts, write_forecasts
+import datalake
+
+
+class ForecastService:
+    """
+    Mantiene el forecaster listo en memoria. Cada request sólo hace unos `stat`
+    para detectar artefactos nuevos; el modelo se carga de nuevo únicamente cuando cambian.
+    """
+    def __init__(self, root_dir: Path, lags: list, roll_windows: list, cache: Optional[ForecastCache] = None):
+        self.root_dir = Path(root_dir)
+        self.processed_dir = self.root_dir / 'data' / 'processed'
+        self.final_dir = self.root_dir / 'data' / 'processed' / 'final'
+        self.final_lake = self.root_dir / datalake.FINAL_LAKE
+        self.merged_lake = self.root_dir / datalake.MERGED_LAKE
+        self.models_dir = self.root_dir / 'models'
+        self.output_dir = self.root_dir / 'data' / 'predictions'
+        self.lags = lags
+        self.roll_windows = roll_windows
+        self.cache = cache if cache is not None else ForecastCache()
+
+        self._lock = threading.RLock()
+        self._forecasters: dict = {}  # versión del modelo -> forecaster
+        self._line_models: dict = {}  # línea -> versión en uso
+        self._histories: dict = {}
+        self._data_version: Optional[str] = None
+
+    # -----------------------------------
+    # Artefactos
+    # -----------------------------------
+    def _refresh_models(self, lines: list, method: str = RECURSIVE) -> list:
+        """
+        [(forecaster, versión, [líneas])] con los artefactos actuales de `lines` para la familia
+        `method`; descarta los forecasters que ya no usa ninguna línea.
+        """
+        groups = []
+        for paths, version, group in group_by_artifacts(self.models_dir, lines, method):
+            forecaster = self._forecasters.get(version)
+            previous = self._line_models.get(active_key(group[0], method))
+            # Sin registro, un set incompleto indica un entrenamiento en curso: se conserva el actual
+            complete = 'pipeline' in paths or all(paths[k].exists() for k in ('scaler', 'feature_names'))
+            if forecaster is None and not complete and previous in self._forecasters:
+                version, forecaster = previous, self._forecasters[previous]
+            if forecaster is None:
+                model, pipeline = load_artifacts(paths, self.lags, self.roll_windows)
+                forecaster = make_forecaster(model, pipeline)
+                self._forecasters[version] = forecaster
+                print(f"[SERVER] Modelo cargado: {paths['model'].name} ({', '.join(group)})")
+            self._line_models.update({active_key(line, method): version for line in group})
+            groups.append((forecaster, version, group))
+
+        in_use = set(self._line_models.values())
+        for key in [k for k in self._forecasters if k not in in_use]:
+            del self._forecasters[key]
+        return groups
+
+    def _dataset_paths(self) -> list:
+        # El merge también invalida: un merged nuevo implica que el pronóstico quedará desactualizado
+        paths = [datalake.manifest_path(root) for root in (self.final_lake, self.merged_lake) if datalake.exists(root)]
+        if not datalake.exists(self.final_lake):
+            paths.insert(0, latest_file(self.final_dir, 'dataset_final_*.parquet'))
+        return paths
+
+    def _refresh_data(self) -> str:
+        # Versión de dataset vigente; si cambió se descartan los históricos en memoria
+        version = dataset_fingerprint(self._dataset_paths())
+        if version != self._data_version:
+            self._histories = {}
+            self._data_version = version
+        return version
+
+    def _load_histories(self, lines: list) -> dict:
+        histories = {}
+        for line in lines:
+            if line not in self._histories:
+                df = datalake.read_dataset(self.final_lake, self.final_dir, 'dataset_final_*.parquet', line=line)
+                if df.empty:
+                    print(f"[SERVER] Sin datos para la línea {line}, se omite")
+                    continue
+                self._histories[line] = prepare_history(df)
+                print(f"[SERVER] Histórico cargado: {line} ({len(df)} filas)")
+            histories[line] = self._histories[line]
+        if not histories:
+            raise ValueError(f"No hay datos para ninguna de las líneas {lines}")
+        return histories
+
+    def versions(self, line: str, method: str = RECURSIVE) -> tuple:
+        """
+        (versión del modelo de la línea, versión de dataset) actuales en disco: el run_id activo
+        del registro (o el hash memorizado de los artefactos anteriores) y `stat` de los manifests.
+        """
+        _, model_version = resolve_artifacts(self.models_dir, line, method)
+        return model_version, dataset_fingerprint(self._dataset_paths())
+
+    def refresh(self, lines: list, method: str = RECURSIVE) -> list:
+        with self._lock:
+            groups = self._refresh_models(lines, method)
+            data_version = self._refresh_data()
+            for _, version, group in groups:
+                for line in group:
+                    self.cache.retain(version, data_version, line=active_key(line, method))
+            return groups
+
+    # -----------------------------------
+    # Pronóstico
+    # -----------------------------------
+    def forecast_batch(self, lines: list, hours_list: list, progress=None, method: str = RECURSIVE) -> tuple:
+        """
+        Igual que predict.predict_batch pero reutilizando modelo y datos en memoria.
+        Devuelve ({línea: DataFrame}, {(línea, horas): ruta CSV}).
+        """
+        with self._lock:
+            data_version = self._refresh_data()
+            histories = self._load_histories(lines)
+            groups = self.refresh(list(histories), method)
+            steps = max(hours_list) * 60 * 2
+            results = {}
+            for i, (forecaster, version, group) in enumerate(groups):
+                # Progreso global repartido entre los modelos
+                step_progress = None if progress is None else (lambda f, i=i: progress((i + f) / len(groups)))
+                batch = forecaster.forecast_batch({line: histories[line] for line in group}, steps, progress=step_progress)
+                for line, df in batch.items():
+                    self.cache.put(active_key(line, method), df, version, data_version)
+                results.update(batch)
+        out_files = write_forecasts(results, hours_list, self.output_dir, method)
+        return results, out_files
+
+    def cached(self, line: str, hours: int, method: str = RECURSIVE, versions: Optional[tuple] = None):
+        """
+        Pronóstico en caché para los artefactos actuales en disco (o las `versions` ya leídas), o None.
+        """
+        model_version, data_version = versions or self.versions(line, method)
+        return self.cache.get(active_key(line, method), hours, model_version, data_version)
+
+    def forecast(self, line: str, hours: int, write_csv: bool = True, progress=None, compute: bool = True,
+                 method: str = RECURSIVE):
+        """
+        Sirve desde caché si modelo y dataset no cambiaron (recortando un horizonte
+        mayor si hace falta); en otro caso calcula y guarda el resultado.
+        Con compute=False devuelve (None, None) si no está en caché.
+        """
+        df = self.cached(line, hours, method)
+        if df is None:
+            if not compute:
+                return None, None
+            results, out_files = self.forecast_batch([line], [hours], progress=progress, method=method)
+            if line not in results:
+                raise ValueError(f"No hay histórico suficiente para pronosticar {line}")
+            return results[line], out_files[(line, hours)]
+        fpath = None
+        if write_csv:
+            fpath = write_forecasts({line: df}, [hours], self.output_dir, method)[(line, hours)]
+        return df, fpath
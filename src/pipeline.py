@@ -0,0 +1,54 @@
+"""
+src/pipeline.py
+Punto de entrada único del pipeline con un subcomando por etapa:
+    python src/pipeline.py ingest
+    python src/pipeline.py merge --incremental
+    python src/pipeline.py train --line linea03
+    python src/pipeline.py predict --all-lines --hours 2 9
+    python src/pipeline.py run
+- Sólo importa el módulo de la etapa elegida, después de parsear la línea de comandos:
+  `--help` e `ingest` arrancan sin pandas, NumPy ni TensorFlow
+- Cada módulo expone `main(argv)`; los argumentos tras el subcomando se le pasan tal cual
+  (`pipeline.py train --help` muestra la ayuda de train.py)
+- Los scripts siguen pudiendo ejecutarse directamente (python src/train.py ...)
+"""
+import argparse
+import importlib
+import sys
+
+# subcomando -> (módulo, descripción)
+STAGES = {
+    'ingest':      ('ingest', 'Copia los CSV del PLC a data/raw/'),
+    'merge':       ('merge_quality_availability', 'Merge de calidad y disponibilidad'),
+    'prepare':     ('prepare', 'Feature engineering del dataset merged'),
+    'train':       ('train', 'Entrena el modelo de una línea'),
+    'train-lines': ('train_lines', 'Entrena un modelo por línea en paralelo'),
+    'predict':     ('predict', 'Pronóstico multi-step por línea'),
+    'export':      ('inference_export', 'Exporta las versiones activas a inferencia NumPy'),
+    'registry':    ('model_registry', 'Lista o activa versiones de modelo'),
+    'run':         ('pipeline_dag', 'Todas las etapas como DAG (omite las que no tienen entradas nuevas)'),
+    'watch':       ('watcher', 'Micro-batches de merge, features y pronóstico al llegar CSV nuevos'),
+    'telemetry':   ('telemetry', 'Receptor HTTP de telemetría en vivo con pronóstico por bucket de 30 s'),
+}
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog='pipeline.py', description="Pipeline de pronóstico de velocidad de producción.",
+        epilog="Ayuda de cada etapa: pipeline.py <etapa> --help")
+    sub = parser.add_subparsers(dest='stage', metavar='<etapa>', required=True)
+    for name, (_, help_text) in STAGES.items():
+        # La ayuda y los argumentos de la etapa los resuelve su propio main()
+        sub.add_parser(name, help=help_text, add_help=False)
+    return parser
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else list(argv)
+    stage = build_parser().parse_args(argv[:1]).stage
+    module = importlib.import_module(STAGES[stage][0])
+    sys.argv[0] = f"pipeline.py {stage}"  # prog de la ayuda/errores de la etapa
+    return module.main(argv[1:])
+
+
+if __name__ == '__main__':
+    main()
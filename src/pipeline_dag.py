@@ -0,0 +1,290 @@
+"""
+src/pipeline_dag.py
+Ejecución del pipeline como DAG de tareas dependientes, en lugar de cron encadenados por minutos:
+    ingest → merge → prepare → train:<línea> → predict:<línea>
+- Una tarea arranca cuando terminan sus dependencias; si una falla, las que dependen de ella
+  quedan bloqueadas (no corren sobre datos a medio escribir)
+- Antes de correr, cada tarea calcula el fingerprint de contenido de sus entradas y se omite
+  si coincide con el de su última ejecución exitosa (`data/pipeline_state.json`):
+  ingest ← listado del share, merge ← sha256 de los CSV raw, prepare ← manifest de merged +
+  lags/roll_windows, train:<línea> ← particiones de la línea en el dataset final,
+  predict:<línea> ← versión activa del modelo + particiones de la línea + horizontes
+- Las ramas independientes corren en paralelo (`dag_workers` hilos); los entrenamientos se
+  limitan a `train_workers` a la vez con los hilos de TensorFlow repartidos como en train_lines.py
+- Duración, estado y fingerprint de cada tarea se guardan en el estado y en
+  `data/pipeline_runs.jsonl` (una línea por corrida)
+"""
+import argparse
+import datetime
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from pathlib import Path
+from typing import Optional, Sequence
+from config import get_pipeline_config
+
+# Sólo stdlib + config a nivel de módulo: los fingerprints importan datalake/predict al correr.
+
+STATE_PATH = Path('data/pipeline_state.json')
+RUNS_PATH  = Path('data/pipeline_runs.jsonl')
+PIPELINE   = str(Path(__file__).resolve().parent / 'pipeline.py')
+
+SUCCEEDED, SKIPPED, FAILED, BLOCKED = 'succeeded', 'skipped', 'failed', 'blocked'
+OK = (SUCCEEDED, SKIPPED)
+
+
+class Task:
+    """
+    Nodo del DAG: `action()` ejecuta la tarea y `fingerprint()` resume sus entradas
+    (None = correr siempre). `group` limita cuántas tareas del mismo grupo corren a la vez.
+    """
+    def __init__(self, name: str, action, deps: Sequence[str] = (), fingerprint=None, group: Optional[str] = None):
+        self.name = name
+        self.action = action
+        self.deps = list(deps)
+        self.fingerprint = fingerprint
+        self.group = group
+
+
+def _digest(*parts) -> str:
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode()).hexdigest()[:16]
+
+# -----------------------------------
+# Estado
+# -----------------------------------
+def load_state(path: Path = STATE_PATH) -> dict:
+    if not Path(path).exists():
+        return {'tasks': {}}
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def _save_json(path: Path, data: dict):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix('.tmp')
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=2)
+    tmp.replace(path)
+
+# -----------------------------------
+# Ejecutor
+# -----------------------------------
+def topological_order(tasks: list) -> list:
+    by_name = {t.name: t for t in tasks}
+    order, visiting, done = [], set(), set()
+
+    def visit(name, path):
+        if name in done:
+            return
+        if name not in by_name:
+            raise ValueError(f"Dependencia desconocida en el DAG: {name} (desde {path[-1]})")
+        if name in visiting:
+            raise ValueError(f"Ciclo en el DAG: {' → '.join(path + [name])}")
+        visiting.add(name)
+        for dep in by_name[name].deps:
+            visit(dep, path + [name])
+        visiting.discard(name)
+        done.add(name)
+        order.append(by_name[name])
+
+    for task in tasks:
+        visit(task.name, [])
+    return order
+
+def run_dag(tasks: list, state_path: Path = STATE_PATH, runs_path: Path = RUNS_PATH, max_workers: int = 2,
+            limits: Optional[dict] = None, force: bool = False) -> dict:
+    """
+    Corre las tareas respetando dependencias y límites por grupo. Devuelve
+    {'started', 'seconds', 'tasks': {nombre: {status, seconds, fingerprint, error}}}.
+    """
+    order = topological_order(tasks)
+    limits = limits or {}
+    state = load_state(state_path)
+    state_lock = threading.Lock()
+    records: dict = {}
+    started = datetime.datetime.now().isoformat()
+    start = time.perf_counter()
+
+    def execute(task: Task) -> dict:
+        t0 = time.perf_counter()
+        record: dict = {'fingerprint': None, 'error': None}
+        try:
+            record['fingerprint'] = task.fingerprint() if task.fingerprint else None
+            previous = state['tasks'].get(task.name, {})
+            if (not force and record['fingerprint'] is not None and previous.get('status') == SUCCEEDED
+                    and previous.get('fingerprint') == record['fingerprint']):
+                record['status'] = SKIPPED
+            else:
+                task.action()
+                record['status'] = SUCCEEDED
+        except (Exception, SystemExit) as e:
+            record.update(status=FAILED, error=f"{type(e).__name__}: {e}")
+        record['seconds'] = round(time.perf_counter() - t0, 3)
+        # Una omitida conserva el estado anterior; una fallida lo invalida para que corra la próxima vez
+        if record['status'] != SKIPPED:
+            with state_lock:
+                state['tasks'][task.name] = dict(record, finished=datetime.datetime.now().isoformat())
+                _save_json(Path(state_path), state)
+        return record
+
+    pending = list(order)
+    running: dict = {}  # future -> task
+    with ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix='dag') as pool:
+        while pending or running:
+            busy: dict = {}
+            for task in running.values():
+                busy[task.group] = busy.get(task.group, 0) + 1
+            for task in list(pending):
+                deps = [records.get(d, {}).get('status') for d in task.deps]
+                if any(s in (FAILED, BLOCKED) for s in deps):
+                    failed = [d for d, s in zip(task.deps, deps) if s in (FAILED, BLOCKED)]
+                    records[task.name] = {'status': BLOCKED, 'seconds': 0.0, 'fingerprint': None,
+                                          'error': f"dependencia fallida: {', '.join(failed)}"}
+                    print(f"[DAG] {task.name}: bloqueada ({records[task.name]['error']})")
+                    pending.remove(task)
+                elif all(s in OK for s in deps):
+                    if task.group in limits and busy.get(task.group, 0) >= limits[task.group]:
+                        continue
+                    busy[task.group] = busy.get(task.group, 0) + 1
+                    print(f"[DAG] {task.name}: inicia")
+                    running[pool.submit(execute, task)] = task
+                    pending.remove(task)
+            if not running:
+                continue
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for fut in finished:
+                task = running.pop(fut)
+                records[task.name] = rec = fut.result()
+                detail = f" ({rec['error']})" if rec['error'] else ''
+                print(f"[DAG] {task.name}: {rec['status']} en {rec['seconds']:.2f} s{detail}")
+
+    run = {'started': started, 'seconds': round(time.perf_counter() - start, 3),
+           'tasks': {t.name: records[t.name] for t in order}}
+    runs_path = Path(runs_path)
+    runs_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(runs_path, 'a', encoding='utf-8') as f:
+        f.write(json.dumps(run) + '\n')
+    return run
+
+def report(run: dict):
+    counts: dict = {}
+    for rec in run['tasks'].values():
+        counts[rec['status']] = counts.get(rec['status'], 0) + 1
+    print(f"[DAG] Corrida en {run['seconds']:.1f} s: " + ', '.join(f"{n} {s}" for s, n in sorted(counts.items())))
+    for name, rec in run['tasks'].items():
+        print(f"[DAG]   {name:<20} {rec['status']:<10} {rec['seconds']:8.2f} s")
+
+# -----------------------------------
+# Fingerprints de entradas
+# -----------------------------------
+def share_fingerprint() -> str:
+    import ingest
+    return _digest(ingest.scan_share(ingest.server_dir()))
+
+def raw_fingerprint(raw_dir: Path = Path('data/raw')) -> str:
+    """
+    sha256 de los CSV más recientes de calidad y disponibilidad: el del manifest de ingest si el
+    archivo no cambió desde la copia, si no se calcula.
+    """
+    import ingest
+    manifest = ingest.Manifest(os.path.join(str(raw_dir), 'ingest_manifest.json')).data
+    digests = {}
+    for prefix in ingest.PREFIXES:
+        files = sorted(Path(raw_dir).glob(f'{prefix}_*.csv'), key=lambda p: p.stat().st_mtime)
+        if not files:
+            raise FileNotFoundError(f"No se encontró archivo raw con prefijo '{prefix}' en {raw_dir}")
+        entry = manifest.get(prefix, {})
+        st = files[-1].stat()
+        if (Path(entry.get('dst', '')).resolve() == files[-1].resolve() and entry.get('size') == st.st_size
+                and entry.get('mtime_ns') == st.st_mtime_ns):
+            digests[prefix] = entry['sha256']
+        else:
+            digests[prefix] = ingest.file_sha256(str(files[-1]))
+    return _digest(digests, get_pipeline_config().get('merged_schema', 'wide'))
+
+def merged_fingerprint() -> str:
+    import datalake
+    from feature_store import config_fingerprint
+    cfg = get_pipeline_config()
+    return _digest(datalake.content_fingerprint(datalake.MERGED_LAKE),
+                   config_fingerprint(cfg['lags'], cfg['roll_windows']))
+
+def line_fingerprint(line: str) -> str:
+    import datalake
+    return datalake.content_fingerprint(datalake.FINAL_LAKE, line)
+
+def forecast_fingerprint(line: str, hours: list, models_dir: Path = Path('models')) -> str:
+    from predict import resolve_artifacts
+    _, model_version = resolve_artifacts(models_dir, line)
+    return _digest(model_version, line_fingerprint(line), sorted(hours))
+
+# -----------------------------------
+# Definición del pipeline
+# -----------------------------------
+def run_stage(argv: list, env: Optional[dict] = None):
+    """
+    Corre una etapa como subproceso de pipeline.py (memoria y hilos de TensorFlow aislados).
+    """
+    subprocess.run([sys.executable, PIPELINE] + list(argv), check=True,
+                   env=None if env is None else dict(os.environ, **env))
+
+def train_env(n_lines: int, workers: int) -> dict:
+    from train_lines import thread_plan
+    _, intra, inter = thread_plan(n_lines, workers)
+    env = {var: str(intra) for var in ('OMP_NUM_THREADS', 'MKL_NUM_THREADS', 'OPENBLAS_NUM_THREADS',
+                                       'TF_NUM_INTRAOP_THREADS')}
+    env['TF_NUM_INTEROP_THREADS'] = str(inter)
+    return env
+
+def build_tasks(lines: list, hours: list, runner=run_stage, forecast=None, train_workers: int = 0) -> list:
+    """
+    Tareas del pipeline para `lines`. `runner(argv, env)` corre una etapa de pipeline.py;
+    `forecast(line, hours)` pronostica una línea (por defecto `pipeline.py predict`).
+    """
+    env = train_env(len(lines), train_workers)
+    if forecast is None:
+        forecast = lambda line, hours: runner(['predict', '--line', line, '--hours', *map(str, hours)], None)
+    tasks = [
+        Task('ingest', lambda: runner(['ingest'], None), fingerprint=share_fingerprint),
+        Task('merge', lambda: runner(['merge'], None), deps=['ingest'], fingerprint=raw_fingerprint),
+        Task('prepare', lambda: runner(['prepare'], None), deps=['merge'], fingerprint=merged_fingerprint),
+    ]
+    for line in lines:
+        tasks.append(Task(f'train:{line}', lambda line=line: runner(['train', '--line', line], env),
+                          deps=['prepare'], fingerprint=lambda line=line: line_fingerprint(line), group='train'))
+        tasks.append(Task(f'predict:{line}', lambda line=line: forecast(line, hours), deps=[f'train:{line}'],
+                          fingerprint=lambda line=line: forecast_fingerprint(line, hours)))
+    return tasks
+
+def run_pipeline(lines: Optional[list] = None, hours: Optional[list] = None, force: bool = False, runner=run_stage, forecast=None) -> dict:
+    cfg = get_pipeline_config()
+    lines = lines or cfg.get('lines', [cfg['line']])
+    hours = hours or [cfg['horizon_hours']]
+    workers = cfg.get('train_workers', 0)
+    from train_lines import thread_plan
+    train_slots, _, _ = thread_plan(len(lines), workers)
+    tasks = build_tasks(lines, hours, runner=runner, forecast=forecast, train_workers=workers)
+    return run_dag(tasks, max_workers=cfg.get('dag_workers', 2), limits={'train': train_slots}, force=force)
+
+# -----------------------------------
+# Main
+# -----------------------------------
+def main(argv=None):
+    cfg = get_pipeline_config()
+    parser = argparse.ArgumentParser(description="Corre ingest → merge → prepare → train → predict como DAG.")
+    parser.add_argument('--lines', type=str, nargs='+', default=cfg.get('lines', [cfg['line']]))
+    parser.add_argument('--hours', type=int, nargs='+', default=[cfg['horizon_hours']])
+    parser.add_argument('--force', action='store_true', help='Corre todas las tareas aunque sus entradas no cambiaran')
+    args = parser.parse_args(argv)
+
+    run = run_pipeline(args.lines, args.hours, force=args.force)
+    report(run)
+    if any(rec['status'] in (FAILED, BLOCKED) for rec in run['tasks'].values()):
+        raise SystemExit(1)
+
+if __name__ == '__main__':
+    main()
@@ -1,30 +1,50 @@
 """
 src/predict.py
 Script de pronóstico multi-step dinámico:
-- Parámetros vía línea de comandos: --line y --hours
+- Parámetros vía línea de comandos: --line (o --lines / --all-lines) y --hours
 - Carga config para lags y roll_windows
-- Lee último dataset final para la línea, genera device_idx
-- Recarga scaler y feature_names para consistencia
-- Ejecuta forecast por pasos de 30s recreando features
-- Guarda CSV nombrado forecast_{line}_{hours}h_{YYYY-MM-DD}.csv
+- Lee sólo las particiones del dataset final de la línea, genera device_idx
+- Usa la versión activa de cada línea según el registro de modelos (model_registry.py), sin
+  listar el directorio; si la línea no tiene, los artefactos anteriores al registro
+- Si la versión tiene exportación NumPy (inference_*.npz) la usa sin importar TensorFlow
+  (`inference_backend: keras` fuerza el modelo Keras)
+- Recarga el FeaturePipeline guardado con el modelo (orden de features, scaler, lags/roll_windows);
+  con artefactos anteriores lo arma a partir de scaler y feature_names
+- Ejecuta forecast por pasos de 30s con estado en ring buffers (ver forecast_engine.py)
+- --method direct: usa el modelo directo multi-horizonte activo de la línea (train.py --direct),
+  todo el horizonte en una sola pasada; por defecto `forecast_method` de config.yaml (recursive)
+- Modo batch: las líneas que comparten modelo avanzan en lockstep, varios horizontes en una sola corrida
+- Guarda CSV nombrado forecast_{line}_{hours}h_{YYYY-MM-DD}.csv (y forecast_all_{hours}h_... en batch);
+  con el modelo directo forecast_{line}_{hours}h_direct_{YYYY-MM-DD}.csv
 """
 import argparse
 import pandas as pd
-import numpy as np
 from pathlib import Path
+from typing import Optional
 import datetime
 import joblib
-from tensorflow.keras.models import load_model
 from config import get_pipeline_config
+from forecast_cache import artifacts_version
+from model_registry import KINDS, RECURSIVE, ModelRegistry
+from feature_pipeline import FeaturePipeline
+from forecast_engine import make_forecaster
+from inference_export import NumpyMLP
+import datalake
 
 # -----------------------------------
 # Parse command-line arguments
 # -----------------------------------
-def parse_args():
+def parse_args(argv=None):
     parser = argparse.ArgumentParser(description="Pronóstico multi-step de velocidad de producción.")
-    parser.add_argument('--line',  type=str, required=True, help='Línea de producción (ej. linea03)')
-    parser.add_argument('--hours', type=int, required=True, help='Horizonte de predicción en horas')
-    return parser.parse_args()
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument('--line',  type=str, help='Línea de producción (ej. linea03)')
+    target.add_argument('--lines', type=str, nargs='+', help='Varias líneas en un solo batch (ej. linea01 linea03)')
+    target.add_argument('--all-lines', action='store_true', help='Todas las líneas de `lines` en config.yaml')
+    parser.add_argument('--hours', type=int, nargs='+', required=True,
+                        help='Horizonte(s) de predicción en horas; los menores se recortan del mayor')
+    parser.add_argument('--method', choices=KINDS, default=None,
+                        help='Familia de modelo: recursive (paso a paso) o direct (multi-horizonte)')
+    return parser.parse_args(argv)
 
 # -----------------------------------
 # Utilidades
@@ -36,146 +56,178 @@ def latest_file(directory: Path, pattern: str) -> Path:
     return files[-1]
 
 # -----------------------------------
-# Agregar time features
+# Carga de artefactos y datos
 # -----------------------------------
-def add_time_features(df):
-    t = pd.to_datetime(df['_time'].iloc[0])
-    
-    # Features básicos
-    df['hour'] = t.hour
-    df['minute'] = t.minute
-    df['dayofweek'] = t.dayofweek
-    df['is_weekend'] = int(t.dayofweek >= 5)
-    
-    # Features cíclicos
-    df['hour_sin'] = np.sin(2 * np.pi * t.hour/24)
-    df['hour_cos'] = np.cos(2 * np.pi * t.hour/24)
-    df['minute_sin'] = np.sin(2 * np.pi * t.minute/60)
-    df['minute_cos'] = np.cos(2 * np.pi * t.minute/60)
-    df['dayofweek_sin'] = np.sin(2 * np.pi * t.dayofweek/7)
-    df['dayofweek_cos'] = np.cos(2 * np.pi * t.dayofweek/7)
-    
-    # Turno
-    df['shift'] = 'day' if 7 <= t.hour < 19 else 'night'
-    
+def resolve_artifacts(models_dir: Path, line: Optional[str] = None, kind: str = RECURSIVE) -> tuple:
+    """
+    (rutas, versión) de los artefactos de la línea: la versión activa del registro
+    (la versión es su run_id) o, sin registro, los anteriores por glob y hash de contenido.
+    El modelo directo sólo existe en el registro.
+    """
+    entry = ModelRegistry(models_dir).active(line, kind) if line is not None else None
+    if entry is not None:
+        return entry['paths'], entry['run_id']
+    if kind != RECURSIVE:
+        raise FileNotFoundError(f"No hay modelo {kind} registrado para la línea {line} (train.py --{kind})")
+    paths = legacy_artifact_paths(models_dir, line)
+    return paths, artifacts_version(p for p in paths.values() if p.exists())
+
+def artifact_paths(models_dir: Path, line: Optional[str] = None) -> dict:
+    return resolve_artifacts(models_dir, line)[0]
+
+def legacy_artifact_paths(models_dir: Path, line: Optional[str] = None) -> dict:
+    # Artefactos de la línea sin registrar: modelo y pipeline con el mismo tag
+    if line is not None and any(models_dir.glob(f'model_{line}_*.h5')):
+        model = latest_file(models_dir, f'model_{line}_*.h5')
+        return {'model': model, 'pipeline': models_dir / model.name.replace('model_', 'pipeline_', 1).replace('.h5', '.pkl')}
+
+    # Set compartido anterior: el resto de artefactos con el mismo sufijo de fecha que el modelo
+    model = latest_file(models_dir, 'model_????-??-??.h5')
+    run = model.stem.split('_')[-1]
+    paths = {
+        'scaler': models_dir / f'scaler_{run}.pkl',
+        'feature_names': models_dir / f'feature_names_{run}.pkl',
+        'model': model,
+    }
+    # Pipeline de features del mismo entrenamiento (no existe en modelos anteriores)
+    pipeline = models_dir / f'pipeline_{run}.pkl'
+    if pipeline.exists():
+        paths['pipeline'] = pipeline
+    return paths
+
+def group_by_artifacts(models_dir: Path, lines: list, kind: str = RECURSIVE) -> list:
+    """
+    [(artefactos, versión, [líneas])]: las líneas sin modelo propio comparten el set compartido.
+    """
+    groups: dict = {}
+    for line in lines:
+        paths, version = resolve_artifacts(models_dir, line, kind)
+        groups.setdefault(version, (paths, version, []))[2].append(line)
+    return list(groups.values())
+
+def load_artifacts(paths: dict, lags: list, roll_windows: list, backend: Optional[str] = None):
+    """
+    Devuelve (modelo, FeaturePipeline). `lags`/`roll_windows` sólo se usan con artefactos
+    sin pipeline; si hay pipeline manda el guardado en el entrenamiento. El modelo es el
+    `NumpyMLP` exportado si existe (salvo backend 'keras'); si no, el modelo Keras.
+    """
+    if 'pipeline' in paths:
+        pipeline = FeaturePipeline.load(paths['pipeline'])
+    else:
+        pipeline = FeaturePipeline(lags, roll_windows, joblib.load(paths['feature_names']), joblib.load(paths['scaler']))
+    backend = backend or get_pipeline_config().get('inference_backend', 'numpy')
+    if backend == 'numpy' and 'inference' in paths:
+        model, model_path = NumpyMLP.load(paths['inference']), paths['inference']
+    else:
+        # TensorFlow sólo se importa si hace falta el modelo Keras
+        from tensorflow.keras.models import load_model
+        model, model_path = load_model(paths['model'], compile=False), paths['model']
+    print(f"[PREDICT] Usando pipeline={(paths.get('pipeline') or paths['scaler']).name}, "
+          f"features={len(pipeline.feature_names)}, modelo={model_path.name}")
+    return model, pipeline
+
+def prepare_history(df: pd.DataFrame) -> pd.DataFrame:
+    df = df.sort_values('_time', kind='stable').reset_index(drop=True)
+    # Mantener o generar device_idx
+    if 'device_idx' not in df.columns:
+        df['device_idx'] = df['device_id'].astype('category').cat.codes
     return df
 
-# -----------------------------------
-# Validar y limitar predicción
-# -----------------------------------
-def validate_prediction(pred, historical_data, max_change_percent=20):
-    # Obtener estadísticas históricas
-    mean_vel = historical_data['velocity_bpm'].mean()
-    std_vel = historical_data['velocity_bpm'].std()
-    min_vel = historical_data['velocity_bpm'].min()
-    max_vel = historical_data['velocity_bpm'].max()
-    
-    # Límites absolutos basados en datos históricos
-    lower_bound = max(0, min_vel * 0.5)  # No permitir menos del 50% del mínimo histórico
-    upper_bound = max_vel * 1.2  # No permitir más del 120% del máximo histórico
-    
-    # Límites basados en la media y desviación estándar
-    std_lower = mean_vel - 3 * std_vel
-    std_upper = mean_vel + 3 * std_vel
-    
-    # Aplicar límites
-    pred = np.clip(pred, lower_bound, upper_bound)
-    pred = np.clip(pred, std_lower, std_upper)
-    
-    return float(pred)
+def load_histories(final_dir: Path, lines: list, lake_dir: Path = datalake.FINAL_LAKE) -> dict:
+    """
+    Lee sólo las particiones de cada línea pedida (o el dataset_final legacy).
+    """
+    histories = {}
+    for line in lines:
+        df = datalake.read_dataset(lake_dir, final_dir, 'dataset_final_*.parquet', line=line)
+        if df.empty:
+            print(f"[PREDICT] Sin datos para la línea {line}, se omite")
+            continue
+        histories[line] = prepare_history(df)
+    if not histories:
+        raise ValueError(f"No hay datos para ninguna de las líneas {lines}")
+    return histories
+
+def write_forecasts(results: dict, hours_list: list, output_dir: Path, method: str = RECURSIVE) -> dict:
+    """
+    Escribe un CSV por línea y horizonte (recortado del horizonte mayor)
+    más uno combinado por horizonte cuando hay varias líneas.
+    """
+    output_dir.mkdir(parents=True, exist_ok=True)
+    today = datetime.date.today().isoformat()
+    # El CSV del modelo directo no pisa al recursivo
+    suffix = today if method == RECURSIVE else f"{method}_{today}"
+    out_files = {}
+    for hours in sorted(set(hours_list)):
+        n = hours * 60 * 2
+        combined = []
+        for line, forecast in results.items():
+            out_file = output_dir / f"forecast_{line}_{hours}h_{suffix}.csv"
+            forecast.iloc[:n].to_csv(out_file, index=False)
+            out_files[(line, hours)] = out_file
+            combined.append(forecast.iloc[:n].assign(linea=line)[['linea', '_time', 'predicted_velocity_bpm']])
+        if len(results) > 1:
+            out_file = output_dir / f"forecast_all_{hours}h_{suffix}.csv"
+            pd.concat(combined, ignore_index=True).to_csv(out_file, index=False)
+            out_files[('all', hours)] = out_file
+    return out_files
 
 # -----------------------------------
 # Pronóstico multi-step
 # -----------------------------------
-def predict_multi_step(line: str, hours: int, lags: list, roll_windows: list):
+def predict_batch(lines: list, hours_list: list, lags: list, roll_windows: list, method: str = RECURSIVE) -> dict:
+    """
+    Avanza en lockstep las líneas de cada modelo (una llamada al modelo por paso de 30 s,
+    o una sola con el modelo directo) hasta el horizonte mayor y recorta los horizontes
+    menores de ese resultado.
+    """
     # Directorios
     ROOT_DIR   = Path.cwd()
     FINAL_DIR  = ROOT_DIR / 'data' / 'processed' / 'final'
     MODELS_DIR = ROOT_DIR / 'models'
     OUTPUT_DIR = ROOT_DIR / 'data' / 'predictions'
-    OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
-
-    # Cargar scaler, modelo y feature_names
-    scaler_path = latest_file(MODELS_DIR, 'scaler_*.pkl')
-    feature_names_path = latest_file(MODELS_DIR, 'feature_names_*.pkl')
-    model_path  = latest_file(MODELS_DIR, 'model_*.h5')
-
-    scaler = joblib.load(scaler_path)
-    feature_names = joblib.load(feature_names_path)
-    model  = load_model(model_path, compile=False)
-    print(f"[PREDICT] Usando scaler={scaler_path.name}, features={len(feature_names)}, modelo={model_path.name}")
-
-    # Cargar dataset final filtrado
-    parquet_pattern = f"dataset_final_*.parquet"
-    df = pd.read_parquet(latest_file(FINAL_DIR, parquet_pattern))
-    df = df[df['linea'] == line].sort_values('_time').reset_index(drop=True)
-    
-    # Mantener datos históricos para validación
-    historical_data = df.copy()
-    
-    # Mantener o generar device_idx
-    if 'device_idx' not in df.columns:
-        df['device_idx'] = df['device_id'].astype('category').cat.codes
 
-    # Forecast iterativo
-    steps = hours * 60 * 2  # intervalos de 30s
-    results = []
-    last_pred = None
-
-    for _ in range(steps):
-        last = df.iloc[-1:].copy()
-        next_time = pd.to_datetime(last['_time'].iloc[0]) + pd.Timedelta(seconds=30)
-        last['_time'] = next_time
-
-        # Time features, lags y rollings
-        last = add_time_features(last)
-        for lag in lags:
-            last[f'lag_{lag}'] = df['velocity_bpm'].iloc[-lag]
-        for w in roll_windows:
-            last[f'roll_mean_{w}'] = df['velocity_bpm'].iloc[-w:].mean()
-
-        # Seleccionar las mismas features que en entrenamiento
-        X_df = last[feature_names]
-        # Escalar
-        X_scaled = scaler.transform(X_df)
-
-        # Predicción
-        y_pred = model.predict(X_scaled, verbose=0)[0,0]
-        
-        # Validar y limitar la predicción
-        y_pred = validate_prediction(y_pred, historical_data)
-        
-        # Si es la primera predicción, guardarla
-        if last_pred is None:
-            last_pred = y_pred
-        
-        # Limitar el cambio porcentual entre predicciones consecutivas
-        max_change = last_pred * 0.2  # máximo 20% de cambio
-        y_pred = np.clip(y_pred, last_pred - max_change, last_pred + max_change)
-        
-        last['velocity_bpm'] = y_pred
-        last_pred = y_pred
-
-        # Agregar a df y resultados
-        df = pd.concat([df, last], ignore_index=True)
-        results.append({'_time': next_time, 'predicted_velocity_bpm': float(y_pred)})
-
-    # Guardar CSV
-    today = datetime.date.today().isoformat()
-    out_file = OUTPUT_DIR / f"forecast_{line}_{hours}h_{today}.csv"
-    pd.DataFrame(results).to_csv(out_file, index=False)
-    print(f"[PREDICT] Pronóstico de {steps} pasos guardado en: {out_file}")
-    return out_file
+    # Cargar dataset final sólo de las líneas pedidas
+    histories = load_histories(FINAL_DIR, lines)
+
+    # Forecast iterativo con estado en ring buffers, un batch por modelo
+    steps = max(hours_list) * 60 * 2  # intervalos de 30s
+    results = {}
+    for paths, _, group in group_by_artifacts(MODELS_DIR, list(histories), method):
+        model, pipeline = load_artifacts(paths, lags, roll_windows)
+        forecaster = make_forecaster(model, pipeline)
+        results.update(forecaster.forecast_batch({line: histories[line] for line in group}, steps))
+    if not results:
+        raise ValueError(f"No hay histórico suficiente para pronosticar ninguna de las líneas {list(histories)}")
+
+    # Guardar CSVs por línea y combinados por horizonte
+    out_files = write_forecasts(results, hours_list, OUTPUT_DIR, method)
+    print(f"[PREDICT] Pronóstico {method} de {steps} pasos para {len(results)} línea(s) guardado en: {OUTPUT_DIR}")
+    return out_files
+
+def predict_multi_step(line: str, hours: int, lags: list, roll_windows: list):
+    out_files = predict_batch([line], [hours], lags, roll_windows)
+    return out_files[(line, hours)]
 
 # -----------------------------------
 # Main
 # -----------------------------------
-if __name__ == '__main__':
-    args = parse_args()
+def main(argv=None):
+    args = parse_args(argv)
     cfg = get_pipeline_config()
-    predict_multi_step(
-        line=args.line,
-        hours=args.hours,
+    if args.line:
+        lines = [args.line]
+    elif args.lines:
+        lines = args.lines
+    else:
+        lines = cfg.get('lines', [cfg['line']])
+    predict_batch(
+        lines=lines,
+        hours_list=args.hours,
         lags=cfg['lags'],
-        roll_windows=cfg['roll_windows']
+        roll_windows=cfg['roll_windows'],
+        method=args.method or cfg.get('forecast_method', RECURSIVE)
     )
+
+if __name__ == '__main__':
+    main()
@@ -1,86 +1,55 @@
 """
 src/prepare.py
 Feature engineering dinámico:
-- Carga el parquet fusionado más reciente para la línea configurada
-- Filtra por línea
-- Agrega lags y medias móviles según config.yaml
-- Crea features de tiempo
+- Carga el dataset fusionado (particionado) más reciente
+- Agrega lags y medias móviles según config.yaml por (linea, device_id), ver feature_engine.py
+- Crea features de tiempo (vectorizados)
 - Convierte device_id a índice numérico
-- Guarda dataset final listo para entrenamiento
+- Con el esquema compacto conserva stop_code (int8) y categorías; train.py expande stop_*
+- Guarda dataset final particionado (linea=/date=) listo para entrenamiento
+- Incremental por defecto: sólo calcula features de filas nuevas de merged (ver feature_store.py);
+  recalcula todo con --full o si cambian lags/roll_windows
 """
+import argparse
 import pandas as pd
-import glob
 from pathlib import Path
-import datetime
 from config import get_pipeline_config
-
-# -----------------------------------
-# Configuración dinámica
-# -----------------------------------
-cfg = get_pipeline_config()
-line         = cfg['line']
-lags         = cfg['lags']
-roll_windows = cfg['roll_windows']
+from feature_store import FeatureStore
+import datalake
 
 # Directorios
 PROC_DIR   = Path('data/processed')
 FINAL_DIR  = PROC_DIR / 'final'
-FINAL_DIR.mkdir(parents=True, exist_ok=True)
 
 # -----------------------------------
-# Obtener archivo más reciente
+# Cargar merged
 # -----------------------------------
-def latest_parquet(pattern: str):
-    files = sorted(
-        glob.glob(pattern),
-        key=lambda p: Path(p).stat().st_mtime
-    )
-    if not files:
-        raise FileNotFoundError(f"No se encontró archivo parquet con patrón {pattern}")
-    return Path(files[-1])
+def load_merged(start=None) -> pd.DataFrame:
+    """
+    Carga el dataset merged particionado (desde `start` si se indica);
+    si aún no existe, el último merged_*.parquet legacy.
+    """
+    print(f"[PREP] Cargando merged desde {datalake.MERGED_LAKE}" + (f" (filas desde {start})" if start is not None else ""))
+    compact = datalake.dataset_meta(datalake.MERGED_LAKE).get('schema') == 'compact'
+    return datalake.read_dataset(datalake.MERGED_LAKE, PROC_DIR, 'merged_*.parquet', start=start, categorical=compact)
 
 # -----------------------------------
 # Función principal
 # -----------------------------------
-if __name__ == '__main__':
-    # 1. Cargar último parquet merged para la línea
-    pattern = str(PROC_DIR / f"merged_*.parquet")
-    merged_path = latest_parquet(pattern)
-    print(f"[PREP] Cargando {merged_path}")
-    df = pd.read_parquet(merged_path)
-
-    # 2. Filtrar por línea y reset index
-    #df = df[df['linea'] == line].reset_index(drop=True)
-
-    # 3. Ordenar por tiempo
-    df = df.sort_values('_time').reset_index(drop=True)
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Feature engineering del dataset merged.")
+    parser.add_argument('--full', action='store_true', help='Recalcula los features de todo el histórico')
+    args = parser.parse_args(argv)
+    cfg = get_pipeline_config()
+    FINAL_DIR.mkdir(parents=True, exist_ok=True)
+
+    # 1. Cargar merged (sólo filas nuevas si el estado del feature store es válido)
+    # 2-8. Lags y rolling means por (linea, device_id), features de tiempo y device_idx;
+    #      se descartan las primeras max(lags) filas de cada dispositivo
+    # 9. Guardar/agregar al dataset final particionado
+    store = FeatureStore(FINAL_DIR, cfg['lags'], cfg['roll_windows'])
+    store.update(load_merged, full=args.full)
+    print(f"[PREP] Dataset final guardado en: {datalake.FINAL_LAKE}")
 
-    # 4. Convertir device_id a índice numérico (para embeddings)
-    df['device_idx'] = df['device_id'].astype('category').cat.codes
-
-    # 5. Añadir lags (pasos de 30s)
-    for lag in lags:
-        df[f'lag_{lag}'] = df['velocity_bpm'].shift(lag)
-
-    # 6. Añadir rolling means
-    for w in roll_windows:
-        df[f'roll_mean_{w}'] = df['velocity_bpm'].rolling(window=w, min_periods=1).mean()
-
-    # 7. Crear features de tiempo
-    df['_time'] = pd.to_datetime(df['_time'])
-    df['hour']       = df['_time'].dt.hour
-    df['minute']     = df['_time'].dt.minute
-    df['dayofweek']  = df['_time'].dt.dayofweek
-    df['is_weekend'] = (df['dayofweek'] >= 5).astype(int)
-    # Turno: 'day' si entre 7 y 18, 'night' en otro caso
-    df['shift'] = df['hour'].apply(lambda h: 'day' if 7 <= h < 19 else 'night')
-
-    # 8. Eliminar filas con NaNs de lags
-    min_lag = max(lags)
-    df_final = df.iloc[min_lag:].reset_index(drop=True)
-
-    # 9. Guardar dataset final
-    today = datetime.date.today().isoformat()
-    out_path = FINAL_DIR / f"dataset_final_{today}.parquet"
-    df_final.to_parquet(out_path, index=False)
-    print(f"[PREP] Dataset final guardado en: {out_path}")
+if __name__ == '__main__':
+    main()
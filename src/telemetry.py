@@ -0,0 +1,373 @@
+"""
+src/telemetry.py
+Receptor de telemetría en vivo del PLC (además de los CSV que deja en la carpeta):
+- Muestras de calidad (velocidad por device_id) y disponibilidad (estado y motivo de paro) como
+  JSON por HTTP: servidor local de prueba (`pipeline.py telemetry`) o `POST /telemetry` en la API
+- Mismo tratamiento que merge_and_clean: `_time` al piso de 30 s, motivo de paro a su grupo con
+  CAUSE_MAP ('Otros' si no está), una muestra por dispositivo y bucket (la primera) y la
+  availability más cercana del dispositivo dentro de ±30 s como state_flag/stop_code
+- Estado por dispositivo en ring buffers de tamaño max(lags, roll_windows): lags y medias móviles
+  como en feature_engine.py sin recalcular ventanas
+- Cuando una línea pasa a un bucket de 30 s nuevo cierra el anterior (una fila por dispositivo,
+  en orden de device_id) y recalcula su pronóstico desde el estado en memoria
+  (RecursiveForecaster.forecast_states con el buffer del dispositivo de la última fila, como
+  los lags de entrenamiento): ninguna actualización lee archivos
+- El estado se siembra una sola vez al arrancar con el dataset final de cada línea
+- Las muestras de un bucket ya cerrado se descartan (llegan igual por la carpeta del PLC);
+  las filas en vivo no se escriben en el data lake
+"""
+import argparse
+import datetime
+import json
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Optional
+from urllib.parse import parse_qs, urlparse
+import numpy as np
+import pandas as pd
+from numpy.typing import ArrayLike
+from config import get_pipeline_config
+from forecast_engine import VelocityStats
+from merge_quality_availability import CALIDAD_PREFIX, DISP_PREFIX, CAUSE_MAP, STOP_GROUPS
+from predict import load_histories
+import prepare
+
+BUCKET = pd.Timedelta('30s')
+STOP_INDEX = {group: code for code, group in enumerate(STOP_GROUPS)}
+
+
+# -----------------------------------
+# Estado por dispositivo
+# -----------------------------------
+class DeviceBuffer:
+    """
+    Últimas `size` velocidades de un dispositivo y la suma de cada ventana móvil.
+    `n` cuenta todas las filas vistas (para saber si un lag ya está completo).
+    """
+    def __init__(self, size: int, lags: list, roll_windows: list, history: ArrayLike = ()):
+        self.size = size
+        self.lags = list(lags)
+        self.windows = np.asarray(roll_windows, dtype=np.int64)
+        self.buf = np.zeros(size)
+        self.sums = np.zeros(len(self.windows))
+        self.pos = 0
+        self.n = 0
+        history = np.asarray(history, dtype=np.float64)
+        for value in history[-size:]:
+            self.push(value)
+        self.n = len(history)
+        self.avail: deque = deque(maxlen=4)  # (bucket, state_flag, stop_code) más recientes
+
+    def push(self, value: float):
+        leaving = self.n >= self.windows
+        self.sums -= np.where(leaving, self.buf[(self.pos - self.windows) % self.size], 0.0)
+        self.sums += value
+        self.buf[self.pos] = value
+        self.pos = (self.pos + 1) % self.size
+        self.n += 1
+        if self.pos == 0:
+            # Una vuelta completa: se recalculan las sumas para no acumular error de redondeo
+            ordered = np.roll(self.buf, -self.pos)
+            self.sums = np.array([ordered[self.size - min(w, self.n):].sum() for w in self.windows])
+
+    def lag(self, k: int) -> float:
+        return self.buf[(self.pos - k) % self.size]
+
+    def values(self) -> np.ndarray:
+        # Las `size` velocidades del buffer de la más antigua a la más reciente
+        return np.roll(self.buf, -self.pos)
+
+    def roll_means(self) -> np.ndarray:
+        return self.sums / np.minimum(self.n, self.windows)
+
+    def availability(self, bucket: pd.Timestamp) -> tuple:
+        """
+        (state_flag, stop_code) de la availability más cercana a `bucket` dentro de ±30 s,
+        como el merge asof; sin availability, (0, -1) como las filas sin match del merge.
+        """
+        best = None
+        for t, flag, code in self.avail:
+            gap = abs(t - bucket)
+            if gap <= BUCKET and (best is None or gap < best[0]):
+                best = (gap, flag, code)
+        return (0, -1) if best is None else best[1:]
+
+
+class LineState:
+    """
+    Estado de una línea para el pronóstico: buffer de velocidades de cada dispositivo, límites
+    acumulados de la línea y features de la última fila (el pronóstico sigue a su dispositivo).
+    """
+    def __init__(self, line: str, history: pd.DataFrame, size: int, lags: list, roll_windows: list):
+        self.line = line
+        self.stats = VelocityStats(history['velocity_bpm'].to_numpy(dtype=np.float64))
+        self.last_row = history.iloc[-1].to_dict()
+        self.last_time = pd.Timestamp(history['_time'].iloc[-1])
+        self.device_idx = dict(zip(history['device_id'].astype(object), history['device_idx'].astype(int)))
+        self.devices = {
+            dev: DeviceBuffer(size, lags, roll_windows, group['velocity_bpm'].to_numpy(dtype=np.float64))
+            for dev, group in history.groupby(history['device_id'].astype(object), sort=False)
+        }
+        self.pending: dict = {}  # bucket -> {device_id: muestra de calidad}
+
+
+# -----------------------------------
+# Servicio
+# -----------------------------------
+class TelemetryService:
+    def __init__(self, service, lines: list, hours: int, lags: list, roll_windows: list,
+                 final_dir: Path = prepare.FINAL_DIR, model_check_seconds: float = 60):
+        self.service = service
+        self.lines = list(lines)
+        self.hours = hours
+        self.lags = list(lags)
+        self.roll_windows = list(roll_windows)
+        self.size = int(max(self.lags + self.roll_windows))
+        self.model_check_seconds = model_check_seconds
+        self._lock = threading.Lock()
+        self._forecasters: dict = {}
+        self._checked: dict = {}
+        self.forecasts: dict = {}
+        self.counts = {'samples': 0, 'late': 0, 'rejected': 0, 'buckets': 0, 'forecasts': 0}
+        self.last_forecast_seconds: Optional[float] = None
+
+        # Única lectura de archivos: la cola del dataset final para sembrar el estado
+        histories = load_histories(Path(final_dir), self.lines)
+        self.states = {line: LineState(line, df, self.size, self.lags, self.roll_windows)
+                       for line, df in histories.items()}
+        for line, state in self.states.items():
+            print(f"[LIVE] {line}: estado sembrado hasta {state.last_time} ({len(state.devices)} dispositivos)")
+
+    # -----------------------------------
+    # Muestras
+    # -----------------------------------
+    def _bucket(self, value) -> pd.Timestamp:
+        ts = pd.Timestamp(value)
+        if ts.tz is None:
+            ts = ts.tz_localize('UTC')
+        return ts.floor(BUCKET)
+
+    def _device(self, state: LineState, device: str) -> DeviceBuffer:
+        if device not in state.devices:
+            state.devices[device] = DeviceBuffer(self.size, self.lags, self.roll_windows)
+            # Índice nuevo al final, como el feature store con dispositivos nuevos
+            state.device_idx.setdefault(device, max(state.device_idx.values(), default=-1) + 1)
+        return state.devices[device]
+
+    def _find_device(self, device: str) -> Optional[DeviceBuffer]:
+        for state in self.states.values():
+            if device in state.devices:
+                return state.devices[device]
+        return None
+
+    def add_availability(self, sample: dict):
+        device = self._find_device(str(sample['device_id']))
+        if device is None:
+            # Dispositivo aún sin calidad: no se sabe su línea; su primera calidad lo registra
+            self.counts['rejected'] += 1
+            return
+        group = CAUSE_MAP.get(str(sample.get('stopping_reason')), 'Otros')
+        bucket = self._bucket(sample['_time'])
+        if any(t == bucket for t, _, _ in device.avail):
+            return  # duplicado: se queda la primera, como drop_duplicates del merge
+        device.avail.append((bucket, int(sample['_value'] == 'Produciendo'), STOP_INDEX[group]))
+
+    def add_quality(self, sample: dict) -> list:
+        """
+        Registra una muestra de calidad; devuelve las líneas cuyo bucket se cerró.
+        """
+        line = str(sample['linea'])
+        state = self.states.get(line)
+        if state is None:
+            self.counts['rejected'] += 1
+            return []
+        bucket = self._bucket(sample['_time'])
+        if bucket <= state.last_time:
+            self.counts['late'] += 1
+            return []
+        self._device(state, str(sample['device_id']))
+        state.pending.setdefault(bucket, {}).setdefault(str(sample['device_id']), sample)
+        closed = [b for b in state.pending if b < bucket]
+        for b in sorted(closed):
+            self._close(state, b, state.pending.pop(b))
+        return [line] if closed else []
+
+    def _close(self, state: LineState, bucket: pd.Timestamp, samples: dict):
+        """
+        Filas del bucket en orden de device_id: features como en feature_engine.build_features.
+        """
+        max_lag = max(self.lags, default=0)
+        for dev in sorted(samples):
+            sample, device = samples[dev], state.devices[dev]
+            velocity = float(sample['_value'])
+            lags = {f'lag_{k}': device.lag(k) for k in self.lags}
+            complete = device.n >= max_lag
+            device.push(velocity)
+            # Las primeras max(lags) filas de cada dispositivo no tienen lags completos y se descartan
+            if not complete:
+                continue
+            state_flag, stop_code = device.availability(bucket)
+            row = {'_time': bucket, 'velocity_bpm': velocity, 'real_velocity': float(sample.get('real_velocity', velocity)),
+                   'device_id': dev, 'device_idx': state.device_idx[dev], 'state_flag': state_flag,
+                   'stop_code': stop_code, **lags}
+            row.update({f'roll_mean_{w}': m for w, m in zip(self.roll_windows, device.roll_means())})
+            row.update({f'stop_{g}': code == stop_code for g, code in STOP_INDEX.items()})
+            state.stats.push(velocity)
+            state.last_row = row
+            state.last_time = bucket
+        self.counts['buckets'] += 1
+
+    def ingest(self, samples: list) -> dict:
+        """
+        Procesa un lote de muestras y actualiza el pronóstico de las líneas con buckets cerrados.
+        """
+        with self._lock:
+            touched = set()
+            for sample in samples:
+                self.counts['samples'] += 1
+                kind = sample.get('type') or (DISP_PREFIX if 'stopping_reason' in sample else CALIDAD_PREFIX)
+                try:
+                    if kind == DISP_PREFIX:
+                        self.add_availability(sample)
+                    else:
+                        touched.update(self.add_quality(sample))
+                except (KeyError, ValueError, TypeError) as e:
+                    self.counts['rejected'] += 1
+                    print(f"[LIVE] Muestra inválida ({type(e).__name__}: {e}): {sample}")
+            updated = {}
+            for line in sorted(touched):
+                try:
+                    updated[line] = self._forecast(line)
+                except Exception as e:
+                    print(f"[LIVE] Error en el pronóstico de {line}: {e}")
+        return {'accepted': len(samples), 'updated': {k: v for k, v in updated.items() if v}}
+
+    # -----------------------------------
+    # Pronóstico
+    # -----------------------------------
+    def _forecaster(self, line: str):
+        # La versión activa del modelo se revisa cada `model_check_seconds`, no en cada bucket
+        now = time.time()
+        if now - self._checked.get(line, 0.0) >= self.model_check_seconds:
+            self._checked[line] = now
+            (forecaster, _, _), = self.service.refresh([line])
+            self._forecasters[line] = forecaster
+        return self._forecasters.get(line)
+
+    def _forecast(self, line: str) -> Optional[str]:
+        state = self.states[line]
+        forecaster = self._forecaster(line)
+        # Mismos lags que en entrenamiento: la cola del dispositivo de la última fila
+        device = state.devices.get(str(state.last_row['device_id']))
+        if forecaster is None or device is None or device.n < self.size:
+            return None
+        start = time.perf_counter()
+        live = {'velocity': device.values(), 'last_row': state.last_row, 'last_time': state.last_time,
+                'bounds': state.stats.bounds()}
+        df = forecaster.forecast_states({line: live}, self.hours * 60 * 2)[line]
+        seconds = time.perf_counter() - start
+        self.forecasts[line] = {'data': df, 'data_until': state.last_time.isoformat(),
+                                'updated': datetime.datetime.now().isoformat(), 'seconds': round(seconds, 3)}
+        self.counts['forecasts'] += 1
+        self.last_forecast_seconds = round(seconds, 3)
+        return state.last_time.isoformat()
+
+    def forecast(self, line: str, hours: Optional[int] = None) -> Optional[dict]:
+        entry = self.forecasts.get(line)
+        if entry is None:
+            return None
+        n = (hours or self.hours) * 60 * 2
+        return dict(entry, data=entry['data'].iloc[:n])
+
+    def metrics(self) -> dict:
+        return dict(self.counts, last_forecast_seconds=self.last_forecast_seconds,
+                    data_until={line: s.last_time.isoformat() for line, s in self.states.items()})
+
+def parse_samples(body: bytes) -> list:
+    """
+    Un objeto JSON, una lista de objetos o JSON por línea (NDJSON).
+    """
+    text = body.decode('utf-8').strip()
+    if not text:
+        return []
+    if text[0] in '[{':
+        try:
+            data = json.loads(text)
+            return data if isinstance(data, list) else [data]
+        except json.JSONDecodeError:
+            pass
+    return [json.loads(line) for line in text.splitlines() if line.strip()]
+
+def forecast_payload(entry: dict) -> dict:
+    df = entry['data']
+    return dict(entry, data=[{'_time': t.isoformat(), 'predicted_velocity_bpm': float(v)}
+                             for t, v in zip(df['_time'], df['predicted_velocity_bpm'])])
+
+# -----------------------------------
+# Servidor HTTP local
+# -----------------------------------
+def make_handler(telemetry: TelemetryService):
+    class Handler(BaseHTTPRequestHandler):
+        def _send(self, status: int, payload):
+            body = json.dumps(payload).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_POST(self):
+            if urlparse(self.path).path != '/samples':
+                return self._send(404, {'error': 'no encontrado'})
+            try:
+                samples = parse_samples(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+            except (json.JSONDecodeError, UnicodeDecodeError) as e:
+                return self._send(400, {'error': f"JSON inválido: {e}"})
+            self._send(200, telemetry.ingest(samples))
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            query = parse_qs(url.query)
+            if url.path == '/metrics':
+                return self._send(200, telemetry.metrics())
+            if url.path == '/forecast':
+                line = query.get('line', [telemetry.lines[0]])[0]
+                entry = telemetry.forecast(line, int(query['hours'][0]) if 'hours' in query else None)
+                if entry is None:
+                    return self._send(404, {'error': f"Sin pronóstico en vivo para {line}"})
+                return self._send(200, forecast_payload(entry))
+            self._send(404, {'error': 'no encontrado'})
+
+        def log_message(self, fmt, *args):
+            pass
+    return Handler
+
+# -----------------------------------
+# Main
+# -----------------------------------
+def main(argv=None):
+    cfg = get_pipeline_config()
+    parser = argparse.ArgumentParser(description="Receptor HTTP de telemetría en vivo con pronóstico por bucket de 30 s.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=cfg.get('telemetry_port', 8765))
+    parser.add_argument('--lines', type=str, nargs='+', default=cfg.get('lines', [cfg['line']]))
+    parser.add_argument('--hours', type=int, default=cfg.get('telemetry_hours', 2))
+    args = parser.parse_args(argv)
+
+    from model_server import ForecastService
+    service = ForecastService(Path.cwd(), cfg['lags'], cfg['roll_windows'])
+    telemetry = TelemetryService(service, args.lines, args.hours, cfg['lags'], cfg['roll_windows'])
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(telemetry))
+    print(f"[LIVE] Escuchando en http://{args.host}:{args.port} (POST /samples, GET /forecast?line=, GET /metrics)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("[LIVE] Detenido")
+    finally:
+        server.server_close()
+
+if __name__ == '__main__':
+    main()
@@ -1,117 +1,59 @@
 """
 src/train.py
 Entrena un modelo MLP mejorado para pronóstico de velocidad de producción.
-- Carga dataset final para la línea configurada
+- Carga dataset final sólo de las particiones de la línea (--line, por defecto la de config.yaml)
 - Separa features (incluye device_idx) y target
-- Escala features numéricas
-- Guarda feature names y scaler para consistencia en predict.py
+- Features derivados, orden de features y escalado con FeaturePipeline (feature_pipeline.py)
+- Guarda el pipeline (feature names + scaler + lags/roll_windows) junto al modelo para predict.py
 - Entrena MLP con EarlyStopping y mejores hiperparámetros
-- Guarda modelo con timestamp
+- Modo streaming (--streaming): record batches de Parquet, scaler con partial_fit y tf.data
+  (ver train_stream.py); muestras/s por época en ambos modos
+- Warm start (--warm-start): ajusta el modelo anterior de la línea con datos recientes más una
+  muestra de repaso del histórico; si el error de validación empeora respecto al modelo anterior
+  más allá de `warm_start_max_regression`, entrena desde cero
+- Modelo directo multi-horizonte (--direct): mismos features del dataset final, salida con la
+  media de velocidad de cada bloque de `direct_block_steps` pasos hasta `direct_horizon_hours`
+  (por dispositivo); se pronostica todo el horizonte en una sola pasada (forecast_engine.DirectForecaster).
+  Artefactos model_direct_<linea>_<ts>.h5 / pipeline_direct_<linea>_<ts>.pkl, familia `direct` del registro
+- Guarda modelo y pipeline por línea y versión: model_<linea>_<ts>.h5 / pipeline_<linea>_<ts>.pkl
+  (+ inference_<linea>_<ts>.npz, exportación NumPy de inference_export.py)
+  y publica el entrenamiento en el registro de modelos (model_registry.py), que lo deja activo
+  (varias líneas en paralelo con train_lines.py)
 """
-import pandas as pd
-import numpy as np
+import argparse
+import math
+import time
 from pathlib import Path
 import datetime
-import joblib
-from sklearn.model_selection import train_test_split
-from sklearn.preprocessing import StandardScaler
-from tensorflow.keras.models import Sequential
-from tensorflow.keras.layers import Input, Dense, Dropout, BatchNormalization
-from tensorflow.keras.callbacks import EarlyStopping, ReduceLROnPlateau
-from tensorflow.keras.optimizers import Adam
+from typing import Optional
+import numpy as np
+import pandas as pd
 from config import get_pipeline_config
+from feature_engine import group_codes, group_layout
+from feature_pipeline import FeaturePipeline
+from inference_export import export as export_inference, inference_path
+from model_registry import DIRECT, ModelRegistry
+from predict import artifact_paths, load_artifacts
+import datalake
 
-# ---------------------------------------
-# Configuración dinámica
-# ---------------------------------------
-cfg = get_pipeline_config()
-line = cfg['line']
+# TensorFlow/Keras, scikit-learn y train_stream (tf.data) se importan dentro de las funciones
+# que los usan: importar este módulo (p.ej. para --help o desde train_lines.py) no los carga.
 
 # ---------------------------------------
 # Rutas
 # ---------------------------------------
 PROC_FINAL_DIR = Path('data/processed/final')
 MODELS_DIR     = Path('models')
-MODELS_DIR.mkdir(parents=True, exist_ok=True)
-
-# ---------------------------------------
-# Función para obtener archivo más reciente
-# ---------------------------------------
-def latest_file(directory: Path, pattern: str) -> Path:
-    files = sorted(directory.glob(pattern), key=lambda f: f.stat().st_mtime)
-    if not files:
-        raise FileNotFoundError(f"No se encontró archivo con patrón {pattern} en {directory}")
-    return files[-1]
-
-# ---------------------------------------
-# Agregar features temporales avanzados
-# ---------------------------------------
-def add_advanced_time_features(df):
-    df['_time'] = pd.to_datetime(df['_time'])
-    
-    # Features básicos
-    df['hour'] = df['_time'].dt.hour
-    df['minute'] = df['_time'].dt.minute
-    df['dayofweek'] = df['_time'].dt.dayofweek
-    df['is_weekend'] = (df['dayofweek'] >= 5).astype(int)
-    
-    # Features cíclicos
-    df['hour_sin'] = np.sin(2 * np.pi * df['hour']/24)
-    df['hour_cos'] = np.cos(2 * np.pi * df['hour']/24)
-    df['minute_sin'] = np.sin(2 * np.pi * df['minute']/60)
-    df['minute_cos'] = np.cos(2 * np.pi * df['minute']/60)
-    df['dayofweek_sin'] = np.sin(2 * np.pi * df['dayofweek']/7)
-    df['dayofweek_cos'] = np.cos(2 * np.pi * df['dayofweek']/7)
-    
-    # Turno
-    df['shift'] = df['hour'].apply(lambda h: 'day' if 7 <= h < 19 else 'night')
-    
-    return df
 
 # ---------------------------------------
-# Entrenamiento
+# Modelo
 # ---------------------------------------
-def train():
-    # 1. Cargar datos
-    pattern = f"dataset_final_*.parquet"
-    data_path = latest_file(PROC_FINAL_DIR, pattern)
-    print(f"[TRAIN] Cargando dataset: {data_path.name}")
-    df = pd.read_parquet(data_path)
-    
-    # 2. Filtrar por línea
-    df = df[df['linea'] == line].reset_index(drop=True)
-    print(f"[TRAIN] Datos para línea {line}: {len(df)} registros")
-
-    # 3. Agregar features temporales avanzados
-    df = add_advanced_time_features(df)
-
-    # 4. Separar features y target
-    y = df['velocity_bpm']
-    X = df.drop(columns=['_time', 'linea', 'velocity_bpm', 'shift'])
-    # Mantener sólo numéricas y device_idx
-    X = X.select_dtypes(include=['number'])
-
-    # 5. División train/valid (sin shuffle para señales temporales)
-    X_train, X_val, y_train, y_val = train_test_split(
-        X, y, test_size=0.2, random_state=42, shuffle=False
-    )
-
-    # 6. Escalado
-    scaler = StandardScaler()
-    X_train_scaled = scaler.fit_transform(X_train)
-    X_val_scaled   = scaler.transform(X_val)
-
-    # Guardar scaler y feature names
-    today = datetime.date.today().isoformat()
-    scaler_path = MODELS_DIR / f"scaler_{today}.pkl"
-    feature_names_path = MODELS_DIR / f"feature_names_{today}.pkl"
-    joblib.dump(scaler, scaler_path)
-    joblib.dump(X.columns.tolist(), feature_names_path)
-    print(f"[TRAIN] Scaler guardado en: {scaler_path}")
-    print(f"[TRAIN] Feature names guardados en: {feature_names_path}")
+def build_model(n_features: int, n_outputs: int = 1):
+    from tensorflow.keras.models import Sequential
+    from tensorflow.keras.layers import Input, Dense, Dropout, BatchNormalization
+    from tensorflow.keras.optimizers import Adam
 
     # 7. Definir modelo MLP mejorado
-    n_features = X_train_scaled.shape[1]
     model = Sequential([
         Input(shape=(n_features,)),
         BatchNormalization(),
@@ -122,12 +64,16 @@ def train():
         Dropout(0.2),
         BatchNormalization(),
         Dense(32, activation='relu'),
-        Dense(1)
+        Dense(n_outputs)
     ])
     
     # Optimizador con learning rate adaptativo
     optimizer = Adam(learning_rate=0.001)
     model.compile(optimizer=optimizer, loss='mse', metrics=['mae'])
+    return model
+
+def callbacks():
+    from tensorflow.keras.callbacks import EarlyStopping, ReduceLROnPlateau
 
     # 8. Callbacks
     es = EarlyStopping(
@@ -144,26 +90,341 @@ def train():
         min_lr=0.00001,
         verbose=1
     )
+    return [es, reduce_lr]
+
+def run_tag(line: str, kind: Optional[str] = None) -> str:
+    # Versión de los artefactos: línea + timestamp (dos entrenamientos por día no se pisan);
+    # el modelo directo lleva la familia delante (model_direct_<linea>_<ts>.h5)
+    tag = f"{line}_{datetime.datetime.now().strftime('%Y%m%dT%H%M%S')}"
+    return f"{kind}_{tag}" if kind else tag
+
+def save_pipeline(pipeline: FeaturePipeline, tag: str):
+    # El pipeline guarda feature names, scaler y lags/roll_windows del entrenamiento
+    pipeline_path = MODELS_DIR / f"pipeline_{tag}.pkl"
+    pipeline.save(pipeline_path)
+    print(f"[TRAIN] Pipeline de features guardado en: {pipeline_path} ({len(pipeline.feature_names or [])} features)")
+    return pipeline_path
+
+def new_pipeline() -> FeaturePipeline:
+    cfg = get_pipeline_config()
+    return FeaturePipeline(cfg['lags'], cfg['roll_windows'],
+                           stop_groups=datalake.dataset_meta(datalake.FINAL_LAKE).get('stop_groups'))
+
+# ---------------------------------------
+# Entrenamiento
+# ---------------------------------------
+def load_line(line: str) -> pd.DataFrame:
+    # 1-2. Cargar sólo las particiones de la línea (o el último dataset_final legacy)
+    print(f"[TRAIN] Cargando dataset: {datalake.FINAL_LAKE}")
+    df = datalake.read_dataset(datalake.FINAL_LAKE, PROC_FINAL_DIR, 'dataset_final_*.parquet', line=line)
+    if df.empty:
+        raise ValueError(f"No hay datos para la línea {line}")
+    df = df.sort_values('_time', kind='stable').reset_index(drop=True)
+    print(f"[TRAIN] Datos para línea {line}: {len(df)} registros")
+    return df
+
+def fit_in_memory(line: str, pipeline: FeaturePipeline, batch_size: int, verbose: int = 1, epochs: int = 100):
+    from sklearn.model_selection import train_test_split
+    from train_stream import ThroughputLogger
+
+    df = load_line(line)
+
+    # 3. Completar features derivados (stop_* del esquema compacto, tiempo y cíclicos)
+    #    con la misma definición que usa el pronóstico
+    df = pipeline.frame(df)
+
+    # 4. Separar features y target (sólo numéricas, incluye device_idx)
+    y = df['velocity_bpm'].to_numpy()
+    X = pipeline.select_features(df)
+
+    # 5. División train/valid (sin shuffle para señales temporales)
+    X_train, X_val, y_train, y_val = train_test_split(
+        X, y, test_size=0.2, random_state=42, shuffle=False
+    )
+
+    # 6. Escalado (scaler ajustado sólo con train)
+    pipeline.fit_scaler(X_train)
+    model = build_model(X_train.shape[1])
 
     # 9. Entrenar con EarlyStopping y ReduceLROnPlateau
     history = model.fit(
-        X_train_scaled, y_train,
-        validation_data=(X_val_scaled, y_val),
-        epochs=100,
-        batch_size=32,
-        callbacks=[es, reduce_lr],
-        verbose=1
+        pipeline.scale(X_train), y_train,
+        validation_data=(pipeline.scale(X_val), y_val),
+        epochs=epochs,
+        batch_size=batch_size,
+        callbacks=callbacks() + [ThroughputLogger(len(X_train))],
+        verbose=verbose
+    )
+    return model, history
+
+def fit_streaming(line: str, pipeline: FeaturePipeline, batch_size: int, verbose: int = 1, epochs: int = 100):
+    from train_stream import ParquetTrainingSource, ThroughputLogger
+
+    # 1-6. Record batches de Parquet: corte temporal, scaler con partial_fit y tf.data
+    if not datalake.exists(datalake.FINAL_LAKE):
+        raise FileNotFoundError(f"El modo streaming requiere el dataset particionado {datalake.FINAL_LAKE}")
+    source = ParquetTrainingSource(datalake.FINAL_LAKE, line, pipeline,
+                                   batch_rows=get_pipeline_config().get('train_record_batch_rows', 65_536))
+    source.split()
+    source.fit_scaler()
+    model = build_model(len(pipeline.feature_names or []))
+
+    # 9. Entrenar con EarlyStopping y ReduceLROnPlateau
+    history = model.fit(
+        source.dataset(train=True, batch_size=batch_size),
+        validation_data=source.dataset(train=False, batch_size=batch_size),
+        epochs=epochs,
+        callbacks=callbacks() + [ThroughputLogger(source.n_train)],
+        verbose=verbose
     )
+    return model, history
+
+# ---------------------------------------
+# Warm start
+# ---------------------------------------
+def warm_start_split(df: pd.DataFrame, recent_hours: float, replay_ratio: float,
+                     val_fraction: float = 0.2) -> tuple:
+    """
+    (train, valid) para el ajuste incremental: valid es el último `val_fraction` de la ventana
+    reciente; train el resto de la ventana más una muestra aleatoria del histórico anterior
+    de `replay_ratio` veces su tamaño (repaso, para no olvidar patrones viejos).
+    `df` debe venir ordenado por `_time`.
+    """
+    cutoff = df['_time'].iloc[-1] - pd.Timedelta(hours=recent_hours)
+    recent_start = int(df['_time'].searchsorted(cutoff, side='right'))
+    recent, older = df.iloc[recent_start:], df.iloc[:recent_start]
+    n_val = math.ceil(len(recent) * val_fraction)
+    recent_train, valid = recent.iloc[:len(recent) - n_val], recent.iloc[len(recent) - n_val:]
+    n_replay = min(len(older), int(len(recent_train) * replay_ratio))
+    replay = older.sample(n=n_replay, random_state=42) if n_replay else older.iloc[:0]
+    return pd.concat([replay, recent_train], ignore_index=True), valid.reset_index(drop=True)
+
+def fit_warm_start(line: str, batch_size: int, verbose: int = 1):
+    """
+    Ajusta el modelo anterior de la línea; devuelve (modelo, history, pipeline) o None si
+    hay que entrenar desde cero (sin modelo previo, features incompatibles o regresión).
+    """
+    from tensorflow.keras.callbacks import EarlyStopping
+    from tensorflow.keras.optimizers import Adam
+    from train_stream import ThroughputLogger
+
+    cfg = get_pipeline_config()
+    try:
+        paths = artifact_paths(MODELS_DIR, line)
+    except FileNotFoundError:
+        print(f"[TRAIN] Warm start {line}: sin modelo anterior")
+        return None
+    model, pipeline = load_artifacts(paths, cfg['lags'], cfg['roll_windows'], backend='keras')
+    if pipeline.lags != list(cfg['lags']) or pipeline.roll_windows != list(cfg['roll_windows']):
+        print(f"[TRAIN] Warm start {line}: el modelo anterior usa otros lags/roll_windows")
+        return None
+
+    # Ventana reciente + repaso; el scaler y el orden de features del modelo anterior no cambian
+    train_df, val_df = warm_start_split(load_line(line), cfg.get('warm_start_recent_hours', 24),
+                                        cfg.get('warm_start_replay_ratio', 1.0))
+    train_df, val_df = pipeline.frame(train_df), pipeline.frame(val_df)
+    missing = [name for name in pipeline.feature_names if name not in val_df.columns]
+    if missing or val_df.empty:
+        print(f"[TRAIN] Warm start {line}: faltan features {missing} o datos recientes")
+        return None
+    X_train, y_train = pipeline.transform(train_df, framed=True), train_df['velocity_bpm'].to_numpy()
+    X_val, y_val = pipeline.transform(val_df, framed=True), val_df['velocity_bpm'].to_numpy()
+    print(f"[TRAIN] Warm start {line} desde {paths['model'].name}: {len(X_train)} filas de train "
+          f"(recientes + repaso), {len(X_val)} de valid")
+
+    model.compile(optimizer=Adam(learning_rate=cfg.get('warm_start_lr', 0.0001)), loss='mse', metrics=['mae'])
+    _, base_mae = model.evaluate(X_val, y_val, batch_size=batch_size, verbose=0)
+    es = EarlyStopping(monitor='val_loss', patience=3, restore_best_weights=True, verbose=1)
+    history = model.fit(
+        X_train, y_train,
+        validation_data=(X_val, y_val),
+        epochs=cfg.get('warm_start_epochs', 10),
+        batch_size=batch_size,
+        callbacks=[es, ThroughputLogger(len(X_train))],
+        verbose=verbose
+    )
+    _, mae = model.evaluate(X_val, y_val, batch_size=batch_size, verbose=0)
+    print(f"[TRAIN] Warm start {line}: Val MAE modelo anterior {base_mae:.4f} -> ajustado {mae:.4f}")
+
+    max_regression = cfg.get('warm_start_max_regression', 0.1)
+    if mae > base_mae * (1 + max_regression):
+        print(f"[TRAIN] Warm start {line}: el error empeoró más de {max_regression:.0%}, se entrena desde cero")
+        return None
+    return model, history, pipeline
 
-    # 10. Guardar modelo
-    model_path = MODELS_DIR / f"model_{today}.h5"
+# ---------------------------------------
+# Modelo directo multi-horizonte
+# ---------------------------------------
+def block_targets(df: pd.DataFrame, block_steps: int, n_blocks: int) -> np.ndarray:
+    """
+    Matriz (n, n_blocks): para cada fila, la media de velocidad de su dispositivo en cada bloque
+    de `block_steps` registros siguientes; NaN donde el histórico no cubre el bloque.
+    `df` debe venir ordenado por `_time`.
+    """
+    codes, _ = group_codes(df, ['device_id'])
+    by_group = np.argsort(codes, kind='stable')  # dentro de cada dispositivo sigue el orden temporal
+    group_start, _ = group_layout(codes[by_group])
+    group_end = group_start + np.bincount(codes)[codes[by_group]]
+    velocity = df['velocity_bpm'].to_numpy(dtype=np.float64)[by_group]
+    csum = np.concatenate(([0.0], np.cumsum(velocity)))
+
+    idx = np.arange(len(df))
+    Y = np.full((len(df), n_blocks), np.nan)
+    for k in range(n_blocks):
+        lo = idx + 1 + k * block_steps
+        hi = lo + block_steps
+        ok = hi <= group_end
+        Y[by_group[ok], k] = (csum[hi[ok]] - csum[lo[ok]]) / block_steps
+    return Y
+
+def fit_direct(line: str, pipeline: FeaturePipeline, batch_size: int, verbose: int = 1, epochs: int = 100):
+    from sklearn.model_selection import train_test_split
+    from train_stream import ThroughputLogger
+
+    block_steps, n_blocks = pipeline.block_steps, pipeline.n_blocks
+    if block_steps is None or n_blocks is None:
+        raise ValueError("El pipeline del modelo directo requiere block_steps y n_blocks")
+    df = pipeline.frame(load_line(line))
+    Y = block_targets(df, block_steps, n_blocks)
+    # Sólo filas con el horizonte completo por delante
+    complete = ~np.isnan(Y).any(axis=1)
+    if not complete.any():
+        raise ValueError(f"La línea {line} no tiene {block_steps * n_blocks} registros "
+                         f"por dispositivo para el horizonte del modelo directo")
+    X = pipeline.select_features(df)[complete]
+    Y = Y[complete]
+    print(f"[TRAIN] Modelo directo {line}: {len(X)} filas, {n_blocks} bloques de {block_steps} pasos")
+
+    X_train, X_val, Y_train, Y_val = train_test_split(X, Y, test_size=0.2, random_state=42, shuffle=False)
+    pipeline.fit_scaler(X_train)
+    model = build_model(X_train.shape[1], n_blocks)
+    history = model.fit(
+        pipeline.scale(X_train), Y_train,
+        validation_data=(pipeline.scale(X_val), Y_val),
+        epochs=epochs,
+        batch_size=batch_size,
+        callbacks=callbacks() + [ThroughputLogger(len(X_train))],
+        verbose=verbose
+    )
+    # MAE de validación por bloque: cómo crece el error con la distancia
+    block_mae = np.abs(model.predict(pipeline.scale(X_val), batch_size=1024, verbose=0) - Y_val).mean(axis=0)
+    return model, history, block_mae
+
+def train_direct(line: Optional[str] = None, batch_size: int = 32, verbose: int = 1, epochs: int = 100) -> dict:
+    cfg = get_pipeline_config()
+    line = line or cfg['line']
+    block_steps = cfg.get('direct_block_steps', 10)
+    horizon_hours = cfg.get('direct_horizon_hours', cfg['horizon_hours'])
+    MODELS_DIR.mkdir(parents=True, exist_ok=True)
+    wall, cpu = time.perf_counter(), time.process_time()
+    data_fingerprint = datalake.content_fingerprint(datalake.FINAL_LAKE, line) if datalake.exists(datalake.FINAL_LAKE) else ''
+
+    pipeline = new_pipeline()
+    pipeline.block_steps = block_steps
+    pipeline.n_blocks = math.ceil(horizon_hours * 60 * 2 / block_steps)
+    model, history, block_mae = fit_direct(line, pipeline, batch_size, verbose, epochs)
+
+    tag = run_tag(line, DIRECT)
+    pipeline_path = save_pipeline(pipeline, tag)
+    model_path = MODELS_DIR / f"model_{tag}.h5"
+    model.save(model_path)
+    print(f"[TRAIN] Modelo directo guardado en: {model_path}")
+    artifacts = {'model': model_path, 'pipeline': pipeline_path}
+    try:
+        artifacts['inference'] = inference_path(model_path)
+        export_inference(model, artifacts['inference'])
+    except ValueError as e:
+        artifacts.pop('inference')
+        print(f"[TRAIN] Sin artefacto de inferencia NumPy: {e}")
+
+    val_loss = history.history['val_loss'][-1]
+    val_mae = history.history['val_mae'][-1]
+    # MAE del primer bloque, a 2 h y al final del horizonte (bloque que contiene ese paso)
+    marks = {'first': 0, '2h': min(math.ceil(240 / block_steps), pipeline.n_blocks) - 1, 'last': pipeline.n_blocks - 1}
+    print(f"[TRAIN] Métricas finales {line} (directo) - Val Loss: {val_loss:.4f}, Val MAE: {val_mae:.4f}, "
+          + ', '.join(f"MAE bloque {name}: {block_mae[k]:.4f}" for name, k in marks.items()))
+    wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+    print(f"[TRAIN] {line} (directo): {wall:.1f} s de reloj, {cpu:.1f} s de CPU")
+    metrics = {'val_loss': float(val_loss), 'val_mae': float(val_mae), 'mode': 'full',
+               'block_steps': block_steps, 'n_blocks': pipeline.n_blocks,
+               **{f'val_mae_{name}': float(block_mae[k]) for name, k in marks.items()},
+               'wall_seconds': round(wall, 2), 'cpu_seconds': round(cpu, 2)}
+
+    ModelRegistry(MODELS_DIR).publish(tag, line, artifacts, metrics, data_fingerprint, pipeline.feature_names or [], kind=DIRECT)
+    print(f"[TRAIN] Versión directa activa de {line}: {tag}")
+    return dict(metrics, line=line, run_id=tag, model=str(model_path), pipeline=str(pipeline_path))
+
+def train(line: Optional[str] = None, streaming: bool = False, batch_size: int = 32, verbose: int = 1,
+          warm_start: bool = False, epochs: int = 100) -> dict:
+    line = line or get_pipeline_config()['line']
+    MODELS_DIR.mkdir(parents=True, exist_ok=True)
+    wall, cpu = time.perf_counter(), time.process_time()
+    # Fingerprint de los datos de la línea antes de leerlos (se registra con el modelo)
+    data_fingerprint = datalake.content_fingerprint(datalake.FINAL_LAKE, line) if datalake.exists(datalake.FINAL_LAKE) else ''
+    warm = fit_warm_start(line, batch_size, verbose) if warm_start else None
+    if warm is not None:
+        mode = 'warm'
+        model, history, pipeline = warm
+    else:
+        mode = 'full'
+        pipeline = new_pipeline()
+        if streaming:
+            print(f"[TRAIN] Modo streaming (tf.data, batch_size={batch_size})")
+            model, history = fit_streaming(line, pipeline, batch_size, verbose, epochs)
+        else:
+            model, history = fit_in_memory(line, pipeline, batch_size, verbose, epochs)
+
+    # 10. Guardar pipeline y modelo; se publican en el registro recién al final
+    tag = run_tag(line)
+    pipeline_path = save_pipeline(pipeline, tag)
+    model_path = MODELS_DIR / f"model_{tag}.h5"
     model.save(model_path)
     print(f"[TRAIN] Modelo entrenado guardado en: {model_path}")
+    artifacts = {'model': model_path, 'pipeline': pipeline_path}
+
+    # Artefacto de inferencia NumPy (BatchNorm plegado, sin Dropout), verificado contra Keras
+    try:
+        artifacts['inference'] = inference_path(model_path)
+        export_inference(model, artifacts['inference'])
+    except ValueError as e:
+        artifacts.pop('inference')
+        print(f"[TRAIN] Sin artefacto de inferencia NumPy: {e}")
     
     # 11. Imprimir métricas finales
     val_loss = history.history['val_loss'][-1]
     val_mae = history.history['val_mae'][-1]
-    print(f"[TRAIN] Métricas finales - Val Loss: {val_loss:.4f}, Val MAE: {val_mae:.4f}")
+    print(f"[TRAIN] Métricas finales {line} - Val Loss: {val_loss:.4f}, Val MAE: {val_mae:.4f}")
+    wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+    print(f"[TRAIN] {line} ({'warm start' if mode == 'warm' else 'desde cero'}): {wall:.1f} s de reloj, {cpu:.1f} s de CPU")
+    metrics = {'val_loss': float(val_loss), 'val_mae': float(val_mae), 'mode': mode,
+               'wall_seconds': round(wall, 2), 'cpu_seconds': round(cpu, 2)}
+
+    # 12. Publicar en el registro: desde aquí predict.py y el servicio usan esta versión
+    ModelRegistry(MODELS_DIR).publish(tag, line, artifacts, metrics, data_fingerprint, pipeline.feature_names)
+    print(f"[TRAIN] Versión activa de {line}: {tag}")
+    return dict(metrics, line=line, run_id=tag, model=str(model_path), pipeline=str(pipeline_path))
+
+def main(argv=None):
+    cfg = get_pipeline_config()
+    parser = argparse.ArgumentParser(description="Entrenamiento del MLP de velocidad.")
+    parser.add_argument('--line', type=str, default=cfg['line'], help='Línea a entrenar (por defecto `line` de config.yaml)')
+    parser.add_argument('--streaming', action='store_true', default=cfg.get('train_streaming', False),
+                        help='Lee el dataset por record batches y entrena con tf.data')
+    parser.add_argument('--batch-size', type=int, default=cfg.get('train_batch_size', 32))
+    parser.add_argument('--epochs', type=int, default=cfg.get('train_epochs', 100),
+                        help='Máximo de épocas del entrenamiento desde cero (EarlyStopping puede cortar antes)')
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument('--warm-start', dest='warm_start', action='store_true', default=cfg.get('train_warm_start', False),
+                      help='Ajusta el modelo anterior de la línea con datos recientes y repaso')
+    mode.add_argument('--full', dest='warm_start', action='store_false', help='Entrena desde cero')
+    parser.add_argument('--direct', action='store_true',
+                        help='Entrena el modelo directo multi-horizonte (siempre desde cero y en memoria)')
+    args = parser.parse_args(argv)
+    if args.direct:
+        train_direct(line=args.line, batch_size=args.batch_size, epochs=args.epochs)
+        return
+    train(line=args.line, streaming=args.streaming, batch_size=args.batch_size, warm_start=args.warm_start,
+          epochs=args.epochs)
 
 if __name__ == '__main__':
-    train()
+    main()
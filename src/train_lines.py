@@ -0,0 +1,126 @@
+"""
+src/train_lines.py
+Entrenamiento de un modelo por línea en paralelo:
+- Un proceso por línea (ProcessPoolExecutor con spawn), hasta `train_workers` a la vez
+- Los núcleos se reparten entre procesos: cada uno fija sus hilos intra/inter-op de TensorFlow
+  (y OMP/MKL para NumPy) antes de importar train.py, sin sobresuscribir la CPU
+- Cada línea escribe sus artefactos versionados model_<linea>_<ts>.h5 / pipeline_<linea>_<ts>.pkl
+- Reporta el tiempo total frente a la suma por línea (corrida secuencial) y, con --compare,
+  frente a una corrida secuencial real
+"""
+import argparse
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Optional
+from config import get_pipeline_config
+
+# Sólo config a nivel de módulo: con spawn los workers importan este archivo y
+# NumPy/TensorFlow no deben cargarse antes de fijar sus hilos.
+
+# -----------------------------------
+# Reparto de CPU
+# -----------------------------------
+def thread_plan(n_lines: int, workers: int = 0, cores: Optional[int] = None) -> tuple:
+    """
+    (procesos, hilos intra-op por proceso, hilos inter-op por proceso).
+    `workers=0` usa un proceso por línea hasta el número de núcleos.
+    """
+    cores = cores or os.cpu_count() or 1
+    workers = min(n_lines, workers or cores, cores) or 1
+    intra = max(1, cores // workers)
+    inter = 2 if intra >= 4 else 1
+    return workers, intra, inter
+
+def _init_worker(intra: int, inter: int):
+    for var in ('OMP_NUM_THREADS', 'MKL_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'TF_NUM_INTRAOP_THREADS'):
+        os.environ[var] = str(intra)
+    os.environ['TF_NUM_INTEROP_THREADS'] = str(inter)
+    import tensorflow as tf
+    tf.config.threading.set_intra_op_parallelism_threads(intra)
+    tf.config.threading.set_inter_op_parallelism_threads(inter)
+
+def _train_line(line: str, streaming: bool, batch_size: int, warm_start: bool, epochs: int) -> dict:
+    import train
+    start = time.perf_counter()
+    result = train.train(line=line, streaming=streaming, batch_size=batch_size, verbose=2, warm_start=warm_start,
+                         epochs=epochs)
+    result['seconds'] = time.perf_counter() - start
+    return result
+
+# -----------------------------------
+# Orquestación
+# -----------------------------------
+def train_lines(lines: list, workers: int = 0, streaming: bool = False, batch_size: int = 32,
+                warm_start: bool = False, epochs: int = 100) -> dict:
+    """
+    Entrena las líneas con `workers` procesos; devuelve tiempos, resultados y errores por línea.
+    """
+    workers, intra, inter = thread_plan(len(lines), workers)
+    print(f"[TRAIN] {len(lines)} línea(s) con {workers} proceso(s), {intra} hilo(s) intra-op / {inter} inter-op cada uno")
+    results, errors = {}, {}
+    start = time.perf_counter()
+    ctx = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=workers, mp_context=ctx,
+                             initializer=_init_worker, initargs=(intra, inter)) as pool:
+        futures = {pool.submit(_train_line, line, streaming, batch_size, warm_start, epochs): line for line in lines}
+        for fut in as_completed(futures):
+            line = futures[fut]
+            try:
+                results[line] = fut.result()
+                print(f"[TRAIN] {line} listo en {results[line]['seconds']:.1f} s "
+                      f"({results[line]['mode']}, Val MAE {results[line]['val_mae']:.4f})")
+            except Exception as e:
+                errors[line] = repr(e)
+                print(f"[TRAIN] Error entrenando {line}: {e}")
+    return {
+        'workers': workers,
+        'wall_seconds': time.perf_counter() - start,
+        'line_seconds': sum(r['seconds'] for r in results.values()),
+        'results': results,
+        'errors': errors,
+    }
+
+def report(run: dict, sequential: Optional[dict] = None):
+    wall, serial = run['wall_seconds'], run['line_seconds']
+    print(f"[TRAIN] Tiempo total: {wall:.1f} s; suma por línea: {serial:.1f} s "
+          f"(x{serial / wall:.2f} estimado frente a entrenarlas una tras otra)")
+    if sequential is not None:
+        seq = sequential['wall_seconds']
+        print(f"[TRAIN] Secuencial medido: {seq:.1f} s; paralelo: {wall:.1f} s (speedup x{seq / wall:.2f})")
+
+# -----------------------------------
+# Main
+# -----------------------------------
+def main(argv=None):
+    cfg = get_pipeline_config()
+    parser = argparse.ArgumentParser(description="Entrena un modelo por línea en paralelo.")
+    parser.add_argument('--lines', type=str, nargs='+', default=cfg.get('lines', [cfg['line']]),
+                        help='Líneas a entrenar (por defecto `lines` de config.yaml)')
+    parser.add_argument('--workers', type=int, default=cfg.get('train_workers', 0),
+                        help='Procesos simultáneos (0 = uno por línea hasta el número de núcleos)')
+    parser.add_argument('--streaming', action='store_true', default=cfg.get('train_streaming', False))
+    parser.add_argument('--batch-size', type=int, default=cfg.get('train_batch_size', 32))
+    parser.add_argument('--epochs', type=int, default=cfg.get('train_epochs', 100),
+                        help='Máximo de épocas del entrenamiento desde cero')
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument('--warm-start', dest='warm_start', action='store_true', default=cfg.get('train_warm_start', False))
+    mode.add_argument('--full', dest='warm_start', action='store_false')
+    parser.add_argument('--compare', action='store_true',
+                        help='Corre antes la versión secuencial (1 proceso con todos los núcleos) y compara')
+    args = parser.parse_args(argv)
+
+    sequential = None
+    if args.compare:
+        print("[TRAIN] Corrida secuencial de referencia")
+        sequential = train_lines(args.lines, workers=1, streaming=args.streaming, batch_size=args.batch_size,
+                                 warm_start=args.warm_start, epochs=args.epochs)
+    run = train_lines(args.lines, workers=args.workers, streaming=args.streaming, batch_size=args.batch_size,
+                      warm_start=args.warm_start, epochs=args.epochs)
+    report(run, sequential)
+    if run['errors']:
+        raise SystemExit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,140 @@
+"""
+src/train_stream.py
+Entrada de entrenamiento en streaming para train.py (--streaming):
+- Lee las particiones de la línea en record batches de Parquet, sin cargar todo el histórico
+- Pasada 1: sólo `_time` (conteo por intervalo de 30 s) para fijar el corte temporal train/valid
+- Pasada 2: StandardScaler.partial_fit por record batch, sólo con filas de train
+- tf.data: generador de lotes sin escalar (en train, filas permutadas dentro de cada record batch)
+  -> shuffle de lotes -> map paralelo con el escalado afín -> prefetch
+- Callback con muestras/s por época (se usa también en el modo en memoria)
+"""
+import math
+import time
+import numpy as np
+import pandas as pd
+import tensorflow as tf
+from sklearn.preprocessing import StandardScaler
+import datalake
+
+STEP = pd.Timedelta(seconds=30)
+
+
+class ParquetTrainingSource:
+    """
+    Dataset final de una línea leído por record batches. El corte train/valid es por tiempo:
+    las primeras (1 - val_fraction) filas en orden de `_time` son de train.
+    """
+    def __init__(self, root, line: str, pipeline, batch_rows: int = 65_536, val_fraction: float = 0.2):
+        self.root = root
+        self.line = line
+        self.pipeline = pipeline
+        self.batch_rows = batch_rows
+        self.val_fraction = val_fraction
+        self.cutoff = None
+        self.n_train = 0
+        self.n_val = 0
+
+    def _batches(self, start=None, end=None, columns=None):
+        return datalake.iter_batches(self.root, line=self.line, start=start, end=end,
+                                     columns=columns, batch_rows=self.batch_rows)
+
+    # -----------------------------------
+    # Pasadas previas
+    # -----------------------------------
+    def split(self):
+        """
+        Conteo de filas por intervalo de 30 s (memoria proporcional al rango de fechas,
+        no al número de filas) para ubicar el corte temporal.
+        """
+        parts = [p for p in datalake.load_manifest(self.root)['partitions'].values() if p['linea'] == self.line]
+        if not parts:
+            raise ValueError(f"No hay datos para la línea {self.line} en {self.root}")
+        t_min = pd.Timestamp(min(p['min_time'] for p in parts))
+        t_max = pd.Timestamp(max(p['max_time'] for p in parts))
+        counts = np.zeros((t_max - t_min) // STEP + 1, dtype=np.int64)
+        for batch in self._batches(columns=['_time']):
+            idx = ((batch['_time'] - t_min) // STEP).to_numpy(dtype=np.int64)
+            counts += np.bincount(idx, minlength=len(counts))
+
+        total = int(counts.sum())
+        n_train = total - math.ceil(total * self.val_fraction)
+        bucket = int(np.searchsorted(np.cumsum(counts), n_train))
+        self.cutoff = t_min + bucket * STEP
+        self.n_train = int(counts[:bucket + 1].sum())
+        self.n_val = total - self.n_train
+        print(f"[TRAIN] Streaming: {total} filas, train hasta {self.cutoff} ({self.n_train}), valid {self.n_val}")
+
+    def fit_scaler(self):
+        """
+        Fija el orden de features con el primer record batch y ajusta el scaler con partial_fit.
+        """
+        scaler = StandardScaler()
+        for batch in self._batches(end=self.cutoff):
+            df = self.pipeline.frame(batch)
+            if self.pipeline.feature_names is None:
+                X = self.pipeline.select_features(df)
+            else:
+                X = self.pipeline.matrix(df, framed=True)
+            scaler.partial_fit(X)
+        self.pipeline.scaler = scaler
+        self.pipeline._compile()
+
+    # -----------------------------------
+    # tf.data
+    # -----------------------------------
+    def _generator(self, train: bool, batch_size: int):
+        start, end = (None, self.cutoff) if train else (self.cutoff + pd.Timedelta(microseconds=1), None)
+        # Un solo generador para todas las épocas: cada época permuta distinto
+        rng = np.random.default_rng(42)
+
+        def gen():
+            for batch in self._batches(start=start, end=end):
+                df = self.pipeline.frame(batch)
+                X = self.pipeline.matrix(df, framed=True).astype(np.float32)
+                y = df['velocity_bpm'].to_numpy(dtype=np.float32)
+                if train:
+                    # Filas mezcladas dentro del record batch: cada mini-batch deja de ser un
+                    # tramo contiguo de tiempo (el shuffle de tf.data sólo reordena mini-batches)
+                    order = rng.permutation(len(X))
+                    X, y = X[order], y[order]
+                for i in range(0, len(X), batch_size):
+                    yield X[i:i + batch_size], y[i:i + batch_size]
+        return gen
+
+    def dataset(self, train: bool, batch_size: int, shuffle_batches: int = 64) -> tf.data.Dataset:
+        n_features = len(self.pipeline.feature_names)
+        a = tf.constant(self.pipeline.a, dtype=tf.float32)
+        b = tf.constant(self.pipeline.b, dtype=tf.float32)
+        data = tf.data.Dataset.from_generator(
+            self._generator(train, batch_size),
+            output_signature=(tf.TensorSpec((None, n_features), tf.float32), tf.TensorSpec((None,), tf.float32)),
+        )
+        if train and shuffle_batches:
+            data = data.shuffle(shuffle_batches)
+        data = data.map(lambda x, y: (x * a + b, y), num_parallel_calls=tf.data.AUTOTUNE)
+        return data.prefetch(tf.data.AUTOTUNE)
+
+
+class ThroughputLogger(tf.keras.callbacks.Callback):
+    """
+    Reporta muestras/s de entrenamiento por época.
+    """
+    def __init__(self, n_samples: int):
+        super().__init__()
+        self.n_samples = n_samples
+        self.history: list = []
+
+    def on_epoch_begin(self, epoch, logs=None):
+        self._start = time.perf_counter()
+        self._train_end = None
+
+    def on_test_begin(self, logs=None):
+        # La validación no cuenta para el throughput de entrenamiento
+        if self._train_end is None:
+            self._train_end = time.perf_counter()
+
+    def on_epoch_end(self, epoch, logs=None):
+        elapsed = (self._train_end or time.perf_counter()) - self._start
+        rate = self.n_samples / elapsed if elapsed > 0 else float('inf')
+        self.history.append(rate)
+        print(f"[TRAIN] Época {epoch + 1}: {rate:,.0f} muestras/s ({elapsed:.1f} s)")
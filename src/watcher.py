@@ -0,0 +1,372 @@
+"""
+src/watcher.py
+Modo watcher: ingesta casi en tiempo real desde la carpeta donde el PLC deja los CSV.
+- Sondea la carpeta con un `os.scandir` cada `watch_poll_seconds` (en un share SMB inotify no
+  ve las escrituras remotas) y sigue el CSV más reciente de calidad y de disponibilidad
+- Debounce: un archivo nuevo o que creció se procesa cuando su tamaño no cambia durante
+  `watch_debounce_seconds`, o tras `watch_max_wait_seconds` si sigue creciendo
+- Lee sólo los bytes nuevos desde el offset de cada archivo, hasta el último salto de línea
+  completo. Los offsets viven en memoria: al arrancar se releen los archivos del día y el
+  high-water mark por dispositivo del manifest de merged descarta lo ya mergeado, así una
+  caída a mitad de un micro-batch no pierde filas
+- Micro-batch con el mismo parseo, limpieza y merge asof que merge_quality_availability.py:
+  las filas nuevas de calidad contra la availability reciente en memoria, append al dataset
+  merged (high-water marks en el mismo manifest) y features incrementales del feature store
+- Las filas de calidad cuyo dispositivo aún no tiene availability a esa hora se retienen
+  hasta `watch_holdback_seconds`, para no mergearlas contra un estado incompleto
+- Refresca el pronóstico de las líneas con filas nuevas (ForecastService, modelo en memoria)
+- Frescura: segundos desde que los bytes llegan a la carpeta (mtime) hasta que el pronóstico
+  los incluye; últimas corridas y percentiles en `data/watch_metrics.json` y en /metrics
+- Tras un merge completo (dataset merged reescrito) relee los archivos desde el inicio; el
+  high-water mark por dispositivo evita duplicar filas
+"""
+import argparse
+import datetime
+import io
+import json
+import os
+import threading
+import time
+from collections import deque
+from pathlib import Path
+from typing import Optional
+import pandas as pd
+from config import get_pipeline_config
+import datalake
+import ingest
+import merge_quality_availability as merge
+import prepare
+import compact_schema
+from feature_store import FeatureStore
+
+METRICS_PATH = Path('data/watch_metrics.json')
+
+# Availability que se conserva en memoria como contexto del merge asof
+AVAIL_WINDOW = pd.Timedelta('10min')
+
+
+class FileTail:
+    """
+    Offset leído de un CSV del PLC y observación de su tamaño para el debounce.
+    """
+    def __init__(self, path: str, prefix: str):
+        self.path = path
+        self.prefix = prefix
+        self.offset = 0
+        self.header: Optional[bytes] = None
+        self.size: Optional[int] = None
+        self.changed_at: Optional[float] = None     # última vez que se vio cambiar el tamaño
+        self.pending_since: Optional[float] = None  # primera vez que se vieron bytes sin leer
+        self.landed: Optional[float] = None         # mtime de esos bytes (llegada a la carpeta)
+
+    def observe(self, size: int, mtime_ns: int, now: float):
+        if size < self.offset:
+            # Archivo reescrito: se relee completo (el high-water mark descarta lo ya mergeado)
+            print(f"[WATCH] {os.path.basename(self.path)} se achicó, se relee desde el inicio")
+            self.offset, self.header = 0, None
+        if size != self.size:
+            self.size, self.changed_at = size, now
+        if size > self.offset and self.pending_since is None:
+            self.pending_since = now
+            self.landed = min(mtime_ns / 1e9, now)
+
+    def ready(self, now: float, debounce: float, max_wait: float) -> bool:
+        if self.pending_since is None or self.changed_at is None:
+            return False
+        return now - self.changed_at >= debounce or now - self.pending_since >= max_wait
+
+    def read_new(self) -> tuple:
+        """
+        (bytes CSV con encabezado de las líneas nuevas completas, nuevo offset, ¿trae filas?).
+        """
+        with open(self.path, 'rb') as f:
+            header = self.header if self.header is not None else f.readline()
+            # Hasta el tamaño observado en el sondeo (sin observar aún, el actual)
+            size = self.size if self.size is not None else os.fstat(f.fileno()).st_size
+            f.seek(self.offset)
+            data = f.read(size - self.offset)
+        self.header = header
+        data = data[:data.rfind(b'\n') + 1]
+        offset = self.offset + len(data)
+        if self.offset > 0:
+            data = header + data
+        return data, offset, len(data) > len(header)
+
+
+class Watcher:
+    def __init__(self, share: Optional[str] = None, service=None, lines: Optional[list] = None,
+                 hours: Optional[int] = None, metrics_path: Path = METRICS_PATH, paused=None):
+        cfg = merge.configure()
+        self.share = share or ingest.server_dir()
+        self.service = service
+        self.lines = lines or cfg.get('lines', [cfg['line']])
+        self.hours = hours or cfg['horizon_hours']
+        self.poll_seconds = cfg.get('watch_poll_seconds', 2)
+        self.debounce = cfg.get('watch_debounce_seconds', 3)
+        self.max_wait = cfg.get('watch_max_wait_seconds', 15)
+        self.holdback = cfg.get('watch_holdback_seconds', 30)
+        self.store = FeatureStore(prepare.FINAL_DIR, cfg['lags'], cfg['roll_windows'])
+        self.metrics_path = Path(metrics_path)
+        self.paused = paused or (lambda: False)
+
+        self.tails: dict = {}
+        self.started = time.time()
+        self.merged_created = datalake.load_manifest(datalake.MERGED_LAKE).get('created')
+        self.high_water = merge.load_state()
+        self.avail: Optional[pd.DataFrame] = None  # availability reciente (device_id como texto)
+        self.avail_hw: dict = {}                   # último `_time` de availability por dispositivo
+        self.held: Optional[pd.DataFrame] = None   # calidad retenida a la espera de su availability
+        self.latencies: deque = deque(maxlen=200)
+        self.batches = 0
+        self.rows = 0
+        self.last: Optional[dict] = None
+
+    def _check_rewrite(self):
+        # Un merge completo reescribió merged: se relee todo contra su high-water mark
+        created = datalake.load_manifest(datalake.MERGED_LAKE).get('created')
+        if created != self.merged_created:
+            print("[WATCH] El dataset merged se reescribió; se releen los archivos desde el inicio")
+            for tail in self.tails.values():
+                tail.offset, tail.header, tail.pending_since = 0, None, None
+                tail.size = None
+            self.high_water = merge.load_state()
+            self.avail, self.avail_hw, self.held = None, {}, None
+            self.merged_created = created
+
+    # -----------------------------------
+    # Sondeo
+    # -----------------------------------
+    def scan(self, now: float):
+        """
+        Un listado de la carpeta: agrega el CSV más reciente de cada prefijo y observa
+        tamaño/mtime de los archivos seguidos.
+        """
+        latest = ingest.scan_share(self.share)
+        for prefix, (path, _, _) in latest.items():
+            if path not in self.tails:
+                self.tails[path] = FileTail(path, prefix)
+        current = {path: (size, mtime_ns) for path, size, mtime_ns in latest.values()}
+        for path, tail in list(self.tails.items()):
+            if path not in current:
+                # Archivo rotado: se sigue hasta leer sus últimos bytes
+                try:
+                    st = os.stat(path)
+                except FileNotFoundError:
+                    st = None
+                if st is None or (st.st_size <= tail.offset and tail.pending_since is None):
+                    del self.tails[path]
+                    continue
+                current[path] = (st.st_size, st.st_mtime_ns)
+            tail.observe(*current[path], now)
+
+    # -----------------------------------
+    # Micro-batch
+    # -----------------------------------
+    def _parse(self, data: bytes, usecols: list, dtypes: dict) -> pd.DataFrame:
+        chunks = list(merge.iter_csv(io.BytesIO(data), usecols, dtypes))
+        return pd.concat(chunks, ignore_index=True) if chunks else pd.DataFrame(columns=usecols)
+
+    def _add_availability(self, d: pd.DataFrame):
+        d = merge.after_high_water(merge.clean_availability(d), self.high_water, margin=merge.OVERLAP)
+        d = d.astype({'device_id': object})
+        self.avail = d if self.avail is None else pd.concat([self.avail, d], ignore_index=True)
+        for dev, ts in d.groupby('device_id')['_time'].max().items():
+            self.avail_hw[dev] = max(ts, self.avail_hw.get(dev, ts))
+
+    def _ready_quality(self, q: pd.DataFrame, now: float, landed: float) -> pd.DataFrame:
+        """
+        Agrega las filas nuevas a las retenidas y devuelve las que ya se pueden mergear:
+        su dispositivo tiene availability hasta su `_time`, o llevan `watch_holdback_seconds` esperando.
+        """
+        held = [] if self.held is None else [self.held]
+        if q is not None:
+            q = merge.after_high_water(merge.clean_quality(q), self.high_water)
+            held.append(q.astype({c: object for c in compact_schema.CATEGORY_COLS}).assign(_seen=now, _landed=landed))
+        if not held:
+            return pd.DataFrame()
+        held = pd.concat(held, ignore_index=True)
+        limit = held['device_id'].map(self.avail_hw)
+        ready = ((limit.notna() & (held['_time'] <= limit)) | (now - held['_seen'] >= self.holdback)).to_numpy()
+        self.held = held[~ready].reset_index(drop=True)
+        return held[ready].drop(columns='_seen')  # `_landed` se usa para la frescura
+
+    def _trim_availability(self):
+        # Contexto para el merge asof: la ventana reciente y lo que cubre a la calidad retenida
+        if self.avail is None:
+            return
+        cutoff = self.avail['_time'].max() - AVAIL_WINDOW
+        if not self.held.empty:
+            cutoff = min(cutoff, self.held['_time'].min() - merge.OVERLAP)
+        self.avail = self.avail[self.avail['_time'] >= cutoff].reset_index(drop=True)
+
+    def _merge(self, q: pd.DataFrame) -> pd.DataFrame:
+        """
+        Merge asof de las filas listas contra la availability en memoria; append a merged.
+        """
+        if self.avail is None:
+            d = merge.clean_availability(pd.DataFrame(columns=merge.DISP_COLS))
+            d = d.astype({'_time': q['_time'].dtype, 'device_id': 'category'})
+        else:
+            d = self.avail.astype({'device_id': 'category'}).sort_values('_time')
+        # Mismo lock que merge_quality_availability.py: un merge del DAG no se intercala con éste, y lo
+        # que el DAG haya mergeado mientras tanto (high-water marks del manifest) se descarta
+        with datalake.locked(datalake.MERGED_LAKE):
+            for dev, ts in merge.load_state().items():
+                self.high_water[dev] = max(ts, self.high_water.get(dev, ts))
+            q = merge.after_high_water(q, self.high_water)
+            if q.empty:
+                return q
+            merged = merge.merge_frames(q.astype({c: 'category' for c in compact_schema.CATEGORY_COLS}), d, merge.SCHEMA)
+            meta: Optional[dict] = None
+            if not datalake.exists(datalake.MERGED_LAKE):
+                meta = {'schema': merge.SCHEMA, 'stop_groups': merge.STOP_GROUPS}
+            elif datalake.dataset_meta(datalake.MERGED_LAKE).get('schema', 'wide') != merge.SCHEMA:
+                raise ValueError(f"El dataset {datalake.MERGED_LAKE} no usa el esquema '{merge.SCHEMA}'; ejecuta un merge completo")
+            for dev, ts in merged.groupby('device_id', observed=True)['_time'].max().items():
+                self.high_water[dev] = max(ts, self.high_water.get(dev, ts))
+            with datalake.DatasetWriter(datalake.MERGED_LAKE, mode='append', meta=meta) as writer:
+                writer.write(merged)
+                writer.update_meta(high_water=merge.encode_state(self.high_water))
+        return merged
+
+    def process(self, tails: list, now: float) -> Optional[dict]:
+        """
+        Lee los bytes nuevos de `tails`, mergea, agrega features y refresca pronósticos.
+        """
+        t0 = time.time()
+        # Lo que ya estaba en la carpeta al arrancar cuenta desde el arranque
+        landed = max(min((t.landed for t in tails), default=now), self.started)
+        parsed: dict = {}
+        for tail in tails:
+            data, tail.offset, has_rows = tail.read_new()
+            # Una línea incompleta al final queda pendiente para el próximo sondeo
+            tail.pending_since = now if tail.size is not None and tail.size > tail.offset else None
+            if has_rows:
+                cols, dtypes = ((merge.CALIDAD_COLS, merge.CALIDAD_DTYPES) if tail.prefix == merge.CALIDAD_PREFIX
+                                else (merge.DISP_COLS, merge.DISP_DTYPES))
+                parsed.setdefault(tail.prefix, []).append(self._parse(data, cols, dtypes))
+
+        for d in parsed.get(merge.DISP_PREFIX, []):
+            self._add_availability(d)
+        quality = parsed.get(merge.CALIDAD_PREFIX)
+        q = self._ready_quality(pd.concat(quality, ignore_index=True) if quality else None, now, landed)
+        if q.empty:
+            return None
+        landed = q.pop('_landed').min()
+
+        merged = self._merge(q)
+        self._trim_availability()
+        if merged.empty:
+            return None
+        t_merge = time.time()
+        self.store.update(prepare.load_merged)
+        t_features = time.time()
+        lines = sorted(set(merged['linea'].astype(str)) & set(self.lines))
+        if self.service is not None and lines:
+            self.service.forecast_batch(lines, [self.hours])
+        done = time.time()
+
+        batch = {
+            'finished': datetime.datetime.now().isoformat(),
+            'rows': len(merged),
+            'lines': lines,
+            'data_until': merged['_time'].max().isoformat(),
+            'wait_seconds': round(t0 - landed, 3),
+            'merge_seconds': round(t_merge - t0, 3),
+            'features_seconds': round(t_features - t_merge, 3),
+            'forecast_seconds': round(done - t_features, 3),
+            'freshness_seconds': round(done - landed, 3),
+        }
+        self.batches += 1
+        self.rows += len(merged)
+        self.latencies.append(batch['freshness_seconds'])
+        self.last = batch
+        self._save_metrics()
+        print(f"[WATCH] {len(merged)} filas nuevas ({', '.join(lines) or 'sin líneas configuradas'}) hasta "
+              f"{batch['data_until']}; pronóstico al día {batch['freshness_seconds']:.1f} s después de llegar")
+        return batch
+
+    def step(self, force: bool = False) -> Optional[dict]:
+        """
+        Un sondeo; procesa los archivos listos (todos los pendientes con `force`).
+        """
+        now = time.time()
+        self._check_rewrite()
+        self.scan(now)
+        if self.paused():
+            return None
+        pending = [t for t in self.tails.values() if t.pending_since is not None]
+        held = self.held if self.held is not None and not self.held.empty else None
+        if not (force or any(t.ready(now, self.debounce, self.max_wait) for t in pending)):
+            # Sin archivos listos sólo se revisa si venció la retención de la calidad pendiente
+            if held is None or now - held['_seen'].min() < self.holdback:
+                return None
+            pending = []
+        elif not pending and held is None:
+            return None
+        # Calidad y disponibilidad llegan juntas: si una está lista se procesan todas las pendientes
+        return self.process(pending, now)
+
+    def run(self, stop: Optional[threading.Event] = None):
+        stop = stop or threading.Event()
+        print(f"[WATCH] Vigilando {self.share} cada {self.poll_seconds} s (debounce {self.debounce} s)")
+        while not stop.is_set():
+            try:
+                self.step()
+            except Exception as e:
+                print(f"[WATCH] Error procesando micro-batch: {e}")
+            stop.wait(self.poll_seconds)
+
+    # -----------------------------------
+    # Métricas
+    # -----------------------------------
+    def metrics(self) -> dict:
+        lat = sorted(self.latencies)
+        pct = lambda q: lat[min(len(lat) - 1, int(q * len(lat)))] if lat else None
+        return {
+            'batches': self.batches,
+            'rows': self.rows,
+            'freshness_p50_seconds': pct(0.5),
+            'freshness_p95_seconds': pct(0.95),
+            'freshness_max_seconds': lat[-1] if lat else None,
+            'held_rows': 0 if self.held is None else len(self.held),
+            'last_batch': self.last,
+        }
+
+    def _save_metrics(self):
+        self.metrics_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.metrics_path.with_suffix('.tmp')
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(self.metrics(), f, indent=2)
+        tmp.replace(self.metrics_path)
+
+# -----------------------------------
+# Main
+# -----------------------------------
+def main(argv=None):
+    cfg = get_pipeline_config()
+    parser = argparse.ArgumentParser(description="Merge, features y pronóstico por micro-batches al llegar CSV nuevos.")
+    parser.add_argument('--share', help='Carpeta vigilada (por defecto PLC_SHARE_DIR o plc_share_dir de config.yaml)')
+    parser.add_argument('--lines', type=str, nargs='+', default=cfg.get('lines', [cfg['line']]))
+    parser.add_argument('--hours', type=int, default=cfg['horizon_hours'])
+    parser.add_argument('--once', action='store_true', help='Procesa lo pendiente una vez y termina')
+    parser.add_argument('--no-forecast', action='store_true', help='Sólo merge y features')
+    args = parser.parse_args(argv)
+
+    service = None
+    if not args.no_forecast:
+        from model_server import ForecastService
+        service = ForecastService(Path.cwd(), cfg['lags'], cfg['roll_windows'])
+    prepare.FINAL_DIR.mkdir(parents=True, exist_ok=True)
+    watcher = Watcher(args.share, service=service, lines=args.lines, hours=args.hours)
+    if args.once:
+        if watcher.step(force=True) is None:
+            print("[WATCH] Sin filas nuevas para mergear")
+        return watcher.metrics()
+    try:
+        watcher.run()
+    except KeyboardInterrupt:
+        print("[WATCH] Detenido")
+
+if __name__ == '__main__':
+    main()